@@ -0,0 +1,172 @@
+"""api_pool.py
+
+Spread the read api calls over every read credential in config.ini.
+
+Each credential has its own Api client and RateLimitBudget. A call goes
+to the healthy credential with the most calls left for the endpoint, so
+the number of users that can be scanned grows with the number of
+credentials. A credential that Twitter reports as invalid or expired (89)
+or unable to authenticate (32) is taken out of rotation, one reported as
+temporarily locked (326) is left unused for READ_CREDENTIAL_COOLDOWN
+seconds.
+"""
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, List, Optional
+
+from twitter import TwitterError
+
+from config import API_URLS, READ_API_CREDENTIALS, READ_CREDENTIAL_COOLDOWN
+from _logger import get_module_logger
+from metrics import InstrumentedApi, get_error_code
+from rate_limits import RateLimitBudget, TwitterRateLimitException
+
+LOGGER = get_module_logger(__name__)
+# 32: could not authenticate, 89: invalid or expired token
+REVOKED_CREDENTIAL_ERROR_CODES = (32, 89)
+# 326: account temporarily locked
+LOCKED_CREDENTIAL_ERROR_CODES = (326,)
+# 88: rate limit exceeded
+RATE_LIMIT_ERROR_CODE = 88
+
+
+class ReadClient:
+    """Api client of a read credential and its rate limit budget"""
+
+    def __init__(self, name: str, api: InstrumentedApi):
+        self.name = name
+        self.api = api
+        self.rate_limits = RateLimitBudget(api=api)
+        # time before which the credential is not used, inf once revoked
+        self.unhealthy_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.time() >= self.unhealthy_until
+
+    def __repr__(self) -> str:
+        return f"ReadClient({self.name})"
+
+
+class ReadApiPool:
+    """Api clients of the read credentials"""
+
+    def __init__(
+        self, clients: List[ReadClient], cooldown: float = READ_CREDENTIAL_COOLDOWN
+    ):
+        self.clients = clients
+        self.cooldown = cooldown
+        self._lock = Lock()
+
+    @classmethod
+    def from_credentials(cls, credentials: Dict[str, Dict[str, str]]) -> "ReadApiPool":
+        return cls(
+            clients=[
+                ReadClient(
+                    name=name,
+                    api=InstrumentedApi(client_name=name, **api_keys, **API_URLS),
+                )
+                for name, api_keys in credentials.items()
+            ]
+        )
+
+    @property
+    def healthy_clients(self) -> List[ReadClient]:
+        return [client for client in self.clients if client.healthy]
+
+    def acquire(
+        self, endpoint: str, client_name: Optional[str] = None
+    ) -> Optional[ReadClient]:
+        """Reserve a call to endpoint on the client with the most calls left
+
+        The call is to be released with client.rate_limits.release once it
+        is made, api() does both.
+
+        Args:
+            endpoint: endpoint of the call, e.g. '/statuses/user_timeline'
+            client_name: only consider the client of this credential
+
+        Returns:
+            The client to make the call with, None if no client has budget
+        """
+        clients = sorted(
+            (
+                client
+                for client in self.healthy_clients
+                if client_name is None or client.name == client_name
+            ),
+            key=lambda client: client.rate_limits.remaining(endpoint),
+            reverse=True,
+        )
+        for client in clients:
+            if client.rate_limits.acquire(endpoint=endpoint):
+                return client
+        if not clients:
+            LOGGER.critical("No healthy read credential left")
+        return None
+
+    def available_at(self, endpoint: str, client_name: Optional[str] = None) -> float:
+        """Return when a healthy client will have budget for endpoint"""
+        now = time.time()
+        return min(
+            (
+                now
+                if client.rate_limits.remaining(endpoint, now=now) >= 1
+                else client.rate_limits.reset_at(endpoint)
+                for client in self.healthy_clients
+                if client_name is None or client.name == client_name
+            ),
+            default=0,
+        )
+
+    def report_error(self, client: ReadClient, error: TwitterError):
+        """Take the client out of rotation if its credential is revoked, or
+        for cooldown seconds if it is temporarily locked"""
+        error_code = get_error_code(error)
+        if error_code in REVOKED_CREDENTIAL_ERROR_CODES:
+            with self._lock:
+                client.unhealthy_until = float("inf")
+            LOGGER.critical(
+                f"Read credential {client.name} taken out of rotation, "
+                f"{len(self.healthy_clients)} left. {error}"
+            )
+        elif error_code in LOCKED_CREDENTIAL_ERROR_CODES:
+            with self._lock:
+                client.unhealthy_until = time.time() + self.cooldown
+            LOGGER.error(
+                f"Read credential {client.name} locked, left unused for "
+                f"{self.cooldown} seconds, {len(self.healthy_clients)} left. {error}"
+            )
+
+    @contextmanager
+    def api(
+        self, endpoint: str, client_name: Optional[str] = None
+    ) -> Iterator[InstrumentedApi]:
+        """Api client to make one call to endpoint with
+
+        With client_name the call is made with that credential, e.g. for
+        the private lists only the account that owns them can read.
+
+        Raises:
+            TwitterRateLimitException: no client has budget left
+        """
+        client = self.acquire(endpoint=endpoint, client_name=client_name)
+        if client is None:
+            raise TwitterRateLimitException(
+                f"Rate limit budget of {endpoint} used up on "
+                f"{client_name or 'every read credential'}",
+                reset_at=self.available_at(endpoint, client_name=client_name),
+            )
+        try:
+            yield client.api
+        except TwitterError as error:
+            if get_error_code(error) == RATE_LIMIT_ERROR_CODE:
+                client.rate_limits.exhaust(endpoint=endpoint)
+            self.report_error(client=client, error=error)
+            raise
+        finally:
+            client.rate_limits.release(endpoint=endpoint)
+
+
+READ_API_POOL = ReadApiPool.from_credentials(credentials=READ_API_CREDENTIALS)
@@ -0,0 +1,242 @@
+"""browser_pool.py
+
+Keep headless browsers warm between screenshots so that a run (or a
+long lived process) does not pay the Chromium and chromedriver start up
+cost every time a user has quoted tweets to collect.
+"""
+import atexit
+import os
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from queue import Empty, Queue
+from subprocess import Popen
+from threading import BoundedSemaphore
+from typing import Iterable, Iterator, Optional, Set
+
+from config import (
+    BROWSER_MAX_CAPTURES,
+    BROWSER_MAX_MEMORY_MB,
+    BROWSER_POOL_SIZE,
+    CHROME_DRIVER_PATH,
+)
+from _logger import get_module_logger
+from tweet_capture import TweetCapture
+
+LOGGER = get_module_logger(__name__)
+SCREENSHOT_DIR = Path(__file__).parent
+PROC_PATH = Path("/proc")
+# Captures between two checks of the memory of a browser
+MEMORY_CHECK_INTERVAL = 10
+
+
+class PooledBrowser:
+    """A started TweetCapture instance and its usage statistics"""
+
+    def __init__(self, tweet_capture: TweetCapture):
+        self.tweet_capture = tweet_capture
+        self.capture_count = 0
+        self.healthy = True
+
+    @property
+    def driver_process(self) -> Optional[Popen]:
+        """The chromedriver process of the selenium driver of the browser"""
+        driver = getattr(self.tweet_capture, "driver", None)
+        return getattr(getattr(driver, "service", None), "process", None)
+
+    def is_alive(self) -> bool:
+        """Return False if chromedriver or the browser session is gone"""
+        driver = getattr(self.tweet_capture, "driver", None)
+        if driver is None:
+            return True
+        driver_process = self.driver_process
+        if driver_process is not None and driver_process.poll() is not None:
+            return False
+        try:
+            # a round trip through chromedriver to the browser
+            driver.current_url
+        except Exception:
+            return False
+        return True
+
+    def memory_mb(self) -> int:
+        """Resident memory (MB) of chromedriver and the browser it started
+
+        Without a chromedriver process, every process started by this
+        process is counted.
+        """
+        driver_process = self.driver_process
+        if driver_process is None:
+            return get_processes_memory_mb(get_descendant_pids(os.getpid()))
+        return get_processes_memory_mb(
+            get_descendant_pids(driver_process.pid) | {driver_process.pid}
+        )
+
+    def screen_capture_tweet(self, url: str) -> str:
+        """Screen capture url, a failed capture marks the browser unhealthy"""
+        try:
+            screenshot_file_path = self.tweet_capture.screen_capture_tweet(url=url)
+        except Exception:
+            self.healthy = False
+            raise
+        self.capture_count += 1
+        return screenshot_file_path
+
+
+class BrowserPool:
+    """Hand out warm browsers and recycle them when they are worn out
+
+    A browser is closed instead of being returned to the pool when its
+    last capture failed, when it reached max_captures, or when its
+    processes use more than max_memory_mb (checked every
+    memory_check_interval captures). An idle browser that died is
+    replaced when it is handed out.
+    """
+
+    def __init__(
+        self,
+        size: int = BROWSER_POOL_SIZE,
+        max_captures: int = BROWSER_MAX_CAPTURES,
+        max_memory_mb: int = BROWSER_MAX_MEMORY_MB,
+        screenshot_dir: Path = SCREENSHOT_DIR,
+        memory_check_interval: int = MEMORY_CHECK_INTERVAL,
+    ):
+        self.size = size
+        self.max_captures = max_captures
+        self.max_memory_mb = max_memory_mb
+        self.memory_check_interval = memory_check_interval
+        self.screenshot_dir = screenshot_dir
+        self._idle: Queue = Queue()
+        self._slots = BoundedSemaphore(size)
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _start_browser(self) -> PooledBrowser:
+        LOGGER.info("Starting a new headless browser")
+        tweet_capture = TweetCapture(
+            chrome_driver_path=CHROME_DRIVER_PATH,
+            screenshot_dir=self.screenshot_dir,
+            headless=True,
+        )
+        return PooledBrowser(tweet_capture=tweet_capture.__enter__())
+
+    def _stop_browser(self, browser: PooledBrowser):
+        LOGGER.info(f"Stopping browser after {browser.capture_count} captures")
+        try:
+            browser.tweet_capture.__exit__(None, None, None)
+        except Exception:
+            LOGGER.exception("Unable to cleanly stop browser")
+
+    def _is_worn_out(self, browser: PooledBrowser) -> bool:
+        if not browser.healthy:
+            LOGGER.info("Recycling browser: last capture failed")
+            return True
+        if self.max_captures and browser.capture_count >= self.max_captures:
+            LOGGER.info(f"Recycling browser: {browser.capture_count} captures")
+            return True
+        if (
+            self.max_memory_mb
+            and browser.capture_count % self.memory_check_interval == 0
+        ):
+            memory_mb = browser.memory_mb()
+            if memory_mb > self.max_memory_mb:
+                LOGGER.info(f"Recycling browser: browser is using {memory_mb} MB")
+                return True
+        return False
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledBrowser:
+        """Return an idle browser that is alive, starting one if none are idle"""
+        if self._closed:
+            raise RuntimeError("Browser pool has been closed")
+        if not self._slots.acquire(timeout=-1 if timeout is None else timeout):
+            raise TimeoutError(f"No browser available after {timeout} seconds")
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except Empty:
+                break
+            if browser.is_alive():
+                return browser
+            LOGGER.info("Replacing a browser that died while idle")
+            self._stop_browser(browser)
+        try:
+            return self._start_browser()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, browser: PooledBrowser):
+        """Return browser to the pool or stop it if it is worn out"""
+        try:
+            if self._closed or self._is_worn_out(browser):
+                self._stop_browser(browser)
+            else:
+                self._idle.put(browser)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def browser(self, timeout: Optional[float] = None) -> Iterator[PooledBrowser]:
+        """Borrow a browser for the duration of the with block"""
+        pooled_browser = self.acquire(timeout=timeout)
+        try:
+            yield pooled_browser
+        finally:
+            self.release(pooled_browser)
+
+    def close(self):
+        """Stop every idle browser, browsers in use stop when released"""
+        self._closed = True
+        while True:
+            try:
+                self._stop_browser(self._idle.get_nowait())
+            except Empty:
+                break
+
+
+def get_descendant_pids(pid: int) -> Set[int]:
+    """Return the ids of every process started (directly or not) by pid
+
+    Only available where /proc exists, returns an empty set elsewhere.
+    """
+    if not PROC_PATH.exists():
+        return set()
+    children = defaultdict(list)
+    for stat_file in PROC_PATH.glob("[0-9]*/stat"):
+        try:
+            stat = stat_file.read_text()
+        except OSError:
+            continue
+        # The process name is in parentheses and may contain spaces
+        fields = stat[stat.rindex(")") + 2 :].split()
+        children[int(fields[1])].append(int(stat_file.parent.name))
+
+    descendants = set()
+    to_visit = [pid]
+    while to_visit:
+        parent_children = children[to_visit.pop()]
+        descendants.update(parent_children)
+        to_visit.extend(parent_children)
+    return descendants
+
+
+def get_processes_memory_mb(pids: Iterable[int]) -> int:
+    """Resident memory (MB) of the processes pids"""
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    resident_bytes = 0
+    for pid in pids:
+        try:
+            resident_pages = PROC_PATH.joinpath(str(pid), "statm").read_text().split()
+        except OSError:
+            continue
+        resident_bytes += int(resident_pages[1]) * page_size
+    return resident_bytes // (1024 * 1024)
+
+
+BROWSER_POOL = BrowserPool()
+atexit.register(BROWSER_POOL.close)
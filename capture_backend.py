@@ -0,0 +1,201 @@
+"""capture_backend.py
+
+Backends that screen capture the quoted tweets of collected tweets:
+
+    * browser - a warm browser of this process (BROWSER_POOL)
+    * farm    - CAPTURE_WORKERS worker processes, each with its own browser
+    * fake    - writes a placeholder image after FAKE_CAPTURE_DELAY seconds,
+                for load tests without a browser
+
+The backend selected by CAPTURE_BACKEND is built by the first call to
+get_capture_backend, and the browser and farm backends are only imported
+then, so importing this module (or the modules that capture with it)
+does not need Chromium or selenium, and the fake backend runs where they
+are not installed.
+"""
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from abc import ABC, abstractmethod
+from itertools import count
+from pathlib import Path, PosixPath
+from threading import Lock
+from typing import List, Optional, Union
+
+from config import (
+    CAPTURE_BACKEND_NAME,
+    CAPTURE_WORKERS,
+    FAKE_CAPTURE_DELAY,
+    FAKE_CAPTURE_FAILURE_RATE,
+)
+from _logger import get_module_logger
+from twitter_helpers import add_screenshot_to_tweet
+from wrapped_tweet import Tweet
+
+LOGGER = get_module_logger(__name__)
+# 1x1 transparent PNG
+PLACEHOLDER_IMAGE = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc3300000000"
+    "49454e44ae426082"
+)
+
+
+class CaptureBackend(ABC):
+    """Screen capture the quoted tweets of tweets"""
+
+    @abstractmethod
+    def capture_tweets(self, quoted_tweets: List[Tweet]) -> List[Tweet]:
+        """Screen capture the quoted tweet of each tweet
+
+        Returns:
+            The tweets that have a screenshot, tweets whose capture failed
+            are left out.
+        """
+
+    def close(self):
+        """Release the browsers or workers held by the backend"""
+
+
+class BrowserCaptureBackend(CaptureBackend):
+    """Screen capture with the warm browsers of a browser pool"""
+
+    def __init__(self, browser_pool):
+        self.browser_pool = browser_pool
+
+    def capture_tweets(self, quoted_tweets: List[Tweet]) -> List[Tweet]:
+        captured_tweets = []
+        for tweet in quoted_tweets:
+            # a browser whose capture failed is recycled by the pool on release
+            with self.browser_pool.browser() as tweet_capture:
+                try:
+                    screenshot_file_path = tweet_capture.screen_capture_tweet(
+                        url=tweet.quoted_tweet_url
+                    )
+                except Exception as e:
+                    LOGGER.error(
+                        f"Unable to capture {tweet.quoted_tweet_url} "
+                        f"for Tweet({tweet.id}). {e}"
+                    )
+                    continue
+            add_screenshot_to_tweet(
+                tweet=tweet, screen_shot_file_path=screenshot_file_path
+            )
+            captured_tweets.append(tweet)
+        return captured_tweets
+
+    def close(self):
+        self.browser_pool.close()
+
+
+class FakeCaptureBackend(CaptureBackend):
+    """Write a placeholder image instead of a screenshot
+
+    Up to workers captures run at the same time, like the capture farm,
+    each takes delay seconds and fails with a probability of failure_rate.
+    """
+
+    def __init__(
+        self,
+        workers: int = CAPTURE_WORKERS,
+        delay: float = FAKE_CAPTURE_DELAY,
+        failure_rate: float = FAKE_CAPTURE_FAILURE_RATE,
+        screenshot_dir: Optional[Union[PosixPath, str]] = None,
+        seed: Optional[int] = None,
+    ):
+        self.workers = workers
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.screenshot_dir = Path(
+            screenshot_dir or Path(tempfile.gettempdir(), "chronicler_fake_captures")
+        )
+        self.random = random.Random(seed)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="fake-capture"
+        )
+        self._lock = Lock()
+        self._file_numbers = count(1)
+        # captures submitted and not finished yet
+        self.pending = 0
+        self.captured = 0
+        self.failed = 0
+
+    def _capture_url(self, url: str) -> str:
+        try:
+            time.sleep(self.delay)
+            with self._lock:
+                failed = self.random.random() < self.failure_rate
+                file_number = next(self._file_numbers)
+            if failed:
+                raise RuntimeError(f"Fake capture of {url} failed")
+            self.screenshot_dir.mkdir(parents=True, exist_ok=True)
+            screenshot_file = self.screenshot_dir.joinpath(f"capture_{file_number}.png")
+            screenshot_file.write_bytes(PLACEHOLDER_IMAGE)
+            return str(screenshot_file)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def capture_tweets(self, quoted_tweets: List[Tweet]) -> List[Tweet]:
+        with self._lock:
+            self.pending += len(quoted_tweets)
+        jobs = [
+            (self._executor.submit(self._capture_url, tweet.quoted_tweet_url), tweet)
+            for tweet in quoted_tweets
+        ]
+        captured_tweets = []
+        for job, tweet in jobs:
+            if job.exception():
+                LOGGER.error(
+                    f"Unable to capture {tweet.quoted_tweet_url} "
+                    f"for Tweet({tweet.id}). {job.exception()}"
+                )
+                with self._lock:
+                    self.failed += 1
+                continue
+            add_screenshot_to_tweet(tweet=tweet, screen_shot_file_path=job.result())
+            captured_tweets.append(tweet)
+            with self._lock:
+                self.captured += 1
+        return captured_tweets
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def build_capture_backend(name: str = CAPTURE_BACKEND_NAME) -> CaptureBackend:
+    """Return the capture backend called name"""
+    if name == "fake":
+        return FakeCaptureBackend()
+    elif name == "farm":
+        from capture_farm import CAPTURE_FARM
+
+        return CAPTURE_FARM
+    elif name == "browser":
+        from browser_pool import BROWSER_POOL
+
+        return BrowserCaptureBackend(browser_pool=BROWSER_POOL)
+    raise ValueError(f"Unknown capture backend: {name}")
+
+
+_CAPTURE_BACKEND: Optional[CaptureBackend] = None
+_CAPTURE_BACKEND_LOCK = Lock()
+
+
+def get_capture_backend() -> CaptureBackend:
+    """Return the CAPTURE_BACKEND backend, built on the first call"""
+    global _CAPTURE_BACKEND
+    with _CAPTURE_BACKEND_LOCK:
+        if _CAPTURE_BACKEND is None:
+            _CAPTURE_BACKEND = build_capture_backend()
+        return _CAPTURE_BACKEND
+
+
+def close_capture_backend():
+    """Close the capture backend, if it was built"""
+    global _CAPTURE_BACKEND
+    with _CAPTURE_BACKEND_LOCK:
+        capture_backend, _CAPTURE_BACKEND = _CAPTURE_BACKEND, None
+    if capture_backend:
+        capture_backend.close()
@@ -0,0 +1,195 @@
+"""capture_farm.py
+
+Spread screenshot jobs across worker processes, each worker process
+keeps its own warm headless browser. A page that hangs only holds up
+its own worker and is abandoned once its timeout is up.
+
+Scan threads submit their jobs to the farm at the same time. A job is
+only submitted when a worker is free, so its timeout starts when it
+starts running.
+"""
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.util import Finalize
+from threading import BoundedSemaphore, Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from browser_pool import BrowserPool, get_descendant_pids
+from capture_backend import CaptureBackend
+from config import CAPTURE_JOB_TIMEOUT, CAPTURE_WORKERS
+from _logger import get_module_logger
+from twitter_helpers import add_screenshot_to_tweet
+from wrapped_tweet import Tweet
+
+LOGGER = get_module_logger(__name__)
+
+# Browser pool of the current worker process
+_WORKER_BROWSER_POOL: Optional[BrowserPool] = None
+
+
+def _start_worker(worker_pids: multiprocessing.SimpleQueue):
+    """Report the pid of the worker process to the farm, and give the
+    worker its own single browser pool"""
+    global _WORKER_BROWSER_POOL
+    worker_pids.put(os.getpid())
+    _WORKER_BROWSER_POOL = BrowserPool(size=1)
+    # Worker processes do not run atexit handlers
+    Finalize(_WORKER_BROWSER_POOL, _WORKER_BROWSER_POOL.close, exitpriority=10)
+
+
+def _capture_url(url: str) -> str:
+    """Screen capture url with the browser of this worker process"""
+    with _WORKER_BROWSER_POOL.browser() as browser:
+        return browser.screen_capture_tweet(url=url)
+
+
+class CaptureFarm(CaptureBackend):
+    """Screen capture quoted tweets with a pool of worker processes"""
+
+    def __init__(
+        self,
+        workers: int = CAPTURE_WORKERS,
+        job_timeout: int = CAPTURE_JOB_TIMEOUT,
+        capture_url: Callable[[str], str] = _capture_url,
+    ):
+        """
+        Args:
+            capture_url: run in a worker process, returns the screenshot
+                file path of a url (a module level function)
+        """
+        self.workers = workers
+        self.job_timeout = job_timeout
+        self.capture_url = capture_url
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Pids of the worker processes of the executor, put by each worker
+        self._worker_pids: Optional[multiprocessing.SimpleQueue] = None
+        # Guards the executor, jobs of every thread run at the same time
+        self._lock = Lock()
+        # One job per worker is submitted at a time
+        self._slots = BoundedSemaphore(workers)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if not self._executor:
+            LOGGER.info(f"Starting capture farm with {self.workers} workers")
+            self._worker_pids = multiprocessing.SimpleQueue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_start_worker,
+                initargs=(self._worker_pids,),
+            )
+        return self._executor
+
+    def _submit(self, url: str) -> Future:
+        """Submit a capture job, a free slot must have been acquired"""
+        with self._lock:
+            try:
+                job = self._get_executor().submit(self.capture_url, url)
+            except BrokenProcessPool:
+                LOGGER.info("Restarting broken capture farm")
+                self._kill_workers()
+                job = self._get_executor().submit(self.capture_url, url)
+        job.add_done_callback(lambda _: self._slots.release())
+        return job
+
+    def _kill_workers(self):
+        """Kill the worker processes of the executor and the browsers they
+        started, other child processes of this process are left alone
+
+        The jobs still running fail with BrokenProcessPool.
+        """
+        worker_pids = set()
+        if self._executor:
+            while not self._worker_pids.empty():
+                worker_pids.add(self._worker_pids.get())
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        for worker_pid in worker_pids:
+            for pid in get_descendant_pids(worker_pid) | {worker_pid}:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def capture_tweets(self, quoted_tweets: List[Tweet]) -> List[Tweet]:
+        """Screen capture the quoted tweet of each tweet
+
+        Each job is abandoned job_timeout seconds after it was submitted,
+        and the workers are then restarted to free the hung worker. A job
+        that failed because the workers were restarted (e.g. by the
+        timeout of another thread's job) is submitted again once.
+
+        Returns:
+            The tweets that have a screenshot, tweets whose capture failed
+            or timed out are left out.
+        """
+        to_submit: List[Tweet] = list(quoted_tweets)
+        resubmitted: Set[int] = set()
+        jobs: Dict[Future, Tuple[Tweet, float]] = {}
+        captured_tweets = []
+        while to_submit or jobs:
+            # Wait for a free worker only when none of our jobs is running
+            while to_submit and self._slots.acquire(blocking=not jobs):
+                tweet = to_submit.pop(0)
+                try:
+                    job = self._submit(tweet.quoted_tweet_url)
+                except Exception as error:
+                    self._slots.release()
+                    LOGGER.error(
+                        f"Unable to capture {tweet.quoted_tweet_url} "
+                        f"for Tweet({tweet.id}). {error}"
+                    )
+                    continue
+                jobs[job] = (tweet, time.monotonic() + self.job_timeout)
+            if not jobs:
+                continue
+
+            next_deadline = min(deadline for _, deadline in jobs.values())
+            done, _ = wait(
+                jobs,
+                timeout=max(next_deadline - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            for job in done:
+                tweet, _ = jobs.pop(job)
+                error = job.exception()
+                if isinstance(error, BrokenProcessPool) and tweet.id not in resubmitted:
+                    resubmitted.add(tweet.id)
+                    to_submit.append(tweet)
+                elif error:
+                    LOGGER.error(
+                        f"Unable to capture {tweet.quoted_tweet_url} "
+                        f"for Tweet({tweet.id}). {error}"
+                    )
+                else:
+                    add_screenshot_to_tweet(
+                        tweet=tweet, screen_shot_file_path=job.result()
+                    )
+                    captured_tweets.append(tweet)
+
+            now = time.monotonic()
+            timed_out = [job for job, (_, deadline) in jobs.items() if deadline <= now]
+            for job in timed_out:
+                tweet, _ = jobs.pop(job)
+                LOGGER.error(
+                    f"Timed out capturing {tweet.quoted_tweet_url} "
+                    f"for Tweet({tweet.id})"
+                )
+            if timed_out:
+                LOGGER.info("Restarting capture farm to free hung workers")
+                with self._lock:
+                    self._kill_workers()
+        return captured_tweets
+
+    def close(self):
+        """Stop the worker processes and their browsers"""
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+CAPTURE_FARM = CaptureFarm()
@@ -14,86 +14,507 @@ Note:
     I was tired of looking at tweets that quoted tweets
     where the quoted tweets had been deleted.
 """
-from pathlib import Path
-from typing import List
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from itertools import chain
+from threading import Event
+from typing import Dict, List, Optional, Tuple, Union
 
 from config import (
-    CHECKED_STATUSES_DIR_PATH,
-    CHROME_DRIVER_PATH,
-    LIST_OF_USERS_TO_FOLLOW,
+    ACTIVITY_PRECHECK,
+    INGESTION_MODE,
+    MAX_BACKFILL,
+    MAX_SCAN_WORKERS,
+    USER_LOCK_TIMEOUT,
+    USER_LOCK_TTL,
+    read_list_of_users_to_follow,
 )
-from filelock import FileLock, Timeout
+from capture_backend import get_capture_backend
 from _logger import get_module_logger
-from tweet_capture import TweetCapture
+from list_ingestion import FOLLOW_LIST
+from poll_scheduler import POLL_SCHEDULER
+from post_queue import POST_QUEUE
+from profiler import PROFILER
+from state_store import STATE_STORE
+from twitter import Status, TwitterError
 from twitter_helpers import (
-    add_screenshot_to_tweet,
-    find_quoted_tweets,
-    post_collected_tweets,
+    TwitterRateLimitException,
+    filter_quoted_tweets,
+    get_active_users,
+    get_new_tweets_for_user,
+    get_replied_to_status_ids_to_check,
+    iter_timeline_pages,
+    lookup_statuses,
 )
 from wrapped_tweet import Tweet
 
 LOGGER = get_module_logger(__name__)
-SCRIPT_TIMEOUT = 5
 
 
-def run_new_chronicler():
+class UserLockLost(Exception):
+    """The lock of a user expired while it was processed and another run
+    took it"""
+
+
+def run_chronicler(
+    users: List[str] = None, stop_event: Event = None, poll_all: bool = False
+):
+    """Scan the followed users that are due, MAX_SCAN_WORKERS users at a time
+
+    A run has four steps:
+
+        1. with INGESTION_MODE = list, read the new tweets of the members
+           of the follow list from the list timeline. For the other users,
+           look up the users in batches to skip the ones that have not
+           tweeted (ACTIVITY_PRECHECK), then lock each user and fetch the
+           user's new tweets
+        2. look up, in batches, every replied to status needed to check
+           whether a quote was already collected in the same thread
+        3. filter, collect and queue the quoted tweets of each user, then
+           backfill the tweets of the user that did not fit in a poll
+        4. post the queued tweets the posting budget allows
+
+    Args:
+        users: users to scan, defaults to the users listed in
+            list_of_users_to_follow.txt (read again on every run)
+        stop_event: once set, users that have not been fetched are skipped
+        poll_all: scan every user, due or not (e.g. to fill the gap left
+            by a disconnect of the stream)
+    """
     LOGGER.info("Start of script")
+    run_started_at = time.time()
+    users = users if users is not None else read_list_of_users_to_follow()
+    list_tweets: Dict[str, List[Union[Status, Tweet]]] = {}
+    list_since_id = None
+    if INGESTION_MODE == "list":
+        list_tweets, list_since_id, users = fetch_list_tweets(
+            users=users, stop_event=stop_event
+        )
+    if not poll_all:
+        users = POLL_SCHEDULER.users_due(users=users, now=run_started_at)
+    if ACTIVITY_PRECHECK and users:
+        users = skip_idle_users(users=users, run_started_at=run_started_at)
 
-    for user in LIST_OF_USERS_TO_FOLLOW:
-        try:
-            lock_file_name = CHECKED_STATUSES_DIR_PATH.joinpath(f"{user}.lock")
-            LOGGER.info(f"Attempting to lock file {lock_file_name}")
-            with FileLock(
-                lock_file=lock_file_name, timeout=SCRIPT_TIMEOUT,
-            ):
-                LOGGER.info(f"starting collection for user: @{user}")
-                user_quoted_retweets = find_quoted_tweets(user=user)
-                collect_and_post_tweets(user_quoted_retweets)
-                LOGGER.info(f"ending collection for user: @{user}")
-        except Timeout:
-            LOGGER.info(
-                f"Another instance of this application currently "
-                f"holds lock for this user @{user}. "
-                f"(timeout={SCRIPT_TIMEOUT})"
+    with ThreadPoolExecutor(
+        max_workers=MAX_SCAN_WORKERS, thread_name_prefix="chronicler"
+    ) as executor:
+        new_tweets: Dict[str, List[Union[Status, Tweet]]] = dict(
+            filter(
+                None,
+                executor.map(partial(fetch_user_tweets, stop_event=stop_event), users),
             )
+        )
+        new_tweets.update(list_tweets)
+        with STATE_STORE.batch():
+            for user, user_tweets in new_tweets.items():
+                if user_tweets:
+                    STATE_STORE.set_last_status_id(
+                        user=user, status_id=user_tweets[0].id_str
+                    )
+            if list_since_id:
+                FOLLOW_LIST.set_since_id(since_id=list_since_id)
+
+        try:
+            with PROFILER.stage("lookup"):
+                replied_to_statuses = lookup_statuses(
+                    status_ids=get_replied_to_status_ids_to_check(
+                        statuses=chain.from_iterable(new_tweets.values()),
+                        excluded_ids=STATE_STORE,
+                    )
+                )
+        except Exception:
+            LOGGER.exception("Unable to look up replied to statuses")
+            replied_to_statuses = {}
+
+        futures = {
+            executor.submit(
+                chronicle_user, user, user_tweets, replied_to_statuses, run_started_at,
+            ): user
+            for user, user_tweets in new_tweets.items()
+        }
+        for future in as_completed(futures):
+            user = futures[future]
+            try:
+                future.result()
+            except Exception:
+                LOGGER.exception(f"Collection failed for user: @{user}")
 
+    with PROFILER.stage("post"):
+        POST_QUEUE.post_queued()
     LOGGER.info("End of script run")
 
 
-def run_chronicler():
-    LOGGER.info("Start of script")
+def skip_idle_users(users: List[str], run_started_at: float) -> List[str]:
+    """Return the users that have tweeted since they were last checked
+
+    A user that is skipped is scheduled as if its timeline had been
+    fetched and found empty. If the users cannot be looked up, every user
+    is returned.
+    """
+    try:
+        with PROFILER.stage("precheck"):
+            active_users = get_active_users(users=users)
+    except Exception:
+        LOGGER.exception("Unable to look up the activity of users")
+        return users
+    with STATE_STORE.batch():
+        for user in set(users).difference(active_users):
+            POLL_SCHEDULER.record_poll(
+                user=user,
+                found_new_tweets=False,
+                found_quoted_tweets=False,
+                polled_at=run_started_at,
+            )
+    return active_users
+
+
+def fetch_list_tweets(
+    users: List[str], stop_event: Event = None
+) -> Tuple[Dict[str, List[Union[Status, Tweet]]], Optional[int], List[str]]:
+    """Sync the follow list with users and get the new tweets of its members
+
+    The tweets of the list timeline are split per user. Each member with
+    new tweets or backfill gaps is locked (and released by
+    chronicle_user), and the tweets at or before the member's last status
+    id, e.g. already read by another run, are left out. The tweets of a
+    member that is skipped (shutting down, or locked by another run) are
+    recorded as a backfill gap, since the list timeline moves past them.
+    If the list cannot be read, the user timelines of every user are
+    polled instead.
+
+    Returns:
+        (new tweets by locked member, id of the newest tweet of the list
+        timeline, users whose user timeline is to be polled)
+    """
+    try:
+        with PROFILER.stage("fetch"):
+            members = FOLLOW_LIST.sync(users=users)
+            tweets_by_member, newest_id = FOLLOW_LIST.get_new_tweets(
+                members=[user for user in users if user.lower() in members]
+            )
+    except Exception:
+        LOGGER.exception("Unable to read the follow list, polling user timelines")
+        return {}, None, users
+
+    new_tweets = {}
+    users_with_gaps = STATE_STORE.get_users_with_backfill_gaps()
+    for user in users:
+        member_tweets = tweets_by_member.get(user.lower(), [])
+        if not member_tweets and user not in users_with_gaps:
+            continue
+        if stop_event and stop_event.is_set():
+            LOGGER.debug(f"Shutting down, skipping user: @{user}")
+            skip_member_tweets(user=user, member_tweets=member_tweets)
+            continue
+        if not lock_user(user=user):
+            LOGGER.info(f"Another instance holds the lock for @{user}, skipping")
+            skip_member_tweets(user=user, member_tweets=member_tweets)
+            continue
+        last_status_id = STATE_STORE.get_last_status_id(user=user)
+        member_tweets = [
+            tweet
+            for tweet in member_tweets
+            if not last_status_id or tweet.id > last_status_id
+        ]
+        if member_tweets or user in users_with_gaps:
+            new_tweets[user] = member_tweets
+        else:
+            STATE_STORE.unlock_user(user=user)
+    LOGGER.info(f"{len(new_tweets)} of {len(members)} list members have new tweets")
+    return (
+        new_tweets,
+        newest_id,
+        [user for user in users if user.lower() not in members],
+    )
+
+
+def skip_member_tweets(user: str, member_tweets: List[Union[Status, Tweet]]):
+    """Record the list tweets of a skipped member as a backfill gap
+
+    The gap runs from the member's last status id (or from before its
+    oldest tweet of the list) up to its newest tweet of the list, and is
+    backfilled from the user timeline by a later run.
+    """
+    if not member_tweets:
+        return
+    last_status_id = STATE_STORE.get_last_status_id(user=user)
+    since_id = last_status_id or member_tweets[-1].id - 1
+    if member_tweets[0].id <= since_id:
+        return
+    STATE_STORE.set_backfill_gap(
+        user=user, since_id=since_id, max_id=member_tweets[0].id, fetched=0
+    )
+
+
+def lock_user(user: str, timeout: int = USER_LOCK_TIMEOUT) -> bool:
+    """Take the lock of a user, waiting up to timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while not STATE_STORE.lock_user(user=user, ttl=USER_LOCK_TTL):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.5)
+    return True
+
+
+def renew_user_lock(user: str):
+    """Extend the lock of a user for another USER_LOCK_TTL seconds
+
+    Called between the slow steps of processing a user (backfill pages,
+    captures), so the lock does not expire while the user is processed.
+
+    Raises:
+        UserLockLost: another run took the lock after it expired
+    """
+    if not STATE_STORE.renew_user_lock(user=user, ttl=USER_LOCK_TTL):
+        raise UserLockLost(f"The lock of @{user} expired and was taken over")
+
+
+def fetch_user_tweets(
+    user: str, stop_event: Event = None
+) -> Optional[Tuple[str, List[Union[Status, Tweet]]]]:
+    """Lock user and get the user's new tweets
+
+    The per-user lock keeps overlapping runs from processing the
+    same user twice, the run that cannot get the lock skips the user.
+    The lock is released by chronicle_user.
 
-    for user in LIST_OF_USERS_TO_FOLLOW:
+    A user that does not fit in the rate limit budget is skipped and
+    polled again once the rate limit window has reset.
+
+    Returns:
+        (user, new tweets) or None if the user is skipped
+    """
+    if stop_event and stop_event.is_set():
+        LOGGER.debug(f"Shutting down, skipping user: @{user}")
+        return None
+
+    if not lock_user(user=user):
+        LOGGER.info(
+            f"Another instance of this application currently "
+            f"holds lock for this user @{user}. "
+            f"(timeout={USER_LOCK_TIMEOUT})"
+        )
+        return None
+
+    try:
         LOGGER.debug(f"starting collection for user: @{user}")
-        user_quoted_retweets = find_quoted_tweets(user=user)
-        collect_and_post_tweets(user_quoted_retweets)
-        LOGGER.debug(f"ending collection for user: @{user}")
+        with PROFILER.stage("fetch", user=user):
+            return user, get_new_tweets_for_user(user=user)
+    except TwitterRateLimitException as error:
+        poll_again_at = max(error.reset_at, time.time() + POLL_SCHEDULER.min_interval)
+        LOGGER.info(
+            f"Rate limited, polling @{user} again at {time.ctime(poll_again_at)}"
+        )
+        POLL_SCHEDULER.defer(user=user, until=poll_again_at)
+        STATE_STORE.unlock_user(user=user)
+        return None
+    except Exception:
+        LOGGER.exception(f"Unable to get new tweets for user: @{user}")
+        STATE_STORE.unlock_user(user=user)
+        return None
 
-    LOGGER.info("End of script run")
 
+def chronicle_user(
+    user: str,
+    user_tweets: List[Union[Status, Tweet]],
+    replied_to_statuses: Dict[int, Optional[Status]] = None,
+    run_started_at: float = None,
+):
+    """Filter, collect and queue the quoted tweets of a locked user
 
-def collect_and_post_tweets(tweets: List[Tweet]):
+    The state changes for the new tweets of the user are committed in one
+    transaction, then the gaps left in the timeline of the user are
+    backfilled and the next poll of the user is scheduled based on what
+    was found.
+    """
+    try:
+        with STATE_STORE.batch():
+            user_quoted_retweets = chronicle_tweets(
+                user=user,
+                user_tweets=user_tweets,
+                replied_to_statuses=replied_to_statuses,
+            )
+            LOGGER.debug(f"ending collection for user: @{user}")
+        backfilled_quoted_retweets = backfill_user(user=user)
+        POLL_SCHEDULER.record_poll(
+            user=user,
+            found_new_tweets=bool(user_tweets),
+            found_quoted_tweets=bool(
+                user_quoted_retweets or backfilled_quoted_retweets
+            ),
+            polled_at=run_started_at,
+        )
+    finally:
+        STATE_STORE.unlock_user(user=user)
 
-    if tweets:
-        collect_quoted_tweets(quoted_tweets=tweets)
-        post_collected_tweets(tweets)
-
-
-def collect_quoted_tweets(quoted_tweets: List[Tweet]):
-    """Loop through list of quoted tweets and screen cap them"""
-    screenshot_dir = Path(__file__).parent
-    with TweetCapture(
-        chrome_driver_path=CHROME_DRIVER_PATH,
-        screenshot_dir=screenshot_dir,
-        headless=True,
-    ) as tweet_capture:
-        for tweet in quoted_tweets:
-            screenshot_file_path = tweet_capture.screen_capture_tweet(
-                url=tweet.quoted_tweet_url
+
+def chronicle_tweets(
+    user: str,
+    user_tweets: List[Union[Status, Tweet]],
+    replied_to_statuses: Dict[int, Optional[Status]] = None,
+) -> List[Tweet]:
+    """Filter, collect and queue the quoted tweets among the tweets of user
+
+    Returns:
+        The quoted tweets found
+    """
+    with PROFILER.stage("filter", user=user):
+        user_quoted_retweets = (
+            filter_quoted_tweets(
+                user=user,
+                user_tweets=user_tweets,
+                replied_to_statuses=replied_to_statuses,
             )
-            add_screenshot_to_tweet(
-                tweet=tweet, screen_shot_file_path=screenshot_file_path
+            if user_tweets
+            else []
+        )
+    detected_at = time.time()
+    for tweet in user_quoted_retweets:
+        STATE_STORE.add_tweet_detected(
+            status_id=tweet.id,
+            user=user,
+            created_at=tweet.created_at_in_seconds,
+            detected_at=detected_at,
+        )
+    with PROFILER.stage("capture", user=user):
+        collect_and_queue_tweets(user=user, tweets=user_quoted_retweets)
+    return user_quoted_retweets
+
+
+def chronicle_new_tweet(user: str, tweet: Union[Status, Tweet]):
+    """Chronicle a tweet of user as soon as it is received (from the stream)
+
+    The user is locked, and the tweet is skipped if it is not newer than
+    the last status id of the user, e.g. read by a poll already. Otherwise
+    it becomes the last status id of the user, so the next poll starts
+    after it, its quote is collected, queued and posted, and the backfill
+    gaps of the user are backfilled.
+
+    If another run holds the lock of the user, the tweet is recorded as a
+    backfill gap of its own, read again by the next backfill of the user.
+    """
+    if not lock_user(user=user):
+        LOGGER.info(
+            f"Another instance holds the lock for @{user}, "
+            f"backfilling Tweet({tweet.id}) later"
+        )
+        STATE_STORE.set_backfill_gap(
+            user=user, since_id=tweet.id - 1, max_id=tweet.id, fetched=0
+        )
+        return
+    try:
+        last_status_id = STATE_STORE.get_last_status_id(user=user)
+        if last_status_id and tweet.id <= last_status_id:
+            LOGGER.debug(f"Tweet {tweet.id} of @{user} was already read")
+        else:
+            with STATE_STORE.batch():
+                STATE_STORE.set_last_status_id(user=user, status_id=tweet.id_str)
+                chronicle_tweets(user=user, user_tweets=[tweet])
+        backfill_user(user=user)
+    finally:
+        STATE_STORE.unlock_user(user=user)
+    with PROFILER.stage("post"):
+        POST_QUEUE.post_queued()
+
+
+def backfill_user(user: str) -> int:
+    """Chronicle the tweets of the backfill gaps of a locked user
+
+    A gap is left when a user posts more tweets between two polls than
+    a poll asks for. Its tweets are fetched a page at a time, newest
+    first, and each page is chronicled in its own transaction along with
+    the new max_id of the gap, so a backfill cut short (e.g. by the rate
+    limit or an api error) resumes after the last page committed. A gap is
+    dropped once it is closed, or once MAX_BACKFILL of its tweets have
+    been fetched.
+
+    Returns:
+        Number of quoted tweets found
+    """
+    found_quoted_tweets = 0
+    for since_id, max_id, fetched in STATE_STORE.get_backfill_gaps(user=user):
+        try:
+            for page in iter_timeline_pages(
+                twitter_user=user,
+                since_id=since_id,
+                max_id=max_id,
+                limit=MAX_BACKFILL - fetched,
+            ):
+                fetched += len(page)
+                renew_user_lock(user=user)
+                with PROFILER.stage("lookup", user=user):
+                    replied_to_statuses = lookup_statuses(
+                        status_ids=get_replied_to_status_ids_to_check(
+                            statuses=page, excluded_ids=STATE_STORE
+                        )
+                    )
+                with STATE_STORE.batch():
+                    found_quoted_tweets += len(
+                        chronicle_tweets(
+                            user=user,
+                            user_tweets=page,
+                            replied_to_statuses=replied_to_statuses,
+                        )
+                    )
+                    STATE_STORE.set_backfill_gap(
+                        user=user,
+                        since_id=since_id,
+                        max_id=page[-1].id - 1,
+                        fetched=fetched,
+                    )
+        except TwitterRateLimitException as error:
+            LOGGER.info(f"Rate limited, backfill of @{user} resumes later. {error}")
+            break
+        except TwitterError as error:
+            LOGGER.error(f"Unable to backfill @{user}, resuming later. {error}")
+            break
+        if fetched >= MAX_BACKFILL:
+            LOGGER.warning(
+                f"Giving up backfill of @{user} after {fetched} tweets, "
+                f"older tweets down to {since_id} are skipped"
             )
+        else:
+            LOGGER.info(f"Backfilled @{user} down to {since_id}")
+        STATE_STORE.remove_backfill_gap(user=user, since_id=since_id)
+    return found_quoted_tweets
+
+
+def collect_and_queue_tweets(user: str, tweets: List[Tweet]):
+    """Capture the quoted tweets of a locked user and queue the replies
+
+    The lock of the user is renewed before and after the captures. If
+    another run took the lock over during the captures, nothing is queued,
+    so the replies are not posted twice, and the tweets are recorded as a
+    backfill gap for the run that holds the lock.
+
+    Raises:
+        UserLockLost: another run took the lock of the user
+    """
+    if tweets:
+        renew_user_lock(user=user)
+        collected_tweets = collect_quoted_tweets(quoted_tweets=tweets)
+        try:
+            renew_user_lock(user=user)
+        except UserLockLost:
+            STATE_STORE.set_backfill_gap(
+                user=user,
+                since_id=min(tweet.id for tweet in tweets) - 1,
+                max_id=max(tweet.id for tweet in tweets),
+                fetched=0,
+            )
+            raise
+        if collected_tweets:
+            POST_QUEUE.put(collected_tweets)
+
+
+def collect_quoted_tweets(quoted_tweets: List[Tweet]) -> List[Tweet]:
+    """Screen capture the quoted tweets with the capture backend
+
+    Returns:
+        The tweets that have a screenshot
+    """
+    return get_capture_backend().capture_tweets(quoted_tweets=quoted_tweets)
 
 
 class Chronicler:
@@ -130,7 +551,6 @@ class Chronicler:
         * Add ability for user to request a tweet be screen capped
         * Add ability for user to request screenshot of a tweet that is quoted by user
           where the user of the quoted tweet blocked the requesting user
-        * Keep track of number of twitter api calls made
 
     """
 
@@ -1,6 +1,6 @@
 from configparser import ConfigParser
 from pathlib import Path, PosixPath
-from typing import List
+from typing import Dict, List
 
 PROJECT_DIR_PATH = Path(__file__).parent
 
@@ -25,10 +25,138 @@ WRITE_APP_SECRET = config.get("default", "WRITE_APP_SECRET")
 WRITE_OAUTH_TOKEN = config.get("default", "WRITE_OAUTH_TOKEN")
 WRITE_OAUTH_TOKEN_SECRET = config.get("default", "WRITE_OAUTH_TOKEN_SECRET")
 
+
+def read_api_credentials(parser: ConfigParser = config) -> Dict[str, Dict[str, str]]:
+    """Return the Api keyword arguments of every read credential by name
+
+    The READ_* keys of the default section are named "default", any other
+    credential set is a [read:<name>] section with the keys APP_KEY,
+    APP_SECRET, OAUTH_TOKEN and OAUTH_TOKEN_SECRET.
+    """
+    credentials = {
+        "default": {
+            "consumer_key": parser.get("default", "READ_APP_KEY"),
+            "consumer_secret": parser.get("default", "READ_APP_SECRET"),
+            "access_token_key": parser.get("default", "READ_OAUTH_TOKEN"),
+            "access_token_secret": parser.get("default", "READ_OAUTH_TOKEN_SECRET"),
+        }
+    }
+    for section in parser.sections():
+        if section.startswith("read:"):
+            credentials[section[len("read:") :]] = {
+                "consumer_key": parser.get(section, "APP_KEY"),
+                "consumer_secret": parser.get(section, "APP_SECRET"),
+                "access_token_key": parser.get(section, "OAUTH_TOKEN"),
+                "access_token_secret": parser.get(section, "OAUTH_TOKEN_SECRET"),
+            }
+    return credentials
+
+
+READ_API_CREDENTIALS: Dict[str, Dict[str, str]] = read_api_credentials()
+# Urls of the Twitter API, set to point the bot at another server (for example
+# tests/fake_twitter_api.py), python-twitter's defaults are used otherwise
+API_URLS: Dict[str, str] = {
+    key: config.get("default", option)
+    for key, option in (
+        ("base_url", "API_BASE_URL"),
+        ("upload_url", "API_UPLOAD_URL"),
+        ("stream_url", "API_STREAM_URL"),
+    )
+    if config.get("default", option, fallback=None)
+}
+
+# Scanner config
+# Number of followed users scanned at the same time (1 scans serially)
+MAX_SCAN_WORKERS = config.getint("default", "MAX_SCAN_WORKERS", fallback=1)
+# Seconds to wait for another run to release the lock on a user
+USER_LOCK_TIMEOUT = config.getint("default", "USER_LOCK_TIMEOUT", fallback=5)
+# Seconds between the start of two runs when running as a daemon
+SCAN_INTERVAL = config.getint("default", "SCAN_INTERVAL", fallback=60)
+# Bounds (seconds) of the adaptive interval between two polls of a user
+POLL_INTERVAL_MIN = config.getint("default", "POLL_INTERVAL_MIN", fallback=60)
+POLL_INTERVAL_MAX = config.getint("default", "POLL_INTERVAL_MAX", fallback=3600)
+# Look up the users due (100 a call) and only fetch the timelines with new tweets
+ACTIVITY_PRECHECK = config.getboolean("default", "ACTIVITY_PRECHECK", fallback=True)
+# Tweets asked for when polling a user for new tweets
+TIMELINE_PAGE_SIZE = config.getint("default", "TIMELINE_PAGE_SIZE", fallback=10)
+# Tweets asked for per page when catching up on a user (the api allows 200)
+BACKFILL_PAGE_SIZE = config.getint("default", "BACKFILL_PAGE_SIZE", fallback=200)
+# Tweets fetched at most to catch up on the tweets missed between two polls
+MAX_BACKFILL = config.getint("default", "MAX_BACKFILL", fallback=800)
+# How the new tweets are read: "timelines" (a user timeline per user), "list"
+# (the timeline of a private list kept in sync with list_of_users_to_follow.txt)
+# or "stream" (a statuses/filter stream following the users, see runner.py)
+INGESTION_MODE = config.get("default", "INGESTION_MODE", fallback="timelines")
+# Bounds (seconds) of the wait before reconnecting to the stream, doubled after
+# every connection that fails or drops within STREAM_BACKOFF_MAX seconds
+STREAM_BACKOFF_MIN = config.getint("default", "STREAM_BACKOFF_MIN", fallback=5)
+STREAM_BACKOFF_MAX = config.getint("default", "STREAM_BACKOFF_MAX", fallback=320)
+# Seconds without any data (Twitter sends a keep-alive every 30) before the
+# stream is considered stalled and reconnected
+STREAM_TIMEOUT = config.getint("default", "STREAM_TIMEOUT", fallback=90)
+# Tweets of the stream waiting to be chronicled before reading the stream waits
+STREAM_QUEUE_SIZE = config.getint("default", "STREAM_QUEUE_SIZE", fallback=1000)
+# Seconds between two drains of the post queue while reading the stream
+STREAM_POST_INTERVAL = config.getint("default", "STREAM_POST_INTERVAL", fallback=60)
+# Name of the private list, and the read credential of the account that owns it
+FOLLOW_LIST_NAME = config.get("default", "FOLLOW_LIST_NAME", fallback="chronicler")
+FOLLOW_LIST_CREDENTIAL = config.get(
+    "default", "FOLLOW_LIST_CREDENTIAL", fallback="default"
+)
+# Tweets asked for per page of the list timeline (the api allows 200)
+LIST_PAGE_SIZE = config.getint("default", "LIST_PAGE_SIZE", fallback=200)
+# Seconds after which the lock of a crashed run on a user expires
+USER_LOCK_TTL = config.getint("default", "USER_LOCK_TTL", fallback=900)
+# Calls of each read endpoint left unspent in every rate limit window
+RATE_LIMIT_RESERVE = config.getint("default", "RATE_LIMIT_RESERVE", fallback=1)
+# Seconds a read credential reported as temporarily locked (326) is left unused
+READ_CREDENTIAL_COOLDOWN = config.getint(
+    "default", "READ_CREDENTIAL_COOLDOWN", fallback=900
+)
+
+# Poster config
+# Replies the write account may post per POST_LIMIT_WINDOW seconds
+POST_LIMIT = config.getint("default", "POST_LIMIT", fallback=300)
+POST_LIMIT_WINDOW = config.getint("default", "POST_LIMIT_WINDOW", fallback=10800)
+# Replies that may be posted in a burst, before the POST_LIMIT pace applies
+POST_BURST = config.getint("default", "POST_BURST", fallback=10)
+
+# Freshness config
+# Seconds from a quote being tweeted to the reply being posted (end to end SLO)
+FRESHNESS_SLO_SECONDS = config.getint("default", "FRESHNESS_SLO_SECONDS", fallback=900)
+# Seconds of replies the freshness percentiles are computed over
+FRESHNESS_WINDOW = config.getint("default", "FRESHNESS_WINDOW", fallback=86400)
+
 # Selenium config
 CHROME_DRIVER_PATH = config.get("default", "CHROME_DRIVER_PATH")
+# Number of warm browsers kept by the browser pool
+BROWSER_POOL_SIZE = config.getint(
+    "default", "BROWSER_POOL_SIZE", fallback=MAX_SCAN_WORKERS
+)
+# Recycle a browser after this many screenshots
+BROWSER_MAX_CAPTURES = config.getint("default", "BROWSER_MAX_CAPTURES", fallback=50)
+# Recycle browsers when their processes use more than this many MB (0 disables)
+BROWSER_MAX_MEMORY_MB = config.getint("default", "BROWSER_MAX_MEMORY_MB", fallback=1024)
+# Number of capture worker processes, each with its own browser (1 captures in process)
+CAPTURE_WORKERS = config.getint("default", "CAPTURE_WORKERS", fallback=1)
+# Seconds a single screenshot may take before it is abandoned
+CAPTURE_JOB_TIMEOUT = config.getint("default", "CAPTURE_JOB_TIMEOUT", fallback=60)
+# Screenshot backend: "browser" (in process), "farm" (CAPTURE_WORKERS processes)
+# or "fake" (placeholder images, for load tests without a browser)
+CAPTURE_BACKEND_NAME = config.get(
+    "default", "CAPTURE_BACKEND", fallback="farm" if CAPTURE_WORKERS > 1 else "browser",
+)
+# Seconds a fake capture takes, and the share of fake captures that fail
+FAKE_CAPTURE_DELAY = config.getfloat("default", "FAKE_CAPTURE_DELAY", fallback=0.5)
+FAKE_CAPTURE_FAILURE_RATE = config.getfloat(
+    "default", "FAKE_CAPTURE_FAILURE_RATE", fallback=0.0
+)
 
 # General config
+# Keep the whole Status of every collected Tweet (False keeps the extracted fields)
+KEEP_RAW_TWEETS = config.getboolean("default", "KEEP_RAW_TWEETS", fallback=True)
+# Decode user timelines straight into Tweet records, without python-twitter Statuses
+FAST_DECODE = config.getboolean("default", "FAST_DECODE", fallback=False)
 LIST_OF_STATUS_IDS_REPLIED_TO_FILE: PosixPath = PROJECT_DIR_PATH.joinpath(
     "conf", "list_of_status_ids_replied_to.txt"
 )
@@ -39,22 +167,42 @@ LIST_OF_USERS_TO_FOLLOW_FILE: PosixPath = PROJECT_DIR_PATH.joinpath(
 CHECKED_STATUSES_DIR_PATH: PosixPath = PROJECT_DIR_PATH.joinpath(
     "conf", "statuses_checked"
 )
+STATE_DB_FILE: PosixPath = PROJECT_DIR_PATH.joinpath("conf", "chronicler.db")
+# Directory of the JSON timing report of each of the last PROFILE_REPORTS_KEPT runs
+PROFILE_REPORTS_DIR: PosixPath = PROJECT_DIR_PATH.joinpath("logs", "run_reports")
+PROFILE_REPORTS_KEPT = config.getint("default", "PROFILE_REPORTS_KEPT", fallback=500)
+# Run every stage under cProfile, dumping the profile of runs slower than
+# PROFILE_SLOW_RUN_SECONDS
+PROFILE_RUNS = config.getboolean("default", "PROFILE_RUNS", fallback=False)
+PROFILE_SLOW_RUN_SECONDS = config.getfloat(
+    "default", "PROFILE_SLOW_RUN_SECONDS", fallback=60
+)
+# Prometheus text file the api call metrics are written to after every run
+METRICS_FILE = config.get(
+    "default",
+    "METRICS_FILE",
+    fallback=str(PROJECT_DIR_PATH.joinpath("logs", "metrics.prom")),
+)
+
 
-with LIST_OF_USERS_TO_FOLLOW_FILE.open() as follower_file:
-    followers = follower_file.readlines()
-    LIST_OF_USERS_TO_FOLLOW: List[str] = list(
-        map(
-            lambda line: line.strip("\n"),
-            filter(
-                lambda line: not line.startswith("#") and line.strip("\n"), followers
-            ),
+def read_list_of_users_to_follow(
+    file: PosixPath = LIST_OF_USERS_TO_FOLLOW_FILE,
+) -> List[str]:
+    """Return the users listed in file, skipping comments and blank lines"""
+    with file.open() as follower_file:
+        followers = follower_file.readlines()
+        return list(
+            map(
+                lambda line: line.strip("\n"),
+                filter(
+                    lambda line: not line.startswith("#") and line.strip("\n"),
+                    followers,
+                ),
+            )
         )
-    )
 
-with LIST_OF_STATUS_IDS_REPLIED_TO_FILE.open() as f:
-    LIST_OF_STATUS_IDS_REPLIED_TO: List[str] = list(
-        filter(None, map(lambda line: line.strip("\n"), f.readlines()))
-    )
+
+LIST_OF_USERS_TO_FOLLOW: List[str] = read_list_of_users_to_follow()
 
 # Test config
 TEST_JSON_FILE: PosixPath = PROJECT_DIR_PATH.joinpath(
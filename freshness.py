@@ -0,0 +1,152 @@
+"""freshness.py
+
+Measure how long after a quote is tweeted the bot posts its reply.
+
+For every collected tweet the state store keeps when it was created,
+detected (filtered from the user's timeline), captured and replied to.
+The end to end latency is split in three stages:
+
+    * detection - created -> detected (polling delay)
+    * capture   - detected -> screenshot taken
+    * posting   - screenshot taken -> reply posted (incl. post queue wait)
+
+The p50, p95 and p99 of each are computed over the replies of the last
+FRESHNESS_WINDOW seconds. A reply posted more than FRESHNESS_SLO_SECONDS
+after its tweet violates the SLO and is reported with its user and the
+stage it spent the most time in.
+"""
+import math
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+from config import FRESHNESS_SLO_SECONDS, FRESHNESS_WINDOW
+from _logger import get_module_logger
+from state_store import STATE_STORE, StateStore
+
+LOGGER = get_module_logger(__name__)
+STAGES = ("detection", "capture", "posting")
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: Sequence[float], percent: float) -> Optional[float]:
+    """Return the nearest-rank percentile of values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def get_stage_latencies(
+    created_at: float,
+    detected_at: float,
+    captured_at: Optional[float],
+    posted_at: float,
+) -> Dict[str, float]:
+    """Return the seconds a tweet spent in each stage"""
+    captured_at = captured_at if captured_at is not None else detected_at
+    return {
+        "detection": detected_at - created_at,
+        "capture": captured_at - detected_at,
+        "posting": posted_at - captured_at,
+    }
+
+
+class FreshnessTracker:
+    """Latency percentiles and SLO violations of the replies posted"""
+
+    def __init__(
+        self,
+        state_store: StateStore = STATE_STORE,
+        slo_seconds: float = FRESHNESS_SLO_SECONDS,
+        window_seconds: float = FRESHNESS_WINDOW,
+    ):
+        self.state_store = state_store
+        self.slo_seconds = slo_seconds
+        self.window_seconds = window_seconds
+
+    def stats(self, now: Optional[float] = None) -> Dict:
+        """Return the latency percentiles of the replies in the window
+
+        Returns:
+            {"replies": n, "end_to_end": {50: p50, 95: p95, 99: p99},
+             "detection": {...}, "capture": {...}, "posting": {...}}
+        """
+        now = now if now is not None else time.time()
+        timings = self.state_store.get_tweet_timings(
+            posted_since=now - self.window_seconds
+        )
+        latencies: Dict[str, List[float]] = {
+            stage: [] for stage in ("end_to_end",) + STAGES
+        }
+        for _, _, created_at, detected_at, captured_at, posted_at in timings:
+            latencies["end_to_end"].append(posted_at - created_at)
+            stage_latencies = get_stage_latencies(
+                created_at, detected_at, captured_at, posted_at
+            )
+            for stage in STAGES:
+                latencies[stage].append(stage_latencies[stage])
+
+        stats = {"replies": len(timings)}
+        for stage, values in latencies.items():
+            stats[stage] = {
+                percent: percentile(values, percent) for percent in PERCENTILES
+            }
+        return stats
+
+    def violations(self, posted_since: float) -> List[Dict]:
+        """Return the replies posted since posted_since that missed the SLO"""
+        violations = []
+        for timing in self.state_store.get_tweet_timings(posted_since=posted_since):
+            status_id, user, created_at, detected_at, captured_at, posted_at = timing
+            latency = posted_at - created_at
+            if latency > self.slo_seconds:
+                stage_latencies = get_stage_latencies(
+                    created_at, detected_at, captured_at, posted_at
+                )
+                violations.append(
+                    {
+                        "status_id": status_id,
+                        "user": user,
+                        "latency": latency,
+                        "slowest_stage": max(stage_latencies, key=stage_latencies.get),
+                    }
+                )
+        return violations
+
+    def report(self, posted_since: float, now: Optional[float] = None):
+        """Log the rolling percentiles and the SLO violations since posted_since"""
+        stats = self.stats(now=now)
+        if stats["replies"]:
+            LOGGER.info(
+                f"Freshness of {stats['replies']} replies: "
+                + ", ".join(
+                    f"{stage} "
+                    + "/".join(
+                        f"p{percent}={stats[stage][percent]:0.0f}s"
+                        for percent in PERCENTILES
+                    )
+                    for stage in ("end_to_end",) + STAGES
+                )
+            )
+
+        violations = self.violations(posted_since=posted_since)
+        for violation in violations:
+            LOGGER.warning(
+                f"SLO violation: reply to @{violation['user']}'s "
+                f"Tweet({violation['status_id']}) posted "
+                f"{violation['latency']:0.0f}s after the tweet "
+                f"(SLO {self.slo_seconds}s), slowest stage: "
+                f"{violation['slowest_stage']}"
+            )
+        if violations:
+            users = Counter(violation["user"] for violation in violations)
+            stages = Counter(violation["slowest_stage"] for violation in violations)
+            LOGGER.warning(
+                f"{len(violations)} SLO violations, by user: {dict(users)}, "
+                f"by stage: {dict(stages)}"
+            )
+
+
+FRESHNESS_TRACKER = FreshnessTracker()
@@ -0,0 +1,238 @@
+"""list_ingestion.py
+
+Read the new tweets of the followed users from the timeline of a list.
+
+With INGESTION_MODE = list the followed users are kept as the members of
+a private Twitter list (FOLLOW_LIST_NAME) owned by the account of the
+FOLLOW_LIST_CREDENTIAL read credential. Every run reads the list
+timeline from where the last run stopped, LIST_PAGE_SIZE tweets per
+call, instead of a user timeline per user, and splits the tweets per
+user.
+
+The members are only read from and written to Twitter when the users to
+follow change. Users that cannot be members (past LIST_MAX_MEMBERS, or
+accounts Twitter does not add, e.g. protected ones) are polled with
+their user timeline as before.
+"""
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from twitter import Status
+
+from api_pool import READ_API_POOL, ReadApiPool
+from config import (
+    FAST_DECODE,
+    FOLLOW_LIST_CREDENTIAL,
+    FOLLOW_LIST_NAME,
+    LIST_PAGE_SIZE,
+    MAX_BACKFILL,
+)
+from _logger import get_module_logger
+from state_store import STATE_STORE, StateStore
+from twitter_helpers import get_screen_name, iter_pages
+from wrapped_tweet import Tweet
+
+LOGGER = get_module_logger(__name__)
+# Maximum number of members of a list, and of users added or removed per call
+LIST_MAX_MEMBERS = 5000
+LIST_MEMBERS_BATCH_SIZE = 100
+LIST_STATUSES_ENDPOINT = "/lists/statuses"
+LIST_MEMBERS_ENDPOINT = "/lists/members"
+LIST_OWNERSHIPS_ENDPOINT = "/lists/ownerships"
+LIST_CREATE_ENDPOINT = "/lists/create"
+LIST_MEMBERS_CREATE_ENDPOINT = "/lists/members/create_all"
+LIST_MEMBERS_DESTROY_ENDPOINT = "/lists/members/destroy_all"
+
+
+class FollowList:
+    """Private list whose members are the followed users"""
+
+    def __init__(
+        self,
+        state_store: StateStore = STATE_STORE,
+        api_pool: ReadApiPool = READ_API_POOL,
+        name: str = FOLLOW_LIST_NAME,
+        client_name: str = FOLLOW_LIST_CREDENTIAL,
+    ):
+        self.state_store = state_store
+        self.api_pool = api_pool
+        self.name = name
+        self.client_name = client_name
+
+    def api(self, endpoint: str):
+        return self.api_pool.api(endpoint=endpoint, client_name=self.client_name)
+
+    def meta_key(self, key: str) -> str:
+        return f"follow_list:{self.name}:{key}"
+
+    @property
+    def list_id(self) -> int:
+        """Return the id of the list, created the first time if need be"""
+        list_id = self.state_store.get_meta(self.meta_key("id"))
+        if list_id:
+            return int(list_id)
+        with self.api(endpoint=LIST_OWNERSHIPS_ENDPOINT) as api:
+            lists = api.GetListsPaged(count=1000)[2]
+        list_id = next((lst.id for lst in lists if lst.name == self.name), None)
+        if list_id is None:
+            LOGGER.info(f"Creating the private list {self.name}")
+            with self.api(endpoint=LIST_CREATE_ENDPOINT) as api:
+                list_id = api.CreateList(
+                    name=self.name,
+                    mode="private",
+                    description="Accounts followed by the chronicler",
+                ).id
+        self.state_store.set_meta(self.meta_key("id"), str(list_id))
+        return list_id
+
+    @property
+    def since_id(self) -> Optional[int]:
+        """Return the id of the newest tweet read from the list timeline"""
+        since_id = self.state_store.get_meta(self.meta_key("since_id"))
+        return int(since_id) if since_id else None
+
+    def set_since_id(self, since_id: int):
+        self.state_store.set_meta(self.meta_key("since_id"), str(since_id))
+
+    def get_members(self) -> Set[str]:
+        """Return the lower case screen names of the members of the list"""
+        members = self.state_store.get_meta(self.meta_key("members"))
+        return set(json.loads(members)) if members else self.read_members()
+
+    def read_members(self) -> Set[str]:
+        """Read the members of the list from the api and remember them"""
+        members = set()
+        cursor = -1
+        while cursor:
+            with self.api(endpoint=LIST_MEMBERS_ENDPOINT) as api:
+                cursor, _, users = api.GetListMembersPaged(
+                    list_id=self.list_id,
+                    cursor=cursor,
+                    count=LIST_MAX_MEMBERS,
+                    skip_status=True,
+                    include_entities=False,
+                )
+            members.update(user.screen_name.lower() for user in users)
+        self.state_store.set_meta(self.meta_key("members"), json.dumps(sorted(members)))
+        return members
+
+    def sync(self, users: List[str]) -> Set[str]:
+        """Make the users (the first LIST_MAX_MEMBERS of them) the members
+
+        Nothing is sent to the api unless the users differ from the users
+        of the last sync, so users that could not be added are only tried
+        again once the users to follow change.
+
+        Returns:
+            The lower case screen names of the members
+        """
+        if len(users) > LIST_MAX_MEMBERS:
+            LOGGER.warning(
+                f"Only the first {LIST_MAX_MEMBERS} of {len(users)} users "
+                f"can be members of the list {self.name}"
+            )
+        wanted = sorted({user.lower() for user in users[:LIST_MAX_MEMBERS]})
+        synced_users = json.dumps(wanted)
+        members = self.get_members()
+        if self.state_store.get_meta(self.meta_key("users")) == synced_users:
+            return members
+        changes = (
+            ("CreateListsMember", LIST_MEMBERS_CREATE_ENDPOINT, set(wanted) - members),
+            (
+                "DestroyListsMember",
+                LIST_MEMBERS_DESTROY_ENDPOINT,
+                members - set(wanted),
+            ),
+        )
+        for method, endpoint, screen_names in changes:
+            screen_names = sorted(screen_names)
+            for offset in range(0, len(screen_names), LIST_MEMBERS_BATCH_SIZE):
+                batch = screen_names[offset : offset + LIST_MEMBERS_BATCH_SIZE]
+                LOGGER.info(f"api_user.{method}(screen_name=[{len(batch)} users])")
+                with self.api(endpoint=endpoint) as api:
+                    getattr(api, method)(list_id=self.list_id, screen_name=batch)
+        if any(screen_names for _, _, screen_names in changes):
+            members = self.read_members()
+        if set(wanted) - members:
+            LOGGER.info(
+                f"{len(set(wanted) - members)} users could not be added to the "
+                f"list {self.name}, their user timelines are polled"
+            )
+        self.state_store.set_meta(self.meta_key("users"), synced_users)
+        return members
+
+    def get_page(
+        self, since_id: Optional[int], max_id: Optional[int], count: int
+    ) -> List[Union[Status, Tweet]]:
+        """Get a page of the list timeline (Tweets with FAST_DECODE)"""
+        LOGGER.debug(f"Getting {count} tweets of the list {self.name}")
+        with self.api(endpoint=LIST_STATUSES_ENDPOINT) as api:
+            get_list_timeline = (
+                api.GetListTimelineTweets if FAST_DECODE else api.GetListTimeline
+            )
+            return get_list_timeline(
+                list_id=self.list_id, since_id=since_id, max_id=max_id, count=count
+            )
+
+    def get_new_tweets(
+        self, members: Iterable[str] = ()
+    ) -> Tuple[Dict[str, List[Union[Status, Tweet]]], Optional[int]]:
+        """Get the tweets posted to the list since since_id, split per user
+
+        The list timeline is read a page at a time down to since_id (see
+        iter_pages), the first time only its newest page is read. At most
+        MAX_BACKFILL tweets are read. The older tweets are left to the
+        backfill of the user timelines: a backfill gap is recorded for
+        each of members (the followed users that are members of the list)
+        from its last status id (or since_id) down to the oldest tweet read.
+
+        Returns:
+            (tweets newest first by lower case screen name, id of the
+            newest tweet, to be saved with set_since_id once the tweets
+            are checkpointed)
+
+        Raises:
+            TwitterRateLimitException: the lists/statuses budget of the
+                credential is used up
+        """
+        since_id = self.since_id
+        tweets_by_user = defaultdict(list)
+        newest_id = None
+        read = 0
+        for page in iter_pages(
+            get_page=self.get_page,
+            since_id=since_id,
+            max_id=None,
+            count=LIST_PAGE_SIZE,
+            limit=MAX_BACKFILL if since_id else LIST_PAGE_SIZE,
+        ):
+            newest_id = newest_id or page[0].id
+            read += len(page)
+            for tweet in page:
+                tweets_by_user[get_screen_name(tweet).lower()].append(tweet)
+        if since_id and read >= MAX_BACKFILL:
+            LOGGER.warning(
+                f"Read {read} tweets of the list {self.name}, the tweets older "
+                f"than {page[-1].id} and newer than {since_id} are backfilled "
+                f"from the user timelines"
+            )
+            for user in members:
+                gap_since_id = max(
+                    since_id, self.state_store.get_last_status_id(user=user) or 0
+                )
+                if gap_since_id < page[-1].id - 1:
+                    self.state_store.set_backfill_gap(
+                        user=user,
+                        since_id=gap_since_id,
+                        max_id=page[-1].id - 1,
+                        fetched=0,
+                    )
+        LOGGER.debug(
+            f"Read {read} tweets of {len(tweets_by_user)} users from "
+            f"the list {self.name}"
+        )
+        return tweets_by_user, newest_id
+
+
+FOLLOW_LIST = FollowList()
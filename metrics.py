@@ -0,0 +1,234 @@
+"""metrics.py
+
+Count and time every call the bot makes to the Twitter API.
+
+InstrumentedApi is the Api client used by the bot, it records for each
+instrumented method the number of calls, a latency histogram and the
+error codes returned. The remaining rate limit budget is read from the
+clients when the metrics are exported.
+
+The metrics are written in the Prometheus text format to METRICS_FILE
+(e.g. for the node exporter textfile collector) and summarized in the
+runner log after every run.
+"""
+import os
+import time
+from collections import defaultdict
+from pathlib import PosixPath
+from threading import Lock
+from typing import Dict, List, Optional, Tuple, Union
+
+from twitter import TwitterError
+
+from config import METRICS_FILE
+from _logger import get_module_logger
+from tweet_decoder import TweetDecodingApi
+
+LOGGER = get_module_logger(__name__)
+INSTRUMENTED_METHODS = (
+    "CreateList",
+    "CreateListsMember",
+    "DestroyListsMember",
+    "GetListMembersPaged",
+    "GetListTimeline",
+    "GetListTimelineTweets",
+    "GetListsPaged",
+    "GetStatus",
+    "GetStatuses",
+    "GetUserTimeline",
+    "GetUserTimelineTweets",
+    "PostUpdate",
+    "UploadMediaChunked",
+    "UploadMediaSimple",
+    "UsersLookup",
+)
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+
+class Metrics:
+    """Api call counts, latencies and errors by (method, client)"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.errors: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self.latency_sum: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.latency_buckets: Dict[Tuple[str, str], List[int]] = defaultdict(
+            lambda: [0] * len(LATENCY_BUCKETS)
+        )
+        self.apis: List["InstrumentedApi"] = []
+
+    def record_call(self, method: str, client: str, latency: float, error_code=None):
+        key = (method, client)
+        with self._lock:
+            self.calls[key] += 1
+            self.latency_sum[key] += latency
+            buckets = self.latency_buckets[key]
+            for index, upper_bound in enumerate(LATENCY_BUCKETS):
+                if latency <= upper_bound:
+                    buckets[index] += 1
+            if error_code is not None:
+                self.errors[(method, client, str(error_code))] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Copy of the counters, to summarize a run with"""
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "errors": dict(self.errors),
+                "latency_sum": dict(self.latency_sum),
+            }
+
+    def summary(self, since: Dict[str, Dict] = None) -> str:
+        """One line summary of the calls made since the snapshot"""
+        since = since or {"calls": {}, "errors": {}, "latency_sum": {}}
+        current = self.snapshot()
+        calls = defaultdict(int)
+        errors = defaultdict(int)
+        latency = defaultdict(float)
+        for (method, _), count in current["calls"].items():
+            calls[method] += count
+        for key, count in since["calls"].items():
+            calls[key[0]] -= count
+        for (method, _, _), count in current["errors"].items():
+            errors[method] += count
+        for key, count in since["errors"].items():
+            errors[key[0]] -= count
+        for (method, _), seconds in current["latency_sum"].items():
+            latency[method] += seconds
+        for key, seconds in since["latency_sum"].items():
+            latency[key[0]] -= seconds
+
+        methods = [method for method in sorted(calls) if calls[method]]
+        if not methods:
+            return "API calls: none"
+        return "API calls: " + ", ".join(
+            f"{method}={calls[method]} "
+            f"({errors[method]} errors, {latency[method] / calls[method]:0.2f}s avg)"
+            for method in methods
+        )
+
+    def rate_limits(self) -> List[Tuple[str, str, int, int]]:
+        """Return (client, endpoint, remaining, reset) of every known endpoint"""
+        rate_limits = []
+        for api in list(self.apis):
+            for family in api.rate_limit.resources.values():
+                for endpoint, limit in family.items():
+                    rate_limits.append(
+                        (api.client_name, endpoint, limit["remaining"], limit["reset"])
+                    )
+        return rate_limits
+
+    def to_prometheus(self) -> str:
+        """Return the metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP twitter_api_calls_total Calls made to the Twitter API.",
+            "# TYPE twitter_api_calls_total counter",
+        ]
+        with self._lock:
+            for (method, client), count in sorted(self.calls.items()):
+                lines.append(
+                    f'twitter_api_calls_total{{method="{method}",client="{client}"}} '
+                    f"{count}"
+                )
+            lines += [
+                "# HELP twitter_api_errors_total Twitter API calls that failed.",
+                "# TYPE twitter_api_errors_total counter",
+            ]
+            for (method, client, code), count in sorted(self.errors.items()):
+                lines.append(
+                    f'twitter_api_errors_total{{method="{method}",client="{client}",'
+                    f'code="{code}"}} {count}'
+                )
+            lines += [
+                "# HELP twitter_api_call_seconds Latency of the Twitter API calls.",
+                "# TYPE twitter_api_call_seconds histogram",
+            ]
+            for (method, client), buckets in sorted(self.latency_buckets.items()):
+                labels = f'method="{method}",client="{client}"'
+                for upper_bound, count in zip(LATENCY_BUCKETS, buckets):
+                    le = "+Inf" if upper_bound == float("inf") else upper_bound
+                    lines.append(
+                        f'twitter_api_call_seconds_bucket{{{labels},le="{le}"}} {count}'
+                    )
+                lines.append(
+                    f"twitter_api_call_seconds_sum{{{labels}}} "
+                    f"{self.latency_sum[(method, client)]:0.6f}"
+                )
+                lines.append(
+                    f"twitter_api_call_seconds_count{{{labels}}} "
+                    f"{self.calls[(method, client)]}"
+                )
+        lines += [
+            "# HELP twitter_rate_limit_remaining Calls left in the rate limit window.",
+            "# TYPE twitter_rate_limit_remaining gauge",
+        ]
+        for client, endpoint, remaining, _ in self.rate_limits():
+            lines.append(
+                f'twitter_rate_limit_remaining{{client="{client}",'
+                f'endpoint="{endpoint}"}} {remaining}'
+            )
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_file(self, file: Union[PosixPath, str] = METRICS_FILE):
+        """Replace file with the current metrics"""
+        temp_file = f"{file}.tmp"
+        with open(temp_file, "w") as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.replace(temp_file, file)
+
+
+METRICS = Metrics()
+
+
+def get_error_code(error: TwitterError) -> Optional[int]:
+    """Return the code of the first error returned by the api"""
+    if isinstance(error.message, list) and error.message:
+        return error.message[0].get("code")
+    return None
+
+
+def instrument(method_name: str):
+    """Return a method of InstrumentedApi that records calls to method_name
+
+    The method of Api is looked up on every call, so that patching Api
+    (e.g. in the tests) still takes effect.
+    """
+
+    def instrumented_method(self, *args, **kwargs):
+        method = getattr(super(InstrumentedApi, self), method_name)
+        start_time = time.perf_counter()
+        error_code = None
+        try:
+            return method(*args, **kwargs)
+        except TwitterError as error:
+            error_code = get_error_code(error) or "unknown"
+            raise
+        except Exception:
+            error_code = "exception"
+            raise
+        finally:
+            self.metrics.record_call(
+                method=method_name,
+                client=self.client_name,
+                latency=time.perf_counter() - start_time,
+                error_code=error_code,
+            )
+
+    instrumented_method.__name__ = method_name
+    return instrumented_method
+
+
+class InstrumentedApi(TweetDecodingApi):
+    """Api client that records its calls in METRICS"""
+
+    def __init__(self, client_name: str, metrics: Metrics = METRICS, **kwargs):
+        super().__init__(**kwargs)
+        self.client_name = client_name
+        self.metrics = metrics
+        metrics.apis.append(self)
+
+
+for _method_name in INSTRUMENTED_METHODS:
+    setattr(InstrumentedApi, _method_name, instrument(_method_name))
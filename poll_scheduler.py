@@ -0,0 +1,85 @@
+"""poll_scheduler.py
+
+Decide which followed users are worth polling on a run.
+
+Each user has a polling interval between POLL_INTERVAL_MIN and
+POLL_INTERVAL_MAX. The interval follows the user's activity:
+
+    * quoted a tweet      -> back to the minimum interval
+    * tweeted, no quotes  -> interval is halved
+    * no new tweets       -> interval is doubled (exponential back off)
+"""
+import time
+from typing import List, Optional
+
+from config import POLL_INTERVAL_MAX, POLL_INTERVAL_MIN
+from _logger import get_module_logger
+from state_store import STATE_STORE, StateStore
+
+LOGGER = get_module_logger(__name__)
+
+
+class PollScheduler:
+    """Keep track of when each user should be polled next"""
+
+    def __init__(
+        self,
+        state_store: StateStore = STATE_STORE,
+        min_interval: float = POLL_INTERVAL_MIN,
+        max_interval: float = POLL_INTERVAL_MAX,
+    ):
+        self.state_store = state_store
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def users_due(self, users: List[str], now: Optional[float] = None) -> List[str]:
+        """Return the users whose next poll time has come
+
+        Users that have never been polled are always due.
+        """
+        now = now if now is not None else time.time()
+        schedules = self.state_store.get_poll_schedules()
+        due_users = [
+            user for user in users if user not in schedules or schedules[user][1] <= now
+        ]
+        LOGGER.debug(f"{len(due_users)} of {len(users)} users are due to be polled")
+        return due_users
+
+    def get_interval(self, user: str) -> float:
+        schedule = self.state_store.get_poll_schedule(user=user)
+        return schedule[0] if schedule else self.min_interval
+
+    def record_poll(
+        self,
+        user: str,
+        found_new_tweets: bool,
+        found_quoted_tweets: bool,
+        polled_at: Optional[float] = None,
+    ) -> float:
+        """Update the polling interval of user after a poll
+
+        Returns:
+            The new polling interval in seconds
+        """
+        polled_at = polled_at if polled_at is not None else time.time()
+        interval = self.get_interval(user=user)
+        if found_quoted_tweets:
+            interval = self.min_interval
+        elif found_new_tweets:
+            interval = max(interval / 2, self.min_interval)
+        else:
+            interval = min(interval * 2, self.max_interval)
+        LOGGER.debug(f"Polling @{user} again in {interval:0.0f} seconds")
+        self.state_store.set_poll_schedule(
+            user=user, interval=interval, next_poll_at=polled_at + interval
+        )
+        return interval
+
+    def defer(self, user: str, until: float):
+        """Do not poll user before until (a unix timestamp)"""
+        self.state_store.set_poll_schedule(
+            user=user, interval=self.get_interval(user=user), next_poll_at=until
+        )
+
+
+POLL_SCHEDULER = PollScheduler()
@@ -0,0 +1,182 @@
+"""post_queue.py
+
+Post the replies at a pace the write account is allowed to keep.
+
+Collected tweets are queued in the state store, so replies that could
+not be posted yet survive a restart. The queue is drained by priority,
+freshest quote first by default, as long as the token bucket has a token
+left. A reply to a tweet of the same thread that is still queued waits
+for that tweet, so the replies of a thread are posted in order. The
+bucket holds POST_BURST tokens and gains POST_LIMIT tokens per
+POST_LIMIT_WINDOW seconds, which keeps the account under its posting cap
+instead of getting it locked.
+"""
+import json
+import time
+from typing import Callable, List, Optional
+
+from twitter import Status, TwitterError
+
+from config import POST_BURST, POST_LIMIT, POST_LIMIT_WINDOW
+from _logger import get_module_logger
+from metrics import get_error_code
+from state_store import STATE_STORE, StateStore
+from twitter_helpers import post_collected_tweets
+from wrapped_tweet import Tweet
+
+LOGGER = get_module_logger(__name__)
+# Errors after which nothing can be posted for a while
+# 88: rate limit exceeded, 185: over daily status update limit,
+# 326: account temporarily locked
+POSTING_LIMIT_ERROR_CODES = (88, 185, 326)
+
+
+def load_queued_tweet(status_json: str) -> Tweet:
+    """Return the Tweet of a queued post
+
+    Posts queued before Tweet.as_dict was used hold the whole Status.
+    """
+    data = json.loads(status_json)
+    if isinstance(data.get("user"), dict):
+        return Tweet(Status.NewFromJsonDict(data), keep_raw_tweet=False)
+    return Tweet.from_dict(data)
+
+
+class TokenBucket:
+    """Allow bursts of capacity posts, refilled at rate tokens per second"""
+
+    def __init__(
+        self,
+        capacity: float,
+        rate: float,
+        tokens: Optional[float] = None,
+        updated_at: Optional[float] = None,
+    ):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = tokens if tokens is not None else capacity
+        self.updated_at = updated_at if updated_at is not None else time.time()
+
+    def refill(self, now: Optional[float] = None):
+        now = now if now is not None else time.time()
+        elapsed = max(now - self.updated_at, 0)
+        self.tokens = min(self.tokens + elapsed * self.rate, self.capacity)
+        self.updated_at = now
+
+    def take(self, now: Optional[float] = None) -> bool:
+        """Take a token, return False if the bucket is empty"""
+        self.refill(now=now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def empty(self, now: Optional[float] = None):
+        self.refill(now=now)
+        self.tokens = 0
+
+
+class PostQueue:
+    """Replies waiting to be posted, persisted in the state store"""
+
+    def __init__(
+        self,
+        state_store: StateStore = STATE_STORE,
+        capacity: float = POST_BURST,
+        rate: float = POST_LIMIT / POST_LIMIT_WINDOW,
+        priority: Callable[[Tweet], float] = lambda tweet: tweet.created_at_in_seconds,
+    ):
+        """
+        Args:
+            priority: priority of a tweet, tweets with a higher priority are
+                posted first (defaults to the freshest first)
+        """
+        self.state_store = state_store
+        self.priority = priority
+        tokens = state_store.get_meta("post_bucket_tokens")
+        updated_at = state_store.get_meta("post_bucket_updated_at")
+        self.bucket = TokenBucket(
+            capacity=capacity,
+            rate=rate,
+            tokens=float(tokens) if tokens is not None else None,
+            updated_at=float(updated_at) if updated_at is not None else None,
+        )
+        self.started_at = time.time()
+        self.posted_total = 0
+
+    def __len__(self) -> int:
+        return self.state_store.count_queued_posts()
+
+    def put(self, tweets: List[Tweet]):
+        """Queue tweets that have a screenshot of their quoted tweet"""
+        for tweet in tweets:
+            self.state_store.queue_post(
+                status_id=tweet.id,
+                created_at=tweet.created_at_in_seconds,
+                status_json=json.dumps(tweet.as_dict()),
+                file_path=tweet.screen_capture_file_path_quoted_tweet,
+                replied_to_status_id=tweet.replied_to_status_id,
+                priority=self.priority(tweet),
+            )
+
+    def _save_bucket(self):
+        self.state_store.set_meta("post_bucket_tokens", str(self.bucket.tokens))
+        self.state_store.set_meta("post_bucket_updated_at", str(self.bucket.updated_at))
+
+    def post_queued(
+        self,
+        post: Callable[[List[Tweet]], bool] = post_collected_tweets,
+        now: Optional[float] = None,
+    ) -> int:
+        """Post queued tweets, by priority, until the bucket is empty
+
+        A posting limit error empties the bucket and keeps the tweet, any
+        other error drops the tweet (e.g. deleted, or its screenshot is
+        missing) so it does not hold up the tweets queued behind it.
+
+        Returns:
+            Number of tweets posted
+        """
+        start_time = time.perf_counter()
+        posted = 0
+        try:
+            for status_json, file_path in self.state_store.get_queued_posts(
+                limit=int(self.bucket.capacity)
+            ):
+                if not self.bucket.take(now=now):
+                    break
+                tweet = load_queued_tweet(status_json)
+                tweet.screen_capture_file_path_quoted_tweet = file_path
+                try:
+                    post([tweet])
+                except TwitterError as error:
+                    if get_error_code(error) in POSTING_LIMIT_ERROR_CODES:
+                        LOGGER.critical(
+                            f"Posting limit reached, keeping {len(self)} tweets "
+                            f"queued. {error}"
+                        )
+                        self.bucket.empty(now=now)
+                        break
+                    LOGGER.error(
+                        f"Unable to reply to Tweet({tweet.id}), dropping it. {error}"
+                    )
+                except Exception:
+                    LOGGER.exception(
+                        f"Unable to reply to Tweet({tweet.id}), dropping it"
+                    )
+                else:
+                    posted += 1
+                self.state_store.remove_queued_post(status_id=tweet.id)
+        finally:
+            self._save_bucket()
+
+        self.posted_total += posted
+        LOGGER.info(
+            f"Posted {posted} tweets in {time.perf_counter() - start_time:0.2f} "
+            f"seconds, {len(self)} queued, {self.bucket.tokens:0.1f} tokens left, "
+            f"{self.posted_total} posted since {time.ctime(self.started_at)}"
+        )
+        return posted
+
+
+POST_QUEUE = PostQueue()
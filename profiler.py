@@ -0,0 +1,145 @@
+"""profiler.py
+
+Time each stage of a run, overall and per user.
+
+The stages of a run are:
+
+    * precheck - look up the users due, to skip the ones that have not tweeted
+    * fetch    - get the new tweets of a user
+    * lookup   - look up the replied to statuses of all users
+    * filter   - process_tweet on the new tweets of a user
+    * capture  - screenshot the quoted tweets of a user
+    * post     - post the queued replies
+
+After every run a JSON timing report is written to PROFILE_REPORTS_DIR.
+With PROFILE_RUNS enabled every stage also runs under cProfile and the
+profile of a run slower than PROFILE_SLOW_RUN_SECONDS is dumped next to
+its report (open it with ``python -m pstats <file>``).
+"""
+import cProfile
+import json
+import pstats
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path, PosixPath
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Union
+
+from config import (
+    PROFILE_REPORTS_DIR,
+    PROFILE_REPORTS_KEPT,
+    PROFILE_RUNS,
+    PROFILE_SLOW_RUN_SECONDS,
+)
+from _logger import get_module_logger
+
+LOGGER = get_module_logger(__name__)
+
+
+class RunProfiler:
+    """Collect the stage timings of the current run"""
+
+    def __init__(
+        self,
+        reports_dir: Union[PosixPath, str] = PROFILE_REPORTS_DIR,
+        profile_runs: bool = PROFILE_RUNS,
+        slow_run_seconds: float = PROFILE_SLOW_RUN_SECONDS,
+        reports_kept: int = PROFILE_REPORTS_KEPT,
+    ):
+        self.reports_dir = Path(reports_dir)
+        self.profile_runs = profile_runs
+        self.slow_run_seconds = slow_run_seconds
+        self.reports_kept = reports_kept
+        self._lock = Lock()
+        self.start_run()
+
+    def start_run(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.stages: Dict[str, Dict[str, float]] = defaultdict(
+                lambda: {"seconds": 0.0, "calls": 0}
+            )
+            self.users: Dict[str, Dict[str, float]] = defaultdict(
+                lambda: defaultdict(float)
+            )
+            self.profiles: List[cProfile.Profile] = []
+
+    @contextmanager
+    def stage(self, name: str, user: Optional[str] = None) -> Iterator[None]:
+        """Time the with block as a stage of the run, for user if given"""
+        profile = cProfile.Profile() if self.profile_runs else None
+        if profile:
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is already active
+                profile = None
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            if profile:
+                profile.disable()
+            with self._lock:
+                self.stages[name]["seconds"] += elapsed
+                self.stages[name]["calls"] += 1
+                if user:
+                    self.users[user][name] += elapsed
+                if profile:
+                    self.profiles.append(profile)
+
+    def report(self, elapsed: float) -> Dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed": elapsed,
+                "stages": dict(self.stages),
+                "users": {user: dict(stages) for user, stages in self.users.items()},
+            }
+
+    def finish_run(self, elapsed: float) -> Optional[PosixPath]:
+        """Write the timing report of the run, and its profile if slow
+
+        Returns:
+            Path of the report, None if it could not be written
+        """
+        report = self.report(elapsed=elapsed)
+        LOGGER.info(
+            "Stage timings: "
+            + ", ".join(
+                f"{name}={stage['seconds']:0.2f}s"
+                for name, stage in sorted(report["stages"].items())
+            )
+        )
+        run_name = time.strftime("run-%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        report_file = self.reports_dir.joinpath(f"{run_name}.json")
+        try:
+            self.reports_dir.mkdir(parents=True, exist_ok=True)
+            if self.profiles and elapsed >= self.slow_run_seconds:
+                profile_file = self.reports_dir.joinpath(f"{run_name}.prof")
+                stats = pstats.Stats(self.profiles[0])
+                for profile in self.profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(str(profile_file))
+                report["profile"] = profile_file.name
+                LOGGER.info(f"Slow run ({elapsed:0.2f}s), profile: {profile_file}")
+            report_file.write_text(json.dumps(report, indent=2))
+            self.remove_old_reports()
+        except OSError:
+            LOGGER.exception(f"Unable to write the timing report {report_file}")
+            return None
+        return report_file
+
+    def remove_old_reports(self):
+        """Keep the reports (and profiles) of the last reports_kept runs"""
+        reports = sorted(self.reports_dir.glob("run-*.json"))
+        for old_report in reports[: max(len(reports) - self.reports_kept, 0)]:
+            old_report.unlink()
+            old_profile = old_report.with_suffix(".prof")
+            if old_profile.exists():
+                old_profile.unlink()
+
+
+PROFILER = RunProfiler()
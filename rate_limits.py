@@ -0,0 +1,131 @@
+"""rate_limits.py
+
+Keep track of the rate limit budget of the api endpoints the bot reads.
+
+python-twitter records the x-rate-limit-limit, x-rate-limit-remaining and
+x-rate-limit-reset headers of every response in ``Api.rate_limit``. The
+budget starts from those numbers and counts the calls reserved and still
+in flight (released once their response is in), so that threads scanning
+at the same time do not spend the same remaining call twice.
+
+A call that would go over the budget is refused instead of sleeping until
+the window resets, the caller decides what to do with the work (e.g. poll
+the user again after reset_at).
+"""
+import time
+from threading import Lock
+from typing import Dict, Tuple
+
+from twitter import Api, TwitterError
+
+from config import RATE_LIMIT_RESERVE
+from _logger import get_module_logger
+
+LOGGER = get_module_logger(__name__)
+# Seconds of a rate limit window of the api
+RATE_LIMIT_WINDOW = 15 * 60
+
+
+class TwitterRateLimitException(TwitterError):
+    """The rate limit budget of an endpoint is used up until reset_at"""
+
+    def __init__(self, message: str, reset_at: float):
+        super().__init__(message)
+        self.reset_at = reset_at
+
+
+class RateLimitBudget:
+    """Remaining calls of each endpoint of an api client"""
+
+    def __init__(self, api: Api, reserve: int = RATE_LIMIT_RESERVE):
+        """
+        Args:
+            api: client whose responses update the budget
+            reserve: calls of each endpoint that are never spent
+        """
+        self.api = api
+        self.reserve = reserve
+        self._lock = Lock()
+        # (remaining, reset) by endpoint, as last reported by the api
+        self._reported: Dict[str, Tuple[int, int]] = {}
+        # calls reserved and not released yet, by endpoint
+        self._in_flight: Dict[str, int] = {}
+
+    def endpoint_url(self, endpoint: str) -> str:
+        """Return the url of an endpoint, e.g. '/statuses/user_timeline'"""
+        return f"{self.api.base_url}{endpoint}.json"
+
+    def _refresh(self, endpoint: str):
+        """Start again from the rate limit last reported for endpoint
+
+        The calls in flight are kept, the reported remaining calls do not
+        count them until their responses are in.
+        """
+        limit = self.api.rate_limit.get_limit(self.endpoint_url(endpoint))
+        self._reported[endpoint] = (limit.remaining, limit.reset)
+        self._in_flight.setdefault(endpoint, 0)
+
+    def remaining(self, endpoint: str, now: float = None) -> float:
+        """Return the calls left to endpoint in the current window
+
+        The budget of a window that has reset (or was never reported)
+        is unknown and taken as unlimited until the next response.
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._refresh(endpoint)
+            remaining, reset = self._reported[endpoint]
+            if reset <= now:
+                return float("inf")
+            return remaining - self._in_flight[endpoint] - self.reserve
+
+    def reset_at(self, endpoint: str) -> float:
+        """Return when the current window of endpoint resets (unix timestamp)"""
+        with self._lock:
+            self._refresh(endpoint)
+            return self._reported[endpoint][1]
+
+    def acquire(self, endpoint: str, calls: int = 1, now: float = None) -> bool:
+        """Reserve calls to endpoint, to be released once they are made
+
+        Returns:
+            True if the calls fit in the budget, False if they should wait
+            for the window to reset
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            self._refresh(endpoint)
+            remaining, reset = self._reported[endpoint]
+            available = remaining - self._in_flight[endpoint] - self.reserve
+            if reset > now and available < calls:
+                LOGGER.warning(
+                    f"Rate limit budget of {endpoint} used up "
+                    f"({remaining} calls left) until {time.ctime(reset)}"
+                )
+                return False
+            self._in_flight[endpoint] += calls
+            return True
+
+    def exhaust(self, endpoint: str, now: float = None):
+        """Take the rest of the window of endpoint as spent, once the api
+        refused a call with a rate limit error (88)
+
+        Calls released after a rate limit error no longer count, the
+        budget would otherwise look available again.
+        """
+        now = now if now is not None else time.time()
+        url = self.endpoint_url(endpoint)
+        with self._lock:
+            limit = self.api.rate_limit.get_limit(url)
+            self.api.rate_limit.set_limit(
+                url=url,
+                limit=limit.limit,
+                remaining=0,
+                reset=limit.reset if limit.reset > now else now + RATE_LIMIT_WINDOW,
+            )
+
+    def release(self, endpoint: str, calls: int = 1):
+        """Release calls reserved to endpoint, once their response is in (its
+        rate limit headers then count them) or they failed"""
+        with self._lock:
+            self._in_flight[endpoint] = max(self._in_flight.get(endpoint, 0) - calls, 0)
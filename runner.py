@@ -1,19 +1,122 @@
+import argparse
+import signal
 import sys
 import time
+from functools import partial
+from threading import Event
 
 from filelock import FileLock, Timeout
 
+from capture_backend import close_capture_backend
 from chronicler import run_chronicler
+from config import INGESTION_MODE, SCAN_INTERVAL
 from _logger import get_module_logger
+from freshness import FRESHNESS_TRACKER
+from metrics import METRICS
+from profiler import PROFILER
+from state_store import STATE_STORE
+from stream_ingestion import StreamConsumer
 
 LOGGER = get_module_logger(__name__)
 SCRIPT_TIMEOUT = 10
 
 
-def main():
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the twitter chronicler")
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="run a single scan and exit (for use with cron)",
+    )
+    return parser.parse_args(args)
+
+
+def run_once(stop_event: Event = None, poll_all: bool = False):
+    start_time = time.perf_counter()
+    run_started_at = time.time()
+    metrics_before_run = METRICS.snapshot()
+    PROFILER.start_run()
+    try:
+        run_chronicler(stop_event=stop_event, poll_all=poll_all)
+    finally:
+        elapsed = time.perf_counter() - start_time
+        LOGGER.info(f"{__file__} executed in {elapsed:0.2f} seconds.")
+        LOGGER.info(METRICS.summary(since=metrics_before_run))
+        PROFILER.finish_run(elapsed=elapsed)
+        FRESHNESS_TRACKER.report(posted_since=run_started_at)
+        try:
+            METRICS.write_prometheus_file()
+        except OSError:
+            LOGGER.exception("Unable to write the metrics file")
+
+
+def run_daemon():
+    """Run a scan every SCAN_INTERVAL seconds until SIGTERM or SIGINT
+
+    API clients, the state store and the browsers stay warm between
+    scans. A signal lets the users already being scanned finish, skips
+    the others and then shuts down the browsers.
+    """
+    stop_event = Event()
+
+    def request_stop(signum, frame):
+        LOGGER.info(f"Received signal {signum}, stopping after current scan")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    LOGGER.info(f"Starting daemon, scanning every {SCAN_INTERVAL} seconds")
+    try:
+        while not stop_event.is_set():
+            start_time = time.monotonic()
+            try:
+                run_once(stop_event=stop_event)
+            except Exception:
+                LOGGER.exception("Scan failed")
+            elapsed = time.monotonic() - start_time
+            stop_event.wait(max(SCAN_INTERVAL - elapsed, 0))
+    finally:
+        close_capture_backend()
+        STATE_STORE.close()
+        LOGGER.info("Daemon stopped")
+
+
+def run_stream():
+    """Chronicle the tweets of the stream of the followed users until SIGTERM
+
+    Every (re)connection to the stream polls every user first, as a run,
+    to fill the gap since the last tweet read (see stream_ingestion).
+    """
+    stop_event = Event()
+    consumer = StreamConsumer(fill_gap=partial(run_once, poll_all=True))
+
+    def request_stop(signum, frame):
+        LOGGER.info(f"Received signal {signum}, disconnecting from the stream")
+        stop_event.set()
+        consumer.stop()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    LOGGER.info("Starting daemon, reading the stream of the followed users")
+    try:
+        consumer.run(stop_event=stop_event)
+    finally:
+        close_capture_backend()
+        STATE_STORE.close()
+        LOGGER.info("Daemon stopped")
+
+
+def main(once: bool = False):
     try:
         with FileLock(f"{__file__}.lock", timeout=SCRIPT_TIMEOUT):
-            run_chronicler()
+            if once:
+                run_once()
+            elif INGESTION_MODE == "stream":
+                run_stream()
+            else:
+                run_daemon()
     except Timeout:
         LOGGER.info(
             f"Another instance of this application currently holds the lock. "
@@ -23,7 +126,4 @@ def main():
 
 
 if __name__ == "__main__":
-    start_time = time.perf_counter()
-    main()
-    elapsed = time.perf_counter() - start_time
-    LOGGER.info(f"{__file__} executed in {elapsed:0.2f} seconds.")
+    main(once=parse_args().once)
@@ -0,0 +1,562 @@
+"""state_store.py
+
+SQLite backed storage for the state the bot keeps between runs.
+
+A single database (in WAL mode) holds what used to be spread across a
+text file per followed user, a lock file per followed user and the
+list_of_status_ids_replied_to.txt file:
+
+    * the last status id checked for each user
+    * the gaps left in the timeline of a user that posted more tweets
+      between two polls than a poll asks for, while they are backfilled
+    * the ids of the statuses that have been replied to, along with the
+      tweet each of them quoted and the thread they belong to
+    * a record of every screenshot taken
+    * when each user should be polled next
+    * the replies waiting to be posted
+    * when each collected tweet was detected and replied to
+    * the locks that keep overlapping runs away from the same user
+
+The replied to status ids are kept in an indexed table so that checking
+a status is a single lookup no matter how many statuses have been
+replied to over time.
+"""
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import PosixPath
+from threading import RLock, local
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from config import (
+    CHECKED_STATUSES_DIR_PATH,
+    LIST_OF_STATUS_IDS_REPLIED_TO_FILE,
+    STATE_DB_FILE,
+)
+from _logger import get_module_logger
+from util import file_reader, read_last_line
+
+LOGGER = get_module_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS replied_to (
+    status_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS reply_threads (
+    status_id INTEGER PRIMARY KEY,
+    quoted_tweet_id INTEGER NOT NULL,
+    conversation_root_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reply_threads_quotes
+    ON reply_threads (conversation_root_id, quoted_tweet_id);
+CREATE TABLE IF NOT EXISTS last_status_checked (
+    user TEXT PRIMARY KEY,
+    status_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS backfill_gaps (
+    user TEXT NOT NULL,
+    since_id INTEGER NOT NULL,
+    max_id INTEGER NOT NULL,
+    fetched INTEGER NOT NULL,
+    PRIMARY KEY (user, since_id)
+);
+CREATE TABLE IF NOT EXISTS captures (
+    status_id INTEGER PRIMARY KEY,
+    quoted_tweet_id INTEGER,
+    file_path TEXT,
+    captured_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS poll_schedule (
+    user TEXT PRIMARY KEY,
+    interval REAL NOT NULL,
+    next_poll_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS post_queue (
+    status_id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    status_json TEXT NOT NULL,
+    file_path TEXT,
+    queued_at REAL NOT NULL,
+    replied_to_status_id INTEGER,
+    priority REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tweet_timings (
+    status_id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    detected_at REAL NOT NULL,
+    posted_at REAL
+);
+CREATE INDEX IF NOT EXISTS tweet_timings_posted_at ON tweet_timings (posted_at);
+CREATE TABLE IF NOT EXISTS user_locks (
+    user TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+# Columns added to the tables of an existing database, with how to fill them
+MIGRATIONS = (
+    (
+        "post_queue",
+        "replied_to_status_id",
+        "ALTER TABLE post_queue ADD COLUMN replied_to_status_id INTEGER",
+    ),
+    (
+        "post_queue",
+        "priority",
+        "ALTER TABLE post_queue ADD COLUMN priority REAL NOT NULL DEFAULT 0;"
+        "UPDATE post_queue SET priority = created_at",
+    ),
+)
+LOCK_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class StateStore:
+    """State of the bot kept in a single SQLite database
+
+    A StateStore can be shared by threads, every statement holds the
+    store's lock. Writes made inside ``batch()`` are buffered per thread
+    and committed together in one transaction when the block exits.
+
+    Membership tests are supported so a store can be passed wherever a
+    list of replied to status ids used to be:
+
+        >>> "1236873389073141760" in store
+        True
+    """
+
+    def __init__(self, db_file: Union[PosixPath, str]):
+        self.db_file = db_file
+        self._lock = RLock()
+        self._local = local()
+        self._connection = sqlite3.connect(
+            str(db_file), check_same_thread=False, isolation_level=None, timeout=30
+        )
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """Add the columns missing from a database created by an older version"""
+        for table, column, script in MIGRATIONS:
+            columns = {
+                row[1]
+                for row in self._connection.execute(f"PRAGMA table_info({table})")
+            }
+            if column not in columns:
+                LOGGER.info(f"Adding column {column} to table {table}")
+                self._connection.executescript(script)
+
+    def __contains__(self, status_id: Union[int, str]) -> bool:
+        return self.has_replied_to(status_id)
+
+    def _fetchone(self, sql: str, parameters=()) -> Optional[Tuple]:
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchone()
+
+    def _write(self, sql: str, parameters=()):
+        """Run the statement now or add it to the batch of this thread"""
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            self._write_many([(sql, parameters)])
+        else:
+            pending.append((sql, parameters))
+
+    def _write_many(self, statements: List[Tuple[str, Tuple]]):
+        """Run the statements in a single transaction"""
+        if not statements:
+            return
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parameters in statements:
+                    self._connection.execute(sql, parameters)
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    @contextmanager
+    def batch(self) -> Iterator["StateStore"]:
+        """Commit the writes of the with block in one transaction
+
+        Writes are committed even if the block raises, so that progress
+        made before the error (e.g. tweets already replied to) is kept.
+        Nested batches join the outer batch.
+        """
+        if getattr(self._local, "pending", None) is not None:
+            yield self
+            return
+        self._local.pending = []
+        try:
+            yield self
+        finally:
+            pending, self._local.pending = self._local.pending, None
+            LOGGER.debug(f"Committing {len(pending)} writes to {self.db_file}")
+            self._write_many(pending)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._fetchone("SELECT value FROM meta WHERE key = ?", (key,))
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self._write("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def has_replied_to(self, status_id: Union[int, str]) -> bool:
+        """Return True if the status has already been replied to"""
+        if not status_id:
+            return False
+        row = self._fetchone(
+            "SELECT 1 FROM replied_to WHERE status_id = ?", (int(status_id),)
+        )
+        return row is not None
+
+    def add_replied_to(self, status_id: Union[int, str]):
+        """Record that the status has been replied to"""
+        LOGGER.debug(msg=f"Adding {status_id} to {self.db_file}")
+        self._write("INSERT OR IGNORE INTO replied_to VALUES (?)", (int(status_id),))
+
+    def add_reply_thread(
+        self,
+        status_id: Union[int, str],
+        quoted_tweet_id: Union[int, str],
+        conversation_root_id: Union[int, str],
+    ):
+        """Record the tweet quoted by a replied to status and its thread
+
+        The row is committed right away, even in a batch, so that the next
+        reply of the thread finds it (see get_conversation_root_id).
+        """
+        self._write_many(
+            [
+                (
+                    "INSERT OR REPLACE INTO reply_threads VALUES (?, ?, ?)",
+                    (int(status_id), int(quoted_tweet_id), int(conversation_root_id)),
+                )
+            ]
+        )
+
+    def get_reply_thread(self, status_id: Union[int, str]) -> Optional[Tuple[int, int]]:
+        """Return (quoted_tweet_id, conversation_root_id) of a replied to status"""
+        if not status_id:
+            return None
+        return self._fetchone(
+            "SELECT quoted_tweet_id, conversation_root_id FROM reply_threads "
+            "WHERE status_id = ?",
+            (int(status_id),),
+        )
+
+    def is_quoted_in_thread(
+        self, conversation_root_id: Union[int, str], quoted_tweet_id: Union[int, str]
+    ) -> bool:
+        """Return True if a replied to status of the thread quoted the tweet"""
+        row = self._fetchone(
+            "SELECT 1 FROM reply_threads "
+            "WHERE conversation_root_id = ? AND quoted_tweet_id = ?",
+            (int(conversation_root_id), int(quoted_tweet_id)),
+        )
+        return row is not None
+
+    def count_replied_to(self) -> int:
+        return self._fetchone("SELECT COUNT(*) FROM replied_to")[0]
+
+    def get_last_status_id(self, user: str) -> Optional[int]:
+        """Return the id of the newest status checked for user"""
+        row = self._fetchone(
+            "SELECT status_id FROM last_status_checked WHERE user = ?", (user,)
+        )
+        latest_status_id = row[0] if row else None
+        LOGGER.debug(f"Last status id checked for {user} {latest_status_id}")
+        return latest_status_id
+
+    def set_last_status_id(self, user: str, status_id: Union[int, str]):
+        """Record the id of the newest status checked for user"""
+        self._write(
+            "INSERT OR REPLACE INTO last_status_checked VALUES (?, ?)",
+            (user, int(status_id)),
+        )
+
+    def set_backfill_gap(
+        self,
+        user: str,
+        since_id: Union[int, str],
+        max_id: Union[int, str],
+        fetched: int,
+    ):
+        """Record that the tweets of user from max_id down to since_id are missing
+
+        A gap is known by its since_id, which stays the same while max_id
+        moves down as the gap is backfilled. fetched is the number of
+        tweets of the gap fetched so far.
+        """
+        self._write(
+            "INSERT OR REPLACE INTO backfill_gaps VALUES (?, ?, ?, ?)",
+            (user, int(since_id), int(max_id), fetched),
+        )
+
+    def get_backfill_gaps(self, user: str) -> List[Tuple[int, int, int]]:
+        """Return the (since_id, max_id, fetched) of the gaps of user, newest first"""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT since_id, max_id, fetched FROM backfill_gaps "
+                "WHERE user = ? ORDER BY since_id DESC",
+                (user,),
+            ).fetchall()
+
+    def get_users_with_backfill_gaps(self) -> Set[str]:
+        with self._lock:
+            return {
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT DISTINCT user FROM backfill_gaps"
+                )
+            }
+
+    def remove_backfill_gap(self, user: str, since_id: Union[int, str]):
+        self._write(
+            "DELETE FROM backfill_gaps WHERE user = ? AND since_id = ?",
+            (user, int(since_id)),
+        )
+
+    def add_capture(
+        self,
+        status_id: Union[int, str],
+        quoted_tweet_id: Union[int, str],
+        file_path: str,
+    ):
+        """Record the screenshot taken of the tweet quoted by status_id"""
+        self._write(
+            "INSERT OR REPLACE INTO captures VALUES (?, ?, ?, ?)",
+            (int(status_id), quoted_tweet_id, file_path, time.time()),
+        )
+
+    def get_capture_file_path(self, status_id: Union[int, str]) -> Optional[str]:
+        row = self._fetchone(
+            "SELECT file_path FROM captures WHERE status_id = ?", (int(status_id),)
+        )
+        return row[0] if row else None
+
+    def add_tweet_detected(
+        self,
+        status_id: Union[int, str],
+        user: str,
+        created_at: float,
+        detected_at: float,
+    ):
+        """Record when a tweet to collect was created and detected"""
+        self._write(
+            "INSERT OR IGNORE INTO tweet_timings VALUES (?, ?, ?, ?, NULL)",
+            (int(status_id), user, created_at, detected_at),
+        )
+
+    def set_tweet_posted_at(self, status_id: Union[int, str], posted_at: float):
+        """Record when the reply to a collected tweet was posted"""
+        self._write(
+            "UPDATE tweet_timings SET posted_at = ? WHERE status_id = ?",
+            (posted_at, int(status_id)),
+        )
+
+    def get_tweet_timings(
+        self, posted_since: float
+    ) -> List[Tuple[int, str, float, float, Optional[float], float]]:
+        """Return the timings of the tweets replied to since posted_since
+
+        Returns:
+            (status_id, user, created_at, detected_at, captured_at, posted_at)
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT t.status_id, t.user, t.created_at, t.detected_at, "
+                "c.captured_at, t.posted_at FROM tweet_timings t "
+                "LEFT JOIN captures c ON c.status_id = t.status_id "
+                "WHERE t.posted_at >= ? ORDER BY t.posted_at",
+                (posted_since,),
+            ).fetchall()
+
+    def get_poll_schedules(self) -> Dict[str, Tuple[float, float]]:
+        """Return the (interval, next_poll_at) of every scheduled user"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT user, interval, next_poll_at FROM poll_schedule"
+            ).fetchall()
+        return {user: (interval, next_poll_at) for user, interval, next_poll_at in rows}
+
+    def get_poll_schedule(self, user: str) -> Optional[Tuple[float, float]]:
+        """Return the (interval, next_poll_at) of user"""
+        return self._fetchone(
+            "SELECT interval, next_poll_at FROM poll_schedule WHERE user = ?", (user,)
+        )
+
+    def set_poll_schedule(self, user: str, interval: float, next_poll_at: float):
+        self._write(
+            "INSERT OR REPLACE INTO poll_schedule VALUES (?, ?, ?)",
+            (user, interval, next_poll_at),
+        )
+
+    def queue_post(
+        self,
+        status_id: Union[int, str],
+        created_at: float,
+        status_json: str,
+        file_path: str,
+        replied_to_status_id: Optional[Union[int, str]] = None,
+        priority: Optional[float] = None,
+    ):
+        """Add a status to reply to, with the screenshot to reply with
+
+        Statuses with a higher priority are posted first, the priority
+        defaults to created_at (freshest first).
+        """
+        self._write(
+            "INSERT OR IGNORE INTO post_queue (status_id, created_at, status_json, "
+            "file_path, queued_at, replied_to_status_id, priority) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                int(status_id),
+                created_at,
+                status_json,
+                file_path,
+                time.time(),
+                int(replied_to_status_id) if replied_to_status_id else None,
+                priority if priority is not None else created_at,
+            ),
+        )
+
+    def get_queued_posts(self, limit: int) -> List[Tuple[str, str]]:
+        """Return the (status_json, file_path) of the queued statuses to post
+        first, by priority
+
+        A reply to a status of the same thread that is still queued is left
+        out until that status is posted, so the replies of a thread go out
+        in the order they were tweeted.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT status_json, file_path FROM post_queue AS queued "
+                "WHERE NOT EXISTS (SELECT 1 FROM post_queue AS parent "
+                "WHERE parent.status_id = queued.replied_to_status_id) "
+                "ORDER BY priority DESC, created_at, status_id LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+    def remove_queued_post(self, status_id: Union[int, str]):
+        self._write("DELETE FROM post_queue WHERE status_id = ?", (int(status_id),))
+
+    def count_queued_posts(self) -> int:
+        return self._fetchone("SELECT COUNT(*) FROM post_queue")[0]
+
+    def lock_user(self, user: str, ttl: int, owner: str = LOCK_OWNER) -> bool:
+        """Try to take the lock of a user for ttl seconds
+
+        Returns:
+            True if the lock was taken (or already held by owner)
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT owner, expires_at FROM user_locks WHERE user = ?", (user,)
+                ).fetchone()
+                if row and row[0] != owner and row[1] > now:
+                    locked = False
+                else:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO user_locks VALUES (?, ?, ?)",
+                        (user, owner, now + ttl),
+                    )
+                    locked = True
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        return locked
+
+    def renew_user_lock(self, user: str, ttl: int, owner: str = LOCK_OWNER) -> bool:
+        """Extend the lock of a user held by owner to ttl seconds from now
+
+        Returns:
+            False if owner no longer holds the lock, e.g. it expired and was
+            taken by another owner
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE user_locks SET expires_at = ? WHERE user = ? AND owner = ?",
+                (time.time() + ttl, user, owner),
+            )
+        return cursor.rowcount == 1
+
+    def unlock_user(self, user: str, owner: str = LOCK_OWNER):
+        """Release the lock of a user held by owner"""
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM user_locks WHERE user = ? AND owner = ?", (user, owner)
+            )
+
+    def import_replied_to_file(self, file: PosixPath) -> int:
+        """Copy the status ids of a list_of_status_ids_replied_to.txt file
+
+        Returns:
+            Number of status ids read from the file
+        """
+        status_ids = [int(line) for line in file_reader(file) if line.strip()]
+        with self.batch():
+            for status_id in status_ids:
+                self.add_replied_to(status_id=status_id)
+        LOGGER.info(f"Imported {len(status_ids)} replied to status ids from {file}")
+        return len(status_ids)
+
+    def import_checked_statuses_dir(self, dir_path: PosixPath) -> int:
+        """Copy the last status id of every <user>.txt file in dir_path
+
+        Users that already have a last status id in the store are skipped.
+
+        Returns:
+            Number of users imported
+        """
+        imported_users = 0
+        with self.batch():
+            for status_file in dir_path.glob("*.txt"):
+                user = status_file.stem
+                last_line = read_last_line(file_path=str(status_file))
+                if last_line and self.get_last_status_id(user=user) is None:
+                    self.set_last_status_id(user=user, status_id=last_line)
+                    imported_users += 1
+        LOGGER.info(f"Imported last status id of {imported_users} users")
+        return imported_users
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def import_legacy_state(state_store: StateStore):
+    """Import the text files used before the state store existed"""
+    if LIST_OF_STATUS_IDS_REPLIED_TO_FILE.exists():
+        state_store.import_replied_to_file(file=LIST_OF_STATUS_IDS_REPLIED_TO_FILE)
+    if CHECKED_STATUSES_DIR_PATH.exists():
+        state_store.import_checked_statuses_dir(dir_path=CHECKED_STATUSES_DIR_PATH)
+    state_store.set_meta("legacy_state_imported", "1")
+
+
+def open_state_store(db_file: PosixPath = STATE_DB_FILE) -> StateStore:
+    """Open the state store, importing the legacy text files the first time"""
+    state_store = StateStore(db_file=db_file)
+    if not state_store.get_meta("legacy_state_imported"):
+        import_legacy_state(state_store=state_store)
+    return state_store
+
+
+STATE_STORE = open_state_store()
+
+
+if __name__ == "__main__":
+    import_legacy_state(state_store=STATE_STORE)
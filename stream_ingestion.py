@@ -0,0 +1,279 @@
+"""stream_ingestion.py
+
+Chronicle the tweets of the followed users as they are tweeted.
+
+With INGESTION_MODE = stream the runner keeps a connection to the
+statuses/filter stream, following the ids of the users to follow, instead
+of polling their timelines. Every tweet of a followed user goes through
+process_tweet, the capture backend and the post queue as it arrives (see
+chronicle_new_tweet).
+
+A connection that fails or drops is retried after STREAM_BACKOFF_MIN
+seconds, twice as long after every further failure or drop, up to
+STREAM_BACKOFF_MAX. The wait starts over from STREAM_BACKOFF_MIN after a
+connection that stayed up for STREAM_BACKOFF_MAX seconds. Once connected
+the timelines of the users are polled to fill the gap since the last
+tweet read, before the tweets of the stream are chronicled. The users to
+follow are read again on every (re)connection.
+
+The stream is read with the default read credential, point API_STREAM_URL
+at tests/fake_twitter_api.py to run against a local stream of JSON lines.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Event, Thread
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+from twitter import Api, Status, TwitterError
+
+from chronicler import chronicle_new_tweet, run_chronicler
+from config import (
+    API_URLS,
+    FAST_DECODE,
+    READ_API_CREDENTIALS,
+    STREAM_BACKOFF_MAX,
+    STREAM_BACKOFF_MIN,
+    STREAM_POST_INTERVAL,
+    STREAM_QUEUE_SIZE,
+    STREAM_TIMEOUT,
+    read_list_of_users_to_follow,
+)
+from _logger import get_module_logger
+from metrics import InstrumentedApi
+from post_queue import POST_QUEUE
+from profiler import PROFILER
+from tweet_decoder import loads
+from twitter_helpers import lookup_users
+from wrapped_tweet import Tweet
+
+LOGGER = get_module_logger(__name__)
+# Maximum number of user ids a filter stream follows
+STREAM_MAX_FOLLOW = 5000
+
+
+def get_user_ids(users: List[str]) -> Dict[int, str]:
+    """Look up the ids of users (the first STREAM_MAX_FOLLOW of them)
+
+    Returns:
+        The users that exist by user id
+    """
+    if len(users) > STREAM_MAX_FOLLOW:
+        LOGGER.warning(
+            f"Only the first {STREAM_MAX_FOLLOW} of {len(users)} users "
+            f"can be followed by the stream"
+        )
+    users = users[:STREAM_MAX_FOLLOW]
+    found_users = lookup_users(screen_names=users)
+    user_ids = {}
+    for user in users:
+        found_user = found_users.get(user.lower())
+        if found_user:
+            user_ids[found_user["id"]] = user
+        else:
+            LOGGER.info(f"@{user} cannot be looked up, not following it")
+    return user_ids
+
+
+def open_filter_stream(api: Api, follow: Iterable[int]) -> requests.Response:
+    """Connect to the statuses/filter stream of the users ids in follow
+
+    Api.GetStreamFilter hides the response, which is needed to check its
+    status and to close the connection from another thread (see
+    StreamConsumer.stop), so this is the one place the stream is opened
+    with python-twitter's private Api._RequestStream. python-twitter is
+    pinned in requirements.txt, and test_open_filter_stream checks the
+    pinned version is the one installed.
+
+    Raises:
+        TwitterError: the stream could not be connected to
+    """
+    response = api._RequestStream(
+        f"{api.stream_url}/statuses/filter.json",
+        "POST",
+        data={
+            "follow": ",".join(str(user_id) for user_id in follow),
+            "stall_warnings": "true",
+        },
+    )
+    if response.status_code != 200:
+        response.close()
+        raise TwitterError(
+            f"HTTP {response.status_code} {response.reason}: {response.text}"
+        )
+    return response
+
+
+class StreamConsumer:
+    """Chronicle the tweets of the filter stream of the followed users
+
+    The tweets are chronicled one at a time, in the order they arrive, by
+    a worker thread, so a slow capture does not hold up reading the
+    stream. Once queue_size tweets are waiting, reading the stream waits
+    for the worker (Twitter disconnects a stream that falls too far
+    behind, and the gap is then filled by polling). The post queue is
+    also drained by the worker every post_interval seconds, so the replies
+    still queued are posted in the quiet periods of the stream.
+    """
+
+    def __init__(
+        self,
+        api: InstrumentedApi = None,
+        fill_gap: Callable[..., None] = None,
+        chronicle: Callable[[str, Tweet], None] = chronicle_new_tweet,
+        backoff_min: float = STREAM_BACKOFF_MIN,
+        backoff_max: float = STREAM_BACKOFF_MAX,
+        queue_size: int = STREAM_QUEUE_SIZE,
+        post_queued: Callable[[], int] = POST_QUEUE.post_queued,
+        post_interval: float = STREAM_POST_INTERVAL,
+    ):
+        """
+        Args:
+            api: client of the stream, defaults to the default read
+                credential with a STREAM_TIMEOUT read timeout
+            fill_gap: polls the users after a connection, called with
+                stop_event (defaults to run_chronicler of every user)
+            chronicle: chronicles a tweet of a user
+            queue_size: tweets waiting for chronicle at most
+            post_queued: posts the queued tweets the posting budget allows
+        """
+        self.api = api or InstrumentedApi(
+            client_name="stream",
+            timeout=STREAM_TIMEOUT,
+            **READ_API_CREDENTIALS["default"],
+            **API_URLS,
+        )
+        self.fill_gap = fill_gap or (
+            lambda stop_event: run_chronicler(stop_event=stop_event, poll_all=True)
+        )
+        self.chronicle = chronicle
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream")
+        self._queue_slots = BoundedSemaphore(queue_size)
+        self.post_queued = post_queued
+        self.post_interval = post_interval
+        self._response: Optional[requests.Response] = None
+        self._stopped = Event()
+
+    def run(self, stop_event: Event):
+        """Read the stream, reconnecting with backoff, until stop_event is set"""
+        backoff = self.backoff_min
+        self._stopped.clear()
+        drainer = Thread(target=self.drain_post_queue, name="stream-post")
+        drainer.start()
+        try:
+            while not stop_event.is_set():
+                connected_at = time.monotonic()
+                try:
+                    user_ids = get_user_ids(users=read_list_of_users_to_follow())
+                    self.consume(user_ids=user_ids, stop_event=stop_event)
+                except (TwitterError, requests.RequestException) as error:
+                    LOGGER.error(f"Unable to connect to the stream. {error}")
+                if stop_event.is_set():
+                    break
+                if time.monotonic() - connected_at >= self.backoff_max:
+                    # a drop after a stable connection is not a repeated drop
+                    backoff = self.backoff_min
+                LOGGER.info(f"Reconnecting to the stream in {backoff} seconds")
+                stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+        finally:
+            self._stopped.set()
+            drainer.join()
+            self.executor.shutdown(wait=True)
+
+    def stop(self):
+        """Close the connection, e.g. from a signal handler"""
+        response = self._response
+        if response is not None:
+            response.close()
+
+    def consume(self, user_ids: Dict[int, str], stop_event: Event) -> int:
+        """Connect to the stream and chronicle its tweets until it ends
+
+        A gap fill is queued before the first tweet, so the tweets missed
+        while disconnected are chronicled before the ones of the stream.
+
+        Returns:
+            Number of messages received
+
+        Raises:
+            TwitterError: the stream could not be connected to
+        """
+        if not user_ids:
+            raise TwitterError("None of the users to follow could be looked up")
+        response = open_filter_stream(api=self.api, follow=user_ids)
+        LOGGER.info(f"Connected to the stream, following {len(user_ids)} users")
+        self._response = response
+        self.submit(self.run_fill_gap, stop_event)
+        messages = 0
+        try:
+            for line in response.iter_lines():
+                if stop_event.is_set():
+                    break
+                if line:
+                    messages += 1
+                    self.handle_message(message=loads(line), user_ids=user_ids)
+        except Exception as error:
+            if not stop_event.is_set():
+                LOGGER.warning(
+                    f"Stream disconnected after {messages} messages. {error}"
+                )
+        finally:
+            self._response = None
+            response.close()
+        return messages
+
+    def submit(self, function: Callable, *args):
+        """Queue function for the worker, waiting while the queue is full"""
+        self._queue_slots.acquire()
+        self.executor.submit(function, *args).add_done_callback(
+            lambda _: self._queue_slots.release()
+        )
+
+    def drain_post_queue(self):
+        """Queue a drain of the post queue every post_interval seconds"""
+        while not self._stopped.wait(self.post_interval):
+            self.submit(self.run_post_queued)
+
+    def run_post_queued(self):
+        try:
+            with PROFILER.stage("post"):
+                self.post_queued()
+        except Exception:
+            LOGGER.exception("Unable to post the queued tweets")
+
+    def run_fill_gap(self, stop_event: Event):
+        try:
+            self.fill_gap(stop_event=stop_event)
+        except Exception:
+            LOGGER.exception("Unable to poll the users after connecting")
+
+    def handle_message(self, message: Dict, user_ids: Dict[int, str]):
+        """Queue the tweets of the followed users, log the notices
+
+        A follow stream also delivers the replies to and retweets of the
+        followed users by other users, these are left out.
+        """
+        if "id" in message and "user" in message:
+            user = user_ids.get(message["user"]["id"])
+            if user:
+                tweet = (
+                    Tweet.from_json(message)
+                    if FAST_DECODE
+                    else Status.NewFromJsonDict(message)
+                )
+                self.submit(self.run_chronicle, user, tweet)
+        elif "disconnect" in message:
+            LOGGER.warning(f"Stream disconnect notice: {message['disconnect']}")
+        elif "warning" in message:
+            LOGGER.warning(f"Stream stall warning: {message['warning']}")
+        elif "limit" in message:
+            LOGGER.warning(f"Stream limit notice: {message['limit']}")
+
+    def run_chronicle(self, user: str, tweet: Tweet):
+        try:
+            self.chronicle(user, tweet)
+        except Exception:
+            LOGGER.exception(f"Collection failed for user: @{user}")
@@ -0,0 +1,105 @@
+"""bench_decoder.py
+
+Benchmark decoding a user timeline response into Tweets:
+
+    * status - json.loads, Status.NewFromJsonDict and Tweet(status), the
+               path of GetUserTimeline and process_tweet
+    * fast   - decode_timeline (FAST_DECODE), straight into Tweet records
+
+The timeline is made of the statuses of the status.json fixtures, repeated
+to the size asked for. The throughput (statuses per second) and the memory
+(peak KB allocated per 1000 statuses) of both are printed.
+
+Usage (from the project directory):
+
+    python -m tests.benchmarks.bench_decoder --sizes 200 10000
+"""
+import argparse
+import json
+import logging
+import sys
+from typing import Callable, Dict, List
+
+from twitter import Api, Status
+
+from config import TEST_JSON_FILE
+from tests.benchmarks.bench_pipeline import measure
+from tweet_decoder import decode_timeline, loads
+from util import fetch_test_data_file
+from wrapped_tweet import Tweet
+
+
+def build_timeline(size: int) -> bytes:
+    """Return a timeline response of size statuses made of the fixtures"""
+    fixtures = [
+        fixture
+        for fixture in fetch_test_data_file(file=TEST_JSON_FILE).values()
+        if isinstance(fixture, dict) and "user" in fixture
+    ]
+    timeline = []
+    for index in range(size):
+        status = dict(fixtures[index % len(fixtures)])
+        status["id"] = 1300000000000000000 + index
+        status["id_str"] = str(status["id"])
+        timeline.append(status)
+    return json.dumps(timeline).encode()
+
+
+def decode_statuses(content: bytes) -> List[Tweet]:
+    return [
+        Tweet(Status.NewFromJsonDict(status))
+        for status in json.loads(content.decode("utf-8"))
+    ]
+
+
+def benchmark(content: bytes, size: int, repeat: int) -> Dict[str, Dict]:
+    api = Api()
+    decoders: Dict[str, Callable[[], List[Tweet]]] = {
+        "status": lambda: decode_statuses(content),
+        "fast": lambda: decode_timeline(api=api, content=content),
+    }
+    results = {}
+    for name, decode in decoders.items():
+        peak_bytes = measure(decode, trace_memory=True)["peak_bytes"]
+        seconds = min(
+            measure(decode, trace_memory=False)["seconds"] for _ in range(repeat)
+        )
+        results[name] = {
+            "statuses_per_second": size / seconds,
+            "peak_kb_per_1k_statuses": peak_bytes / 1024 / (size / 1000),
+        }
+    return results
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 10000])
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timed runs, the fastest is kept"
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    logging.disable(logging.CRITICAL)
+    print(f"json parser: {loads.__module__}")
+    for size in options.sizes:
+        results = benchmark(
+            content=build_timeline(size=size), size=size, repeat=options.repeat
+        )
+        for name, stats in results.items():
+            print(
+                f"{size:>9} {name:<8} "
+                f"{stats['statuses_per_second']:>12.1f} statuses/s "
+                f"{stats['peak_kb_per_1k_statuses']:>10.1f} KB/1k statuses"
+            )
+        speed_up = (
+            results["fast"]["statuses_per_second"]
+            / results["status"]["statuses_per_second"]
+        )
+        print(f"{size:>9} fast path is {speed_up:0.1f}x faster")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
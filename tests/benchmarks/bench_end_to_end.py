@@ -0,0 +1,296 @@
+"""bench_end_to_end.py
+
+Drive run_chronicler end to end against the fake Twitter API server and
+the fake capture backend, to tune the scan, capture and posting settings
+without a browser or the real API.
+
+Every run reports the quoted tweets detected, captured and posted per
+second, the timeline (user or list) and user lookup calls made, the
+stage timings of the run and the depth of the capture queue (captures
+waiting for a worker) and of the post queue, sampled every
+--sample-interval seconds.
+
+Usage (from the project directory):
+
+    python -m tests.benchmarks.bench_end_to_end --users 500 --runs 5 \\
+        --scan-workers 4 --capture-workers 4 --capture-delay 0.5
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+from statistics import mean
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from typing import Dict, List, Tuple
+from unittest.mock import patch
+
+from api_pool import ReadApiPool, ReadClient
+from capture_backend import FakeCaptureBackend
+from chronicler import run_chronicler
+from freshness import FreshnessTracker
+from list_ingestion import FollowList
+from metrics import InstrumentedApi
+from poll_scheduler import PollScheduler
+from post_queue import PostQueue
+from profiler import PROFILER
+from state_store import StateStore
+from tests.fake_twitter_api import FakeTwitter, start_server
+
+
+def get_api(client_name: str, base_url: str) -> InstrumentedApi:
+    return InstrumentedApi(
+        client_name=client_name,
+        consumer_key="key",
+        consumer_secret="secret",
+        access_token_key=client_name,
+        access_token_secret="secret",
+        base_url=base_url,
+        upload_url=base_url,
+    )
+
+
+class QueueSampler(Thread):
+    """Sample the capture and post queue depths in the background"""
+
+    def __init__(
+        self,
+        capture_backend: FakeCaptureBackend,
+        post_queue: PostQueue,
+        interval: float,
+    ):
+        super().__init__(name="queue-sampler", daemon=True)
+        self.capture_backend = capture_backend
+        self.post_queue = post_queue
+        self.interval = interval
+        self.samples: List[Tuple[int, int]] = []
+        self.stop_event = Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.samples.append((self.capture_backend.pending, len(self.post_queue)))
+
+    def stop(self) -> List[Tuple[int, int]]:
+        self.stop_event.set()
+        self.join()
+        return self.samples
+
+
+def run_benchmark(options: argparse.Namespace) -> List[Dict]:
+    """Run the chronicler options.runs times and return the stats of each run"""
+    fake = FakeTwitter(
+        users=options.users,
+        tweet_interval=options.tweet_interval,
+        quote_ratio=options.quote_ratio,
+        rate_limit_error_rate=options.rate_limit_error_rate,
+        block_rate=options.block_rate,
+        latency=options.latency,
+    )
+    server = start_server(fake=fake)
+    base_url = f"http://127.0.0.1:{server.server_port}/1.1"
+    users = [f"user{index}" for index in range(options.users)]
+    results = []
+    with TemporaryDirectory() as temp_dir:
+        state_store = StateStore(db_file=Path(temp_dir).joinpath("bench.db"))
+        capture_backend = FakeCaptureBackend(
+            workers=options.capture_workers,
+            delay=options.capture_delay,
+            failure_rate=options.capture_failure_rate,
+            screenshot_dir=temp_dir,
+        )
+        post_queue = PostQueue(
+            state_store=state_store,
+            capacity=options.post_burst,
+            rate=options.post_rate,
+        )
+        read_api_pool = ReadApiPool(
+            clients=[
+                ReadClient(name=f"read{n}", api=get_api(f"read{n}", base_url))
+                for n in range(options.read_credentials)
+            ]
+        )
+        with patch("twitter_helpers.STATE_STORE", state_store), patch(
+            "twitter_helpers.READ_API_POOL", read_api_pool
+        ), patch("twitter_helpers.tweeter_api", get_api("write", base_url)), patch(
+            "chronicler.STATE_STORE", state_store
+        ), patch(
+            "chronicler.POLL_SCHEDULER",
+            PollScheduler(state_store=state_store, min_interval=options.poll_interval),
+        ), patch(
+            "chronicler.POST_QUEUE", post_queue
+        ), patch(
+            "chronicler.get_capture_backend", lambda: capture_backend
+        ), patch(
+            "chronicler.MAX_SCAN_WORKERS", options.scan_workers
+        ), patch(
+            "chronicler.ACTIVITY_PRECHECK", not options.no_activity_precheck
+        ), patch(
+            "chronicler.INGESTION_MODE", options.ingestion_mode
+        ), patch(
+            "chronicler.FOLLOW_LIST",
+            FollowList(
+                state_store=state_store, api_pool=read_api_pool, client_name="read0"
+            ),
+        ):
+            for run in range(1, options.runs + 1):
+                results.append(
+                    run_once(
+                        run=run,
+                        fake=fake,
+                        users=users,
+                        capture_backend=capture_backend,
+                        post_queue=post_queue,
+                        sample_interval=options.sample_interval,
+                    )
+                )
+                print_result(results[-1])
+                time.sleep(options.interval)
+            freshness = FreshnessTracker(state_store=state_store).stats()
+        capture_backend.close()
+        state_store.close()
+    server.shutdown()
+    server.server_close()
+    print_summary(results=results, freshness=freshness)
+    return results
+
+
+def run_once(
+    run: int,
+    fake: FakeTwitter,
+    users: List[str],
+    capture_backend: FakeCaptureBackend,
+    post_queue: PostQueue,
+    sample_interval: float,
+) -> Dict:
+    captured_before = capture_backend.captured
+    failed_before = capture_backend.failed
+    posted_before = post_queue.posted_total
+    calls_before = fake.stats.copy()
+    sampler = QueueSampler(
+        capture_backend=capture_backend, post_queue=post_queue, interval=sample_interval
+    )
+    PROFILER.start_run()
+    sampler.start()
+    start_time = time.perf_counter()
+    run_chronicler(users=users)
+    elapsed = time.perf_counter() - start_time
+    samples = sampler.stop() or [(0, len(post_queue))]
+    captured = capture_backend.captured - captured_before
+    calls = fake.stats - calls_before
+    return {
+        "run": run,
+        "seconds": elapsed,
+        "detected": captured + capture_backend.failed - failed_before,
+        "captured": captured,
+        "posted": post_queue.posted_total - posted_before,
+        "capture_queue_max": max(sample[0] for sample in samples),
+        "capture_queue_mean": mean(sample[0] for sample in samples),
+        "post_queue_max": max(sample[1] for sample in samples),
+        "post_queue_end": len(post_queue),
+        "timeline_calls": calls["/statuses/user_timeline"] + calls["/lists/statuses"],
+        "user_lookup_calls": calls["/users/lookup"],
+        "stages": {
+            name: stage["seconds"]
+            for name, stage in PROFILER.report(elapsed=elapsed)["stages"].items()
+        },
+    }
+
+
+def print_result(result: Dict):
+    seconds = result["seconds"]
+    print(
+        f"run {result['run']:>3}: {seconds:7.2f}s  "
+        f"detected {result['detected'] / seconds:7.1f}/s  "
+        f"captured {result['captured'] / seconds:7.1f}/s  "
+        f"posted {result['posted'] / seconds:7.1f}/s  "
+        f"capture queue max {result['capture_queue_max']:>5} "
+        f"mean {result['capture_queue_mean']:7.1f}  "
+        f"post queue max {result['post_queue_max']:>5} "
+        f"end {result['post_queue_end']:>5}  "
+        f"timeline calls {result['timeline_calls']:>5} "
+        f"user lookups {result['user_lookup_calls']:>3}  "
+        + " ".join(
+            f"{name}={seconds:0.2f}s"
+            for name, seconds in sorted(result["stages"].items())
+        )
+    )
+
+
+def print_summary(results: List[Dict], freshness: Dict):
+    seconds = sum(result["seconds"] for result in results)
+    totals = {
+        key: sum(result[key] for result in results)
+        for key in ("detected", "captured", "posted")
+    }
+    read_calls = sum(
+        result["timeline_calls"] + result["user_lookup_calls"] for result in results
+    )
+    print(
+        f"total: {seconds:0.2f}s, "
+        + ", ".join(
+            f"{key} {total} ({total / seconds:0.1f}/s)" for key, total in totals.items()
+        )
+        + f", read calls {read_calls}"
+    )
+    if freshness["replies"]:
+        print(
+            "end to end latency: "
+            + " ".join(
+                f"p{percent}={value:0.0f}s"
+                for percent, value in freshness["end_to_end"].items()
+            )
+        )
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--interval", type=float, default=0, help="seconds between two runs"
+    )
+    parser.add_argument("--sample-interval", type=float, default=0.1)
+    # fake Twitter API
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument(
+        "--tweet-interval", type=int, default=60, help="seconds between two tweets"
+    )
+    parser.add_argument("--quote-ratio", type=float, default=0.3)
+    parser.add_argument("--rate-limit-error-rate", type=float, default=0.0)
+    parser.add_argument("--block-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="mean api latency in seconds"
+    )
+    # chronicler settings
+    parser.add_argument("--scan-workers", type=int, default=1)
+    parser.add_argument("--read-credentials", type=int, default=1)
+    parser.add_argument("--poll-interval", type=float, default=0)
+    parser.add_argument(
+        "--ingestion-mode", choices=("timelines", "list"), default="timelines"
+    )
+    parser.add_argument(
+        "--no-activity-precheck",
+        action="store_true",
+        help="fetch the timeline of every user due, without a users/lookup first",
+    )
+    parser.add_argument("--capture-workers", type=int, default=1)
+    parser.add_argument(
+        "--capture-delay", type=float, default=0.5, help="seconds per capture"
+    )
+    parser.add_argument("--capture-failure-rate", type=float, default=0.0)
+    parser.add_argument("--post-burst", type=float, default=10)
+    parser.add_argument(
+        "--post-rate", type=float, default=300 / 10800, help="posts per second"
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    # keep the log of every tweet and failed capture out of what gets measured
+    logging.disable(logging.ERROR)
+    run_benchmark(options)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""bench_pipeline.py
+
+Benchmark the detection pipeline on synthetic timelines, offline.
+
+Measures the throughput (statuses per second) and the memory (peak KB
+allocated per 1000 statuses) of:
+
+    * tweet              - Tweet(status)
+    * process_tweet      - process_tweet on every status
+    * find_quoted_tweets - find_quoted_tweets for every user, with
+                           GetUserTimeline and GetStatuses mocked out
+
+Each run is appended to results.jsonl and compared with the previous
+run of the same size and ratios, so that regressions show up over time.
+
+Usage (from the project directory):
+
+    python -m tests.benchmarks.bench_pipeline --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, List
+from unittest.mock import patch
+
+from state_store import StateStore
+from tests.benchmarks.synthetic_timeline import SyntheticTimeline, TimelineChunk
+from twitter_helpers import find_quoted_tweets, process_tweet
+from wrapped_tweet import Tweet
+
+RESULTS_FILE = Path(__file__).parent.joinpath("results.jsonl")
+STAGES = ("tweet", "process_tweet", "find_quoted_tweets")
+
+
+def run_stage(stage: str, chunk: TimelineChunk, state_store: StateStore) -> List:
+    """Run stage on the statuses of chunk and return what it produced"""
+    if stage == "tweet":
+        return [Tweet(status) for status in chunk.statuses]
+    elif stage == "process_tweet":
+        return [
+            process_tweet(
+                status=status,
+                excluded_ids=state_store,
+                replied_to_statuses=chunk.replied_to_statuses,
+            )
+            for status in chunk.statuses
+        ]
+    elif stage == "find_quoted_tweets":
+        with patch(
+            "twitter.api.Api.GetUserTimeline",
+            side_effect=lambda screen_name, **_: chunk.timelines[screen_name],
+        ), patch(
+            "twitter.api.Api.GetStatuses",
+            side_effect=lambda status_ids, map: {
+                status_id: chunk.replied_to_statuses.get(status_id)
+                for status_id in status_ids
+            },
+        ):
+            return [find_quoted_tweets(user=user) for user in chunk.timelines]
+
+
+def measure(function: Callable[[], None], trace_memory: bool) -> Dict[str, float]:
+    """Return the seconds function took, and its peak memory if traced"""
+    if trace_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start_time
+    peak = 0
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def benchmark(timeline: SyntheticTimeline, chunk_size: int) -> Dict[str, Dict]:
+    """Run every stage on the timeline, one chunk at a time
+
+    Memory is traced on the first chunk only, tracing slows the code down
+    too much to time it at the same time.
+    """
+    totals = {stage: {"seconds": 0.0, "statuses": 0} for stage in STAGES}
+    memory = {}
+    with TemporaryDirectory() as temp_dir:
+        state_store = StateStore(db_file=Path(temp_dir).joinpath("bench.db"))
+        with patch("twitter_helpers.STATE_STORE", state_store):
+            for chunk in timeline.chunks(chunk_size=chunk_size):
+                with state_store.batch():
+                    for status_id in chunk.replied_to_statuses:
+                        state_store.add_replied_to(status_id=status_id)
+                for stage in STAGES:
+                    if stage not in memory:
+                        memory[stage] = measure(
+                            lambda: run_stage(stage, chunk, state_store),
+                            trace_memory=True,
+                        )["peak_bytes"] / (len(chunk.statuses) / 1000)
+                    seconds = measure(
+                        lambda: run_stage(stage, chunk, state_store),
+                        trace_memory=False,
+                    )["seconds"]
+                    totals[stage]["seconds"] += seconds
+                    totals[stage]["statuses"] += len(chunk.statuses)
+        state_store.close()
+
+    return {
+        stage: {
+            "seconds": round(totals[stage]["seconds"], 3),
+            "statuses_per_second": round(
+                totals[stage]["statuses"] / totals[stage]["seconds"], 1
+            ),
+            "peak_kb_per_1k_statuses": round(memory[stage] / 1024, 1),
+        }
+        for stage in STAGES
+    }
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def read_results(results_file: Path = RESULTS_FILE) -> List[Dict]:
+    if not results_file.exists():
+        return []
+    with results_file.open() as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+def compare_with_previous(result: Dict, previous_results: List[Dict], threshold: float):
+    """Print the change of throughput since the previous comparable run"""
+    previous = next(
+        (
+            previous
+            for previous in reversed(previous_results)
+            if previous["size"] == result["size"]
+            and previous["ratios"] == result["ratios"]
+        ),
+        None,
+    )
+    for stage, stats in result["stages"].items():
+        line = (
+            f"{result['size']:>9} {stage:<20} "
+            f"{stats['statuses_per_second']:>12.1f} statuses/s "
+            f"{stats['peak_kb_per_1k_statuses']:>10.1f} KB/1k statuses"
+        )
+        if previous and stage in previous["stages"]:
+            before = previous["stages"][stage]["statuses_per_second"]
+            change = (stats["statuses_per_second"] - before) / before
+            line += f"  {change:+.1%} vs {previous['commit']}"
+            if change < -threshold:
+                line += "  REGRESSION"
+        print(line)
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[2])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--quote-ratio", type=float, default=0.3)
+    parser.add_argument("--reply-ratio", type=float, default=0.1)
+    parser.add_argument("--self-quote-ratio", type=float, default=0.05)
+    parser.add_argument("--tweets-per-user", type=int, default=10)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="slow down (fraction) reported as a regression",
+    )
+    parser.add_argument(
+        "--no-save", action="store_true", help="do not append to results.jsonl"
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    # the pipeline logs every status, which would be what gets measured
+    logging.disable(logging.CRITICAL)
+    ratios = {
+        "quote": options.quote_ratio,
+        "reply": options.reply_ratio,
+        "self_quote": options.self_quote_ratio,
+        "tweets_per_user": options.tweets_per_user,
+    }
+    previous_results = read_results()
+    for size in options.sizes:
+        timeline = SyntheticTimeline(
+            count=size,
+            quote_ratio=options.quote_ratio,
+            reply_ratio=options.reply_ratio,
+            self_quote_ratio=options.self_quote_ratio,
+            tweets_per_user=options.tweets_per_user,
+        )
+        result = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "size": size,
+            "ratios": ratios,
+            "stages": benchmark(timeline=timeline, chunk_size=options.chunk_size),
+        }
+        compare_with_previous(result, previous_results, threshold=options.threshold)
+        if not options.no_save:
+            with RESULTS_FILE.open("a") as results:
+                results.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""synthetic_timeline.py
+
+Build large synthetic timelines out of the status.json test fixtures.
+
+Every synthetic status is a copy of a fixture with a new id and user:
+
+    * quote       - basic_quoted_tweet, quotes another user's tweet
+    * reply       - quoted_tweets_for_tweeted_already_quoted_by_user, quotes a
+                    tweet and replies to a status the bot already replied to
+    * self quote  - quote_users_own_status, quotes the user's own tweet
+    * plain tweet - basic_tweet, no quote (the rest)
+"""
+import random
+from copy import deepcopy
+from typing import Dict, List, NamedTuple
+
+from twitter import Status
+
+from config import TEST_JSON_FILE
+from util import fetch_test_data_file
+
+FIRST_STATUS_ID = 1300000000000000000
+FIRST_REPLIED_TO_STATUS_ID = 1200000000000000000
+QUOTED_STATUS_ID = 1100000000000000000
+
+
+class TimelineChunk(NamedTuple):
+    """Statuses of a chunk of a synthetic timeline"""
+
+    statuses: List[Status]
+    # statuses replied to by the bot that the replies of the chunk reply to
+    replied_to_statuses: Dict[int, Status]
+    # user screen name -> statuses of the user, newest first
+    timelines: Dict[str, List[Status]]
+
+
+class SyntheticTimeline:
+    """Generate a timeline of count statuses in chunks"""
+
+    def __init__(
+        self,
+        count: int,
+        quote_ratio: float = 0.3,
+        reply_ratio: float = 0.1,
+        self_quote_ratio: float = 0.05,
+        tweets_per_user: int = 10,
+        seed: int = 0,
+    ):
+        if quote_ratio + reply_ratio + self_quote_ratio > 1:
+            raise ValueError("The ratios of quotes, replies and self quotes exceed 1")
+        self.count = count
+        self.quote_ratio = quote_ratio
+        self.reply_ratio = reply_ratio
+        self.self_quote_ratio = self_quote_ratio
+        self.tweets_per_user = tweets_per_user
+        self.random = random.Random(seed)
+        fixtures = fetch_test_data_file(file=TEST_JSON_FILE)
+        self.templates = {
+            "quote": fixtures["basic_quoted_tweet"],
+            "reply": fixtures["quoted_tweets_for_tweeted_already_quoted_by_user"],
+            "self_quote": fixtures["quote_users_own_status"],
+            "plain": {
+                key: value
+                for key, value in fixtures["basic_tweet"].items()
+                if not key.startswith("in_reply_to")
+            },
+        }
+
+    def pick_kind(self) -> str:
+        roll = self.random.random()
+        for kind, ratio in (
+            ("quote", self.quote_ratio),
+            ("reply", self.reply_ratio),
+            ("self_quote", self.self_quote_ratio),
+        ):
+            if roll < ratio:
+                return kind
+            roll -= ratio
+        return "plain"
+
+    def build_status(self, index: int, kind: str) -> Dict:
+        status = deepcopy(self.templates[kind])
+        user = f"user{index // self.tweets_per_user}"
+        status["id"] = FIRST_STATUS_ID + index
+        status["id_str"] = str(status["id"])
+        status["user"]["screen_name"] = user
+        if kind == "self_quote":
+            status["quoted_status"]["user"]["screen_name"] = user
+        elif kind == "reply":
+            status["in_reply_to_status_id"] = FIRST_REPLIED_TO_STATUS_ID + index
+            status["in_reply_to_screen_name"] = user
+        return status
+
+    def build_replied_to_status(self, status: Dict) -> Status:
+        """Status the bot replied to, quoting the same tweet half of the time"""
+        replied_to_status = deepcopy(self.templates["quote"])
+        replied_to_status["id"] = status["in_reply_to_status_id"]
+        replied_to_status["id_str"] = str(replied_to_status["id"])
+        if self.random.random() < 0.5:
+            replied_to_status["quoted_status_id"] = status["quoted_status_id"]
+        else:
+            replied_to_status["quoted_status_id"] = QUOTED_STATUS_ID
+        return Status.NewFromJsonDict(replied_to_status)
+
+    def chunks(self, chunk_size: int = 10000):
+        """Yield the timeline chunk_size statuses at a time"""
+        for start in range(0, self.count, chunk_size):
+            statuses = []
+            replied_to_statuses = {}
+            timelines: Dict[str, List[Status]] = {}
+            for index in range(start, min(start + chunk_size, self.count)):
+                status_dict = self.build_status(index=index, kind=self.pick_kind())
+                status = Status.NewFromJsonDict(status_dict)
+                statuses.append(status)
+                timelines.setdefault(status.user.screen_name, []).insert(0, status)
+                if status.in_reply_to_status_id:
+                    replied_to_statuses[
+                        status.in_reply_to_status_id
+                    ] = self.build_replied_to_status(status_dict)
+            yield TimelineChunk(
+                statuses=statuses,
+                replied_to_statuses=replied_to_statuses,
+                timelines=timelines,
+            )
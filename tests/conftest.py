@@ -5,6 +5,8 @@ import pytest
 from twitter import Status, User, Url
 
 from config import TEST_JSON_FILE
+from state_store import StateStore
+from tests.fake_twitter_api import FakeTwitter, start_server
 from util import fetch_test_data_file
 
 
@@ -62,3 +64,22 @@ def get_test_status():
         return fetch_test_data(key_name)
 
     return _get_status
+
+
+@pytest.fixture(name="state_store")
+def get_state_store(tmp_path):
+    return StateStore(db_file=tmp_path.joinpath("chronicler.db"))
+
+
+@pytest.fixture(name="fake_twitter")
+def get_fake_twitter():
+    """Fake served by fake_server, overridden by the modules that need others"""
+    return FakeTwitter(users=10)
+
+
+@pytest.fixture(name="fake_server")
+def get_fake_server(fake_twitter):
+    server = start_server(fake=fake_twitter)
+    yield server
+    server.shutdown()
+    server.server_close()
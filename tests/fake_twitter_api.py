@@ -0,0 +1,630 @@
+"""fake_twitter_api.py
+
+Local stand-in for the Twitter API, for load and soak tests of the bot.
+
+Implements the endpoints the bot uses:
+
+    * GET  /1.1/statuses/user_timeline.json
+    * GET  /1.1/statuses/show.json
+    * GET  /1.1/statuses/lookup.json
+    * GET  /1.1/users/lookup.json
+    * GET  /1.1/lists/statuses.json, members.json and ownerships.json
+    * POST /1.1/lists/create.json, members/create_all.json and
+      members/destroy_all.json
+    * POST /1.1/statuses/update.json
+    * POST /1.1/media/upload.json (simple and chunked uploads)
+    * POST /1.1/statuses/filter.json (a stream of JSON lines of the tweets
+      of the followed user ids, ended after stream_duration seconds)
+    * GET  /stats (calls served, errors injected and replies posted)
+
+The followed users (user0, user1, ...) tweet every tweet_interval seconds,
+a share of their tweets quote another user's tweet. Tweets are built from
+the status.json fixtures and derived from the user and the second they
+were created at, so every tweet can be served again by show and lookup
+without being stored.
+
+Every endpoint keeps a rate limit window per access token and answers
+with the x-rate-limit-* headers, error 88 once the window is used up.
+Rate limit (88) and block (136) errors and latency can also be injected.
+
+Point the bot at it in conf/config.ini:
+
+    API_BASE_URL = http://127.0.0.1:8080/1.1
+    API_UPLOAD_URL = http://127.0.0.1:8080/1.1
+    API_STREAM_URL = http://127.0.0.1:8080/1.1
+
+and run it (from the project directory) with e.g.:
+
+    python -m tests.fake_twitter_api --port 8080 --users 5000
+"""
+import argparse
+import json
+import random
+import re
+import time
+from collections import Counter
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from config import TEST_JSON_FILE
+from util import fetch_test_data_file
+
+# Tweet ids are created_at * ID_FACTOR + user index
+ID_FACTOR = 10 ** 7
+CREATED_AT_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
+# (limit, window seconds) of each endpoint
+RATE_LIMITS = {
+    "/statuses/user_timeline": (900, 900),
+    "/statuses/show": (900, 900),
+    "/statuses/lookup": (900, 900),
+    "/users/lookup": (900, 900),
+    "/lists/statuses": (900, 900),
+    "/lists/members": (900, 900),
+    "/lists/ownerships": (15, 900),
+    "/lists/create": (300, 10800),
+    "/lists/members/create_all": (300, 10800),
+    "/lists/members/destroy_all": (300, 10800),
+    "/statuses/update": (300, 10800),
+    "/media/upload": (615, 900),
+}
+
+
+class FakeTwitter:
+    """Synthetic users, tweets and rate limit windows of the fake api"""
+
+    def __init__(
+        self,
+        users: int = 1000,
+        tweet_interval: int = 600,
+        quote_ratio: float = 0.3,
+        rate_limit_error_rate: float = 0.0,
+        block_rate: float = 0.0,
+        latency: float = 0.0,
+        stream_duration: float = 0.0,
+        keep_alive_interval: float = 30.0,
+        seed: int = 0,
+    ):
+        self.users = users
+        self.tweet_interval = tweet_interval
+        self.quote_ratio = quote_ratio
+        self.rate_limit_error_rate = rate_limit_error_rate
+        self.block_rate = block_rate
+        self.latency = latency
+        # seconds after which a stream is ended (0 never ends it), and
+        # seconds without a tweet after which a keep-alive is sent
+        self.stream_duration = stream_duration
+        self.keep_alive_interval = keep_alive_interval
+        self.seed = seed
+        self.random = random.Random(seed)
+        self._lock = Lock()
+        self.windows: Dict[Tuple[str, str], List[float]] = {}
+        self.stats = Counter()
+        self.media_ids = count(1)
+        self.reply_ids = count(1)
+        # name, mode and member user indexes of the lists, by list id
+        self.lists: Dict[int, Dict] = {}
+        fixtures = fetch_test_data_file(file=TEST_JSON_FILE)
+        self.quote_template = fixtures["basic_quoted_tweet"]
+        self.plain_template = {
+            key: value
+            for key, value in fixtures["basic_tweet"].items()
+            if not key.startswith("in_reply_to")
+        }
+        self.reply_template = fixtures["post_reply_response"]
+
+    def user_index(self, screen_name: str) -> Optional[int]:
+        match = re.fullmatch(r"user(\d+)", screen_name or "")
+        if match and int(match.group(1)) < self.users:
+            return int(match.group(1))
+        return None
+
+    def is_blocked(self, user_index: int) -> bool:
+        return random.Random(self.seed * ID_FACTOR + user_index).random() < (
+            self.block_rate
+        )
+
+    def tweet(self, user_index: int, created_at: int) -> Dict:
+        """Return the tweet user_index created at created_at"""
+        status_id = created_at * ID_FACTOR + user_index
+        is_quote = random.Random(status_id).random() < self.quote_ratio
+        tweet = deepcopy(self.quote_template if is_quote else self.plain_template)
+        tweet["id"] = status_id
+        tweet["id_str"] = str(status_id)
+        tweet["created_at"] = time.strftime(CREATED_AT_FORMAT, time.gmtime(created_at))
+        tweet["user"]["id"] = user_index
+        tweet["user"]["id_str"] = str(user_index)
+        tweet["user"]["screen_name"] = f"user{user_index}"
+        if is_quote:
+            quoted_id = status_id - ID_FACTOR * self.tweet_interval
+            tweet["quoted_status_id"] = quoted_id
+            tweet["quoted_status_id_str"] = str(quoted_id)
+            tweet["quoted_status"]["id"] = quoted_id
+            tweet["quoted_status"]["id_str"] = str(quoted_id)
+            tweet["quoted_status"]["user"][
+                "screen_name"
+            ] = f"user{(user_index + 1) % self.users}"
+        return tweet
+
+    def tweet_times(self, user_index: int, now: float) -> List[int]:
+        """Return when the user tweeted, newest first
+
+        Users tweet every tweet_interval seconds, at an offset of their own.
+        """
+        offset = user_index % self.tweet_interval
+        latest = int(now) - (int(now) - offset) % self.tweet_interval
+        return [latest - self.tweet_interval * n for n in range(200)]
+
+    def stream_tweets(self, user_indexes: List[int], since: int, until: int):
+        """Return the tweets of the users created after since, up to until"""
+        return [
+            self.tweet(user_index=user_index, created_at=created_at)
+            for created_at in range(since + 1, until + 1)
+            for user_index in user_indexes
+            if user_index < self.users
+            and not self.is_blocked(user_index)
+            and (created_at - user_index % self.tweet_interval) % self.tweet_interval
+            == 0
+        ]
+
+    def timeline(
+        self,
+        screen_name: str,
+        since_id: Optional[int],
+        count_: int,
+        max_id: Optional[int] = None,
+    ) -> Tuple[int, object]:
+        user_index = self.user_index(screen_name)
+        if user_index is None:
+            return 404, error(34, "Sorry, that page does not exist.")
+        if self.is_blocked(user_index):
+            return (
+                401,
+                error(136, "You have been blocked from the author of this tweet."),
+            )
+        return (
+            200,
+            [
+                self.status(status_id)
+                for status_id in self.status_ids(
+                    user_index=user_index,
+                    since_id=since_id,
+                    max_id=max_id,
+                    count_=count_,
+                )
+            ],
+        )
+
+    def status_ids(
+        self,
+        user_index: int,
+        since_id: Optional[int],
+        max_id: Optional[int],
+        count_: int,
+    ) -> List[int]:
+        """Return the ids of the timeline of a user, newest first"""
+        status_ids = []
+        for created_at in self.tweet_times(user_index=user_index, now=time.time()):
+            status_id = created_at * ID_FACTOR + user_index
+            if max_id and status_id > max_id:
+                continue
+            if (since_id and status_id <= since_id) or len(status_ids) >= count_:
+                break
+            status_ids.append(status_id)
+        return status_ids
+
+    def get_list(self, list_id: int) -> Dict:
+        follow_list = self.lists[list_id]
+        return {
+            "id": list_id,
+            "id_str": str(list_id),
+            "name": follow_list["name"],
+            "slug": follow_list["name"],
+            "mode": follow_list["mode"],
+            "member_count": len(follow_list["members"]),
+        }
+
+    def create_list(self, parameters: Dict[str, str]) -> Dict:
+        with self._lock:
+            list_id = len(self.lists) + 1
+            self.lists[list_id] = {
+                "name": parameters.get("name"),
+                "mode": parameters.get("mode", "public"),
+                "members": set(),
+            }
+        return self.get_list(list_id)
+
+    def update_list_members(
+        self, list_id: int, screen_names: List[str], add: bool
+    ) -> Tuple[int, object]:
+        """Add (leaving out blocked users) or remove members of a list"""
+        if list_id not in self.lists:
+            return 404, error(34, "Sorry, that page does not exist.")
+        members = self.lists[list_id]["members"]
+        for screen_name in screen_names:
+            user_index = self.user_index(screen_name)
+            if user_index is None:
+                continue
+            if not add:
+                members.discard(user_index)
+            elif not self.is_blocked(user_index):
+                members.add(user_index)
+        return 200, self.get_list(list_id)
+
+    def list_members(self, list_id: int) -> Tuple[int, object]:
+        if list_id not in self.lists:
+            return 404, error(34, "Sorry, that page does not exist.")
+        users = [
+            {"id": user_index, "screen_name": f"user{user_index}"}
+            for user_index in sorted(self.lists[list_id]["members"])
+        ]
+        return 200, {"users": users, "next_cursor": 0, "previous_cursor": 0}
+
+    def list_timeline(
+        self,
+        list_id: int,
+        since_id: Optional[int],
+        count_: int,
+        max_id: Optional[int] = None,
+    ) -> Tuple[int, object]:
+        """Return the tweets of the members of a list, newest first"""
+        if list_id not in self.lists:
+            return 404, error(34, "Sorry, that page does not exist.")
+        status_ids = sorted(
+            (
+                status_id
+                for user_index in self.lists[list_id]["members"]
+                for status_id in self.status_ids(
+                    user_index=user_index,
+                    since_id=since_id,
+                    max_id=max_id,
+                    count_=count_,
+                )
+            ),
+            reverse=True,
+        )[:count_]
+        return 200, [self.status(status_id) for status_id in status_ids]
+
+    def lookup_users(self, screen_names: List[str]) -> Tuple[int, object]:
+        """Return the users with their latest tweet (left out for a blocked user)"""
+        users = []
+        for screen_name in screen_names:
+            user_index = self.user_index(screen_name)
+            if user_index is None:
+                continue
+            latest = self.tweet_times(user_index=user_index, now=time.time())[0]
+            user = {
+                "id": user_index,
+                "id_str": str(user_index),
+                "screen_name": screen_name,
+                "statuses_count": latest // self.tweet_interval,
+            }
+            if not self.is_blocked(user_index):
+                user["status"] = self.tweet(user_index=user_index, created_at=latest)
+                del user["status"]["user"]
+            users.append(user)
+        if not users:
+            return 404, error(17, "No user matches for specified terms.")
+        return 200, users
+
+    def status(self, status_id: int) -> Optional[Dict]:
+        created_at, user_index = divmod(status_id, ID_FACTOR)
+        if user_index >= self.users or created_at > time.time():
+            return None
+        return self.tweet(user_index=user_index, created_at=created_at)
+
+    def post_update(self, parameters: Dict[str, str]) -> Dict:
+        reply = deepcopy(self.reply_template)
+        reply["id"] = next(self.reply_ids)
+        reply["id_str"] = str(reply["id"])
+        reply["text"] = parameters.get("status", "")
+        in_reply_to_status_id = parameters.get("in_reply_to_status_id")
+        reply["in_reply_to_status_id"] = (
+            int(in_reply_to_status_id) if in_reply_to_status_id else None
+        )
+        return reply
+
+    def take_call(self, endpoint: str, token: str) -> Tuple[bool, Dict[str, str]]:
+        """Count a call in its rate limit window
+
+        Returns:
+            (True if the call is allowed, x-rate-limit-* headers)
+        """
+        limit, window = RATE_LIMITS[endpoint]
+        now = time.time()
+        with self._lock:
+            reset, remaining = self.windows.get((endpoint, token), (0, limit))
+            if reset <= now:
+                reset, remaining = now + window, limit
+            allowed = remaining > 0
+            if allowed:
+                remaining -= 1
+            self.windows[(endpoint, token)] = (reset, remaining)
+        headers = {
+            "x-rate-limit-limit": str(limit),
+            "x-rate-limit-remaining": str(remaining),
+            "x-rate-limit-reset": str(int(reset)),
+        }
+        return allowed, headers
+
+
+def error(code: int, message: str) -> Dict:
+    return {"errors": [{"code": code, "message": message}]}
+
+
+class FakeTwitterHandler(BaseHTTPRequestHandler):
+    """Route the requests of python-twitter to the FakeTwitter of the server"""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def fake(self) -> FakeTwitter:
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body, headers: Dict[str, str] = None):
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_parameters(self) -> Tuple[Dict[str, str], bytes]:
+        url = urlparse(self.path)
+        parameters = {
+            key: values[0] for key, values in parse_qs(url.query).items() if values
+        }
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("Content-Type", "").startswith(
+            "application/x-www-form-urlencoded"
+        ):
+            parameters.update(
+                {
+                    key: values[0]
+                    for key, values in parse_qs(body.decode()).items()
+                    if values
+                }
+            )
+        return parameters, body
+
+    def get_token(self) -> str:
+        match = re.search(
+            r'oauth_token="([^"]*)"', self.headers.get("Authorization", "")
+        )
+        return match.group(1) if match else ""
+
+    def handle_api_call(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            with self.fake._lock:
+                return self.send_json(200, dict(self.fake.stats))
+        endpoint = url.path.replace("/1.1", "").replace(".json", "")
+        if endpoint == "/statuses/filter":
+            return self.stream_filter(parameters=self.read_parameters()[0])
+        if endpoint not in RATE_LIMITS:
+            return self.send_json(404, error(34, "Sorry, that page does not exist."))
+
+        parameters, body = self.read_parameters()
+        if self.fake.latency:
+            time.sleep(self.fake.random.expovariate(1 / self.fake.latency))
+        allowed, headers = self.fake.take_call(
+            endpoint=endpoint, token=self.get_token()
+        )
+        if not allowed or self.fake.random.random() < self.fake.rate_limit_error_rate:
+            with self.fake._lock:
+                self.fake.stats[f"{endpoint} 88"] += 1
+            return self.send_json(429, error(88, "Rate limit exceeded"), headers)
+        with self.fake._lock:
+            self.fake.stats[endpoint] += 1
+
+        if endpoint == "/statuses/user_timeline":
+            status, response = self.fake.timeline(
+                screen_name=parameters.get("screen_name"),
+                since_id=int(parameters["since_id"])
+                if "since_id" in parameters
+                else None,
+                count_=int(parameters.get("count", 20)),
+                max_id=int(parameters["max_id"]) if "max_id" in parameters else None,
+            )
+            if status == 401:
+                with self.fake._lock:
+                    self.fake.stats[f"{endpoint} 136"] += 1
+        elif endpoint == "/statuses/show":
+            response = self.fake.status(status_id=int(parameters.get("id", 0)))
+            status = 200 if response else 404
+            response = response or error(144, "No status found with that ID.")
+        elif endpoint == "/statuses/lookup":
+            status_ids = [
+                int(id_) for id_ in parameters.get("id", "").split(",") if id_
+            ]
+            status, response = (
+                200,
+                {"id": {str(id_): self.fake.status(id_) for id_ in status_ids}},
+            )
+        elif endpoint == "/users/lookup":
+            status, response = self.fake.lookup_users(
+                screen_names=parameters.get("screen_name", "").split(",")
+            )
+        elif endpoint == "/lists/statuses":
+            status, response = self.fake.list_timeline(
+                list_id=int(parameters.get("list_id", 0)),
+                since_id=int(parameters["since_id"])
+                if "since_id" in parameters
+                else None,
+                count_=int(parameters.get("count", 20)),
+                max_id=int(parameters["max_id"]) if "max_id" in parameters else None,
+            )
+        elif endpoint == "/lists/members":
+            status, response = self.fake.list_members(
+                list_id=int(parameters.get("list_id", 0))
+            )
+        elif endpoint == "/lists/ownerships":
+            status, response = (
+                200,
+                {
+                    "lists": [
+                        self.fake.get_list(list_id) for list_id in self.fake.lists
+                    ],
+                    "next_cursor": 0,
+                    "previous_cursor": 0,
+                },
+            )
+        elif endpoint == "/lists/create":
+            status, response = 200, self.fake.create_list(parameters=parameters)
+        elif endpoint.startswith("/lists/members/"):
+            status, response = self.fake.update_list_members(
+                list_id=int(parameters.get("list_id", 0)),
+                screen_names=parameters.get("screen_name", "").split(","),
+                add=endpoint.endswith("create_all"),
+            )
+        elif endpoint == "/statuses/update":
+            status, response = 200, self.fake.post_update(parameters=parameters)
+        else:
+            status, response = self.media_upload(parameters=parameters, body=body)
+        self.send_json(status, response, headers)
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def stream_filter(self, parameters: Dict[str, str]):
+        """Stream the tweets of the followed user ids as they are created
+
+        Like the Twitter stream the response is chunked, one JSON tweet per
+        line, with a blank keep-alive line when there is nothing to send.
+        """
+        user_indexes = [
+            int(id_) for id_ in parameters.get("follow", "").split(",") if id_
+        ]
+        with self.fake._lock:
+            self.fake.stats["/statuses/filter"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+        started = time.time()
+        since = int(started)
+        last_sent = started
+        try:
+            while (
+                not self.fake.stream_duration
+                or time.time() - started < self.fake.stream_duration
+            ):
+                time.sleep(0.1)
+                until = int(time.time())
+                tweets = self.fake.stream_tweets(
+                    user_indexes=user_indexes, since=since, until=until
+                )
+                since = until
+                if tweets:
+                    self.write_chunk(
+                        b"".join(
+                            json.dumps(tweet).encode() + b"\r\n" for tweet in tweets
+                        )
+                    )
+                    with self.fake._lock:
+                        self.fake.stats["/statuses/filter tweets"] += len(tweets)
+                    last_sent = time.time()
+                elif time.time() - last_sent >= self.fake.keep_alive_interval:
+                    self.write_chunk(b"\r\n")
+                    last_sent = time.time()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def media_upload(
+        self, parameters: Dict[str, str], body: bytes
+    ) -> Tuple[int, object]:
+        """Answer simple uploads and the INIT, APPEND, FINALIZE of chunked ones"""
+        command = parameters.get("command")
+        if command is None and b'name="command"' in body:
+            command = "APPEND"
+        if command == "APPEND":
+            return 204, None
+        if command == "FINALIZE":
+            media_id = int(parameters["media_id"])
+        else:
+            media_id = next(self.fake.media_ids)
+        return 200, {"media_id": media_id, "media_id_string": str(media_id)}
+
+    do_GET = handle_api_call
+    do_POST = handle_api_call
+
+
+def start_server(
+    fake: FakeTwitter, host: str = "127.0.0.1", port: int = 0
+) -> ThreadingHTTPServer:
+    """Serve fake in a background thread (port 0 picks a free port)"""
+    server = ThreadingHTTPServer((host, port), FakeTwitterHandler)
+    server.daemon_threads = True
+    server.fake = fake
+    Thread(target=server.serve_forever, name="fake-twitter-api", daemon=True).start()
+    return server
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Twitter API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument(
+        "--tweet-interval", type=int, default=600, help="seconds between two tweets"
+    )
+    parser.add_argument("--quote-ratio", type=float, default=0.3)
+    parser.add_argument(
+        "--rate-limit-error-rate",
+        type=float,
+        default=0.0,
+        help="share of the calls answered with error 88",
+    )
+    parser.add_argument(
+        "--block-rate",
+        type=float,
+        default=0.0,
+        help="share of the users that answer with error 136",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="mean latency in seconds"
+    )
+    parser.add_argument(
+        "--stream-duration",
+        type=float,
+        default=0.0,
+        help="seconds after which a stream is ended (0 never ends it)",
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    fake = FakeTwitter(
+        users=options.users,
+        tweet_interval=options.tweet_interval,
+        quote_ratio=options.quote_ratio,
+        rate_limit_error_rate=options.rate_limit_error_rate,
+        block_rate=options.block_rate,
+        latency=options.latency,
+        stream_duration=options.stream_duration,
+    )
+    server = start_server(fake=fake, host=options.host, port=options.port)
+    print(f"Fake Twitter API on http://{options.host}:{server.server_port}/1.1")
+    try:
+        while True:
+            time.sleep(60)
+            with fake._lock:
+                print(dict(fake.stats))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
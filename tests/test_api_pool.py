@@ -0,0 +1,80 @@
+"""test_api_pool.py
+
+Tests for the ReadApiPool class from the api_pool module
+"""
+import time
+from unittest.mock import patch
+
+import pytest
+from twitter import Api, TwitterError
+
+from api_pool import ReadApiPool, ReadClient
+from rate_limits import TwitterRateLimitException
+
+ENDPOINT = "/statuses/user_timeline"
+
+
+def set_remaining(client: ReadClient, remaining: int, reset: float):
+    client.api.rate_limit.set_limit(
+        url=client.rate_limits.endpoint_url(ENDPOINT),
+        limit=900,
+        remaining=remaining,
+        reset=reset,
+    )
+
+
+@pytest.fixture(name="read_api_pool")
+def get_read_api_pool():
+    return ReadApiPool(
+        clients=[ReadClient(name=name, api=Api()) for name in ("first", "second")]
+    )
+
+
+def test_read_api_pool_picks_client_with_most_budget(read_api_pool):
+    """Verify calls go to the credential with the most calls left"""
+    first, second = read_api_pool.clients
+    reset = int(time.time()) + 900
+    set_remaining(first, remaining=3, reset=reset)
+    set_remaining(second, remaining=5, reset=reset)
+    picked = [read_api_pool.acquire(ENDPOINT).name for _ in range(6)]
+    assert picked == ["second", "second", "first", "second", "first", "second"]
+    assert read_api_pool.acquire(ENDPOINT) is None
+    assert read_api_pool.available_at(ENDPOINT) == reset
+
+
+def test_read_api_pool_drops_revoked_credential(read_api_pool):
+    """Verify a revoked credential is taken out of rotation for good"""
+    with pytest.raises(TwitterError):
+        with read_api_pool.api(ENDPOINT):
+            raise TwitterError([{"code": 89, "message": "Invalid or expired token"}])
+    with pytest.raises(TwitterError):
+        with read_api_pool.api(ENDPOINT):
+            raise TwitterError([{"code": 131, "message": "Internal error"}])
+    assert [client.name for client in read_api_pool.healthy_clients] == ["second"]
+    with patch("api_pool.time.time", return_value=time.time() + 86400):
+        assert [client.name for client in read_api_pool.healthy_clients] == ["second"]
+
+
+def test_read_api_pool_readmits_locked_credential(read_api_pool):
+    """Verify a locked credential is used again after the cooldown"""
+    read_api_pool.cooldown = 900
+    with pytest.raises(TwitterError):
+        with read_api_pool.api(ENDPOINT):
+            raise TwitterError([{"code": 326, "message": "locked"}])
+    assert [client.name for client in read_api_pool.healthy_clients] == ["second"]
+    with patch("api_pool.time.time", return_value=time.time() + 901):
+        assert [client.name for client in read_api_pool.healthy_clients] == [
+            "first",
+            "second",
+        ]
+
+
+def test_read_api_pool_without_budget(read_api_pool):
+    """Verify TwitterRateLimitException is raised when no client has budget"""
+    reset = int(time.time()) + 900
+    for client in read_api_pool.clients:
+        set_remaining(client, remaining=0, reset=reset)
+    with pytest.raises(TwitterRateLimitException) as error:
+        with read_api_pool.api(ENDPOINT):
+            pass
+    assert error.value.reset_at == reset
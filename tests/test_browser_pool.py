@@ -0,0 +1,110 @@
+"""test_browser_pool.py
+
+Tests for the BrowserPool class from the browser_pool module, with a fake
+TweetCapture instead of a browser
+"""
+import os
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+from browser_pool import BrowserPool, get_descendant_pids
+
+
+class FakeService:
+    def __init__(self):
+        self.process = subprocess.Popen(["sleep", "60"])
+
+
+class FakeDriver:
+    def __init__(self):
+        self.service = FakeService()
+        self.session_alive = True
+
+    @property
+    def current_url(self) -> str:
+        if not self.session_alive:
+            raise ConnectionRefusedError("chrome not reachable")
+        return "about:blank"
+
+
+class FakeTweetCapture:
+    def __init__(self, **kwargs):
+        self.driver = FakeDriver()
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.closed = True
+        self.driver.service.process.kill()
+        self.driver.service.process.wait()
+
+    def screen_capture_tweet(self, url: str) -> str:
+        if "fail" in url:
+            raise ValueError(f"Unable to load {url}")
+        return f"/tmp/{url}.png"
+
+
+@pytest.fixture(name="browser_pool")
+def get_browser_pool():
+    with patch("browser_pool.TweetCapture", FakeTweetCapture):
+        browser_pool = BrowserPool(size=1, max_captures=3, max_memory_mb=0)
+        yield browser_pool
+        browser_pool.close()
+
+
+def test_browser_pool_reuses_and_recycles_browsers(browser_pool):
+    """Verify a browser is reused until it fails or reaches max_captures"""
+    with browser_pool.browser() as browser:
+        browser.screen_capture_tweet(url="1")
+    with browser_pool.browser() as same_browser:
+        same_browser.screen_capture_tweet(url="2")
+        with pytest.raises(ValueError):
+            same_browser.screen_capture_tweet(url="fail")
+    assert same_browser is browser
+    assert browser.tweet_capture.closed
+
+    with browser_pool.browser() as browser:
+        for url in ("1", "2", "3"):
+            browser.screen_capture_tweet(url=url)
+    assert browser.tweet_capture.closed
+
+
+@pytest.mark.parametrize("death", ["driver_process", "session"])
+def test_browser_pool_replaces_dead_idle_browser(browser_pool, death):
+    """Verify an idle browser that died is replaced when it is handed out"""
+    with browser_pool.browser() as browser:
+        browser.screen_capture_tweet(url="1")
+    if death == "driver_process":
+        browser.tweet_capture.driver.service.process.kill()
+        browser.tweet_capture.driver.service.process.wait()
+    else:
+        browser.tweet_capture.driver.session_alive = False
+    assert not browser.is_alive()
+
+    with browser_pool.browser() as new_browser:
+        assert new_browser is not browser
+        assert new_browser.is_alive()
+    assert browser.tweet_capture.closed
+
+
+def test_browser_pool_recycles_browser_using_too_much_memory():
+    """Verify the memory of a browser's own processes is checked every
+    memory_check_interval captures"""
+    with patch("browser_pool.TweetCapture", FakeTweetCapture), BrowserPool(
+        size=1, max_captures=0, max_memory_mb=100, memory_check_interval=2
+    ) as browser_pool:
+        with browser_pool.browser() as browser:
+            assert browser.driver_process.pid in get_descendant_pids(os.getpid())
+            assert browser.memory_mb() < 100
+        with patch.object(browser, "memory_mb", return_value=200) as memory_mb:
+            with browser_pool.browser() as same_browser:
+                same_browser.screen_capture_tweet(url="1")
+            assert not browser.tweet_capture.closed
+            with browser_pool.browser() as same_browser:
+                same_browser.screen_capture_tweet(url="2")
+            assert browser.tweet_capture.closed
+            assert memory_mb.call_count == 1
@@ -0,0 +1,79 @@
+"""test_capture_backend.py
+
+Tests for the capture backends from the capture_backend module
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from capture_backend import (
+    PLACEHOLDER_IMAGE,
+    BrowserCaptureBackend,
+    FakeCaptureBackend,
+    build_capture_backend,
+    close_capture_backend,
+    get_capture_backend,
+)
+from wrapped_tweet import Tweet
+
+
+def test_fake_capture_backend_writes_placeholder(state_store, test_status, tmp_path):
+    """Verify every tweet gets a placeholder image as its screenshot"""
+    backend = FakeCaptureBackend(workers=2, delay=0, screenshot_dir=tmp_path)
+    tweets = [Tweet(test_status("basic_quoted_tweet")) for _ in range(3)]
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        captured_tweets = backend.capture_tweets(quoted_tweets=tweets)
+    backend.close()
+    assert captured_tweets == tweets
+    screenshots = {tweet.screen_capture_file_path_quoted_tweet for tweet in tweets}
+    assert len(screenshots) == 3
+    assert all(Path(file).read_bytes() == PLACEHOLDER_IMAGE for file in screenshots)
+    assert (backend.captured, backend.failed, backend.pending) == (3, 0, 0)
+
+
+def test_fake_capture_backend_leaves_out_failed_captures(test_status, tmp_path):
+    """Verify failed fake captures are left out"""
+    backend = FakeCaptureBackend(
+        workers=1, delay=0, failure_rate=1, screenshot_dir=tmp_path
+    )
+    tweets = [Tweet(test_status("basic_quoted_tweet")) for _ in range(2)]
+    assert backend.capture_tweets(quoted_tweets=tweets) == []
+    backend.close()
+    assert (backend.captured, backend.failed, backend.pending) == (0, 2, 0)
+
+
+def test_browser_capture_backend_leaves_out_failed_captures(state_store, test_status):
+    """Verify a failed screenshot does not stop the other captures"""
+    browser = MagicMock()
+    browser.screen_capture_tweet.side_effect = [RuntimeError("crashed"), "ok.png"]
+    browser_pool = MagicMock()
+    browser_pool.browser = contextmanager(lambda: iter([browser]))
+    tweets = [Tweet(test_status("basic_quoted_tweet")) for _ in range(2)]
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        captured_tweets = BrowserCaptureBackend(
+            browser_pool=browser_pool
+        ).capture_tweets(quoted_tweets=tweets)
+    assert captured_tweets == tweets[1:]
+    assert tweets[1].screen_capture_file_path_quoted_tweet == "ok.png"
+
+
+def test_build_capture_backend_unknown_name():
+    """Verify an unknown backend name is refused"""
+    with pytest.raises(ValueError):
+        build_capture_backend(name="film")
+
+
+def test_get_capture_backend_is_built_once():
+    """Verify the backend is built on first use and closed once"""
+    backend = MagicMock()
+    with patch(
+        "capture_backend.build_capture_backend", return_value=backend
+    ) as build_backend:
+        assert get_capture_backend() is backend
+        assert get_capture_backend() is backend
+        close_capture_backend()
+        close_capture_backend()
+    assert build_backend.call_count == 1
+    assert backend.close.call_count == 1
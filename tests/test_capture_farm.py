@@ -0,0 +1,90 @@
+"""test_capture_farm.py
+
+Tests for the CaptureFarm class from the capture_farm module, with a stub
+capture function instead of a browser
+"""
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from capture_farm import CaptureFarm
+from wrapped_tweet import Tweet
+
+
+def stub_capture_url(url: str) -> str:
+    """Capture url in 0.1 seconds (0.4 for "slow" urls), hang on "hang" urls
+    and fail on "fail" urls"""
+    if "hang" in url:
+        time.sleep(60)
+    if "fail" in url:
+        raise ValueError(f"Unable to load {url}")
+    time.sleep(0.4 if "slow" in url else 0.1)
+    return f"/tmp/{url.rsplit('/', 1)[-1]}.png"
+
+
+def get_tweet(status_id: int, quoted_tweet_id: str) -> Tweet:
+    return Tweet.from_json(
+        {
+            "id": status_id,
+            "id_str": str(status_id),
+            "text": "quote",
+            "user": {"screen_name": "_b_axe"},
+            "quoted_status_id": quoted_tweet_id,
+            "quoted_status": {"text": "quoted", "user": {"screen_name": "quoted"}},
+        }
+    )
+
+
+@pytest.fixture(name="capture_farm")
+def get_capture_farm():
+    capture_farm = CaptureFarm(workers=2, job_timeout=1, capture_url=stub_capture_url)
+    yield capture_farm
+    capture_farm.close()
+
+
+def test_capture_farm_times_out_hung_job(capture_farm):
+    """Verify a hung job is abandoned after its own timeout, and the killed
+    workers are replaced"""
+    tweets = [get_tweet(1, "hang"), get_tweet(2, "fail")] + [
+        get_tweet(status_id, str(status_id)) for status_id in range(3, 9)
+    ]
+    start_time = time.monotonic()
+    captured_tweets = capture_farm.capture_tweets(quoted_tweets=tweets)
+    # one worker hangs for a second while the other captures the rest
+    assert time.monotonic() - start_time < 3
+    assert {tweet.id for tweet in captured_tweets} == set(range(3, 9))
+    assert all(tweet.screen_capture_file_path_quoted_tweet for tweet in captured_tweets)
+
+    captured_tweets = capture_farm.capture_tweets(quoted_tweets=[get_tweet(9, "9")])
+    assert [tweet.id for tweet in captured_tweets] == [9]
+
+
+def test_capture_farm_only_kills_its_workers(capture_farm):
+    """Verify the child processes that are not workers of the farm survive
+    the restart of a hung farm"""
+    other_process = multiprocessing.Process(target=time.sleep, args=(60,))
+    other_process.start()
+    try:
+        captured_tweets = capture_farm.capture_tweets(
+            quoted_tweets=[get_tweet(1, "hang"), get_tweet(2, "2")]
+        )
+        assert [tweet.id for tweet in captured_tweets] == [2]
+        assert other_process.is_alive()
+    finally:
+        other_process.kill()
+        other_process.join()
+
+
+def test_capture_farm_runs_threads_at_the_same_time(capture_farm):
+    """Verify the batches of two threads share the workers, and a batch
+    whose workers are killed by the timeout of another is captured"""
+    batches = [
+        [get_tweet(1, "hang"), get_tweet(2, "2")],
+        [get_tweet(status_id, f"slow{status_id}") for status_id in range(3, 7)],
+    ]
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        captured = list(executor.map(capture_farm.capture_tweets, batches))
+    assert [tweet.id for tweet in captured[0]] == [2]
+    assert sorted(tweet.id for tweet in captured[1]) == [3, 4, 5, 6]
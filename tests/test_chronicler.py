@@ -0,0 +1,144 @@
+"""test_chronicler.py
+
+Tests for the scan functions of chronicler.py
+"""
+from functools import partial
+from threading import Barrier
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from twitter import Status, TwitterError, User
+
+import chronicler
+from chronicler import (
+    UserLockLost,
+    backfill_user,
+    chronicle_new_tweet,
+    collect_and_queue_tweets,
+    fetch_list_tweets,
+    fetch_user_tweets,
+    run_chronicler,
+)
+
+
+@patch("twitter.api.Api.GetUserTimeline")
+def test_backfill_user_keeps_gap_on_api_error(mock_get, state_store):
+    """Verify a gap whose timeline cannot be read is kept for the next run"""
+    state_store.set_backfill_gap(user="_b_axe", since_id=100, max_id=139, fetched=10)
+    mock_get.side_effect = TwitterError("Over capacity")
+    with patch("chronicler.STATE_STORE", state_store), patch(
+        "twitter_helpers.STATE_STORE", state_store
+    ):
+        assert backfill_user(user="_b_axe") == 0
+    assert state_store.get_backfill_gaps(user="_b_axe") == [(100, 139, 10)]
+
+
+def test_fetch_list_tweets_records_gap_of_locked_member(state_store):
+    """Verify the list tweets of a member locked by another run are backfilled"""
+    state_store.set_last_status_id(user="user2", status_id=100)
+    state_store.lock_user(user="user2", ttl=60, owner="another run")
+    follow_list = MagicMock()
+    follow_list.sync.return_value = {"user1", "user2"}
+    follow_list.get_new_tweets.return_value = (
+        {
+            user: [
+                Status(id=status_id, user=User(screen_name=user))
+                for status_id in (130, 120)
+            ]
+            for user in ("user1", "user2")
+        },
+        130,
+    )
+    with patch("chronicler.STATE_STORE", state_store), patch(
+        "chronicler.FOLLOW_LIST", follow_list
+    ), patch("chronicler.lock_user", partial(chronicler.lock_user, timeout=0)):
+        new_tweets, newest_id, _ = fetch_list_tweets(users=["user1", "user2"])
+        assert list(new_tweets) == ["user1"]
+        assert newest_id == 130
+        assert state_store.get_backfill_gaps(user="user2") == [(100, 130, 0)]
+
+        # once unlocked, the member is chronicled to backfill the gap
+        state_store.unlock_user(user="user2", owner="another run")
+        follow_list.get_new_tweets.return_value = ({}, None)
+        new_tweets, _, _ = fetch_list_tweets(users=["user1", "user2"])
+        assert new_tweets == {"user2": []}
+
+
+def test_chronicle_new_tweet_records_gap_of_locked_user(state_store):
+    """Verify a streamed tweet of a user locked by another run is backfilled"""
+    state_store.set_last_status_id(user="_b_axe", status_id=100)
+    state_store.lock_user(user="_b_axe", ttl=60, owner="another run")
+    with patch("chronicler.STATE_STORE", state_store), patch(
+        "chronicler.lock_user", partial(chronicler.lock_user, timeout=0)
+    ), patch("chronicler.chronicle_tweets") as mock_chronicle_tweets:
+        chronicle_new_tweet(
+            user="_b_axe", tweet=Status(id=120, user=User(screen_name="_b_axe"))
+        )
+    mock_chronicle_tweets.assert_not_called()
+    assert state_store.get_last_status_id(user="_b_axe") == 100
+    assert state_store.get_backfill_gaps(user="_b_axe") == [(119, 120, 0)]
+
+
+@patch("chronicler.get_new_tweets_for_user", return_value=[])
+def test_fetch_user_tweets_skips_locked_user(mock_get_new_tweets, state_store):
+    """Verify a user locked by another run is skipped, and stays locked"""
+    state_store.lock_user(user="user1", ttl=60, owner="another run")
+    with patch("chronicler.STATE_STORE", state_store), patch(
+        "chronicler.lock_user", partial(chronicler.lock_user, timeout=0)
+    ):
+        assert fetch_user_tweets(user="user1") is None
+        assert fetch_user_tweets(user="user2") == ("user2", [])
+    mock_get_new_tweets.assert_called_once_with(user="user2")
+    assert not state_store.lock_user(user="user1", ttl=60)
+
+
+def test_run_chronicler_fetches_users_in_parallel(state_store):
+    """Verify MAX_SCAN_WORKERS users are fetched at the same time"""
+    users = ["user1", "user2", "user3"]
+    # every fetch waits until all three are running, or breaks the barrier
+    barrier = Barrier(len(users), timeout=5)
+    fetched = []
+
+    def get_new_tweets_for_user(user: str):
+        barrier.wait()
+        fetched.append(user)
+        return []
+
+    with patch("chronicler.STATE_STORE", state_store), patch(
+        "chronicler.MAX_SCAN_WORKERS", len(users)
+    ), patch("chronicler.INGESTION_MODE", "timelines"), patch(
+        "chronicler.ACTIVITY_PRECHECK", False
+    ), patch(
+        "chronicler.get_new_tweets_for_user", get_new_tweets_for_user
+    ), patch(
+        "chronicler.POLL_SCHEDULER"
+    ), patch(
+        "chronicler.POST_QUEUE"
+    ):
+        run_chronicler(users=users, poll_all=True)
+    assert not barrier.broken
+    assert sorted(fetched) == users
+    # every user was unlocked once chronicled
+    assert all(state_store.lock_user(user=user, ttl=60) for user in users)
+
+
+def test_collect_and_queue_tweets_of_lock_taken_over(state_store):
+    """Verify the captures of a user whose lock was taken over during them
+    are not queued, and the tweets are left to the run holding the lock"""
+    state_store.lock_user(user="_b_axe", ttl=60)
+    tweets = [Status(id=status_id) for status_id in (130, 120)]
+
+    def collect_quoted_tweets(quoted_tweets):
+        # the lock expires during the captures and another run takes it
+        state_store.unlock_user(user="_b_axe")
+        state_store.lock_user(user="_b_axe", ttl=60, owner="another run")
+        return quoted_tweets
+
+    with patch("chronicler.STATE_STORE", state_store), patch(
+        "chronicler.collect_quoted_tweets", collect_quoted_tweets
+    ), patch("chronicler.POST_QUEUE") as mock_post_queue:
+        with pytest.raises(UserLockLost):
+            collect_and_queue_tweets(user="_b_axe", tweets=tweets)
+    mock_post_queue.put.assert_not_called()
+    assert state_store.get_backfill_gaps(user="_b_axe") == [(119, 130, 0)]
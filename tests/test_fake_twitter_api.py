@@ -0,0 +1,100 @@
+"""test_fake_twitter_api.py
+
+Tests for the fake Twitter API server, driven by python-twitter's Api
+"""
+import pytest
+from twitter import Api, TwitterError
+
+from tests.fake_twitter_api import ID_FACTOR, FakeTwitter
+
+
+def get_api(server, token: str = "token") -> Api:
+    base_url = f"http://127.0.0.1:{server.server_port}/1.1"
+    return Api(
+        consumer_key="key",
+        consumer_secret="secret",
+        access_token_key=token,
+        access_token_secret="secret",
+        base_url=base_url,
+        upload_url=base_url,
+    )
+
+
+@pytest.fixture(name="fake_twitter")
+def get_fake_twitter():
+    return FakeTwitter(users=10, quote_ratio=0.5)
+
+
+def test_fake_twitter_api_user_timeline(fake_server):
+    """Verify user timelines are served newest first and honour since_id"""
+    api = get_api(fake_server)
+    timeline = api.GetUserTimeline(screen_name="user3", count=5)
+    assert len(timeline) == 5
+    assert all(status.user.screen_name == "user3" for status in timeline)
+    assert [status.id for status in timeline] == sorted(
+        (status.id for status in timeline), reverse=True
+    )
+    assert api.GetUserTimeline(
+        screen_name="user3", since_id=timeline[1].id, count=5
+    ) == [timeline[0]]
+    limit = api.rate_limit.get_limit(f"{api.base_url}/statuses/user_timeline.json")
+    assert limit.remaining == 898
+
+
+def test_fake_twitter_api_lookup_and_show(fake_server):
+    """Verify the statuses of the timelines can be looked up again"""
+    api = get_api(fake_server)
+    status_id = api.GetUserTimeline(screen_name="user1", count=1)[0].id
+    statuses = api.GetStatuses([status_id, ID_FACTOR * 10 ** 12], map=True)
+    assert statuses[status_id].id == status_id
+    assert statuses[ID_FACTOR * 10 ** 12] is None
+    assert api.GetStatus(status_id).user.screen_name == "user1"
+    with pytest.raises(TwitterError):
+        api.GetStatus(ID_FACTOR * 10 ** 12)
+
+
+def test_fake_twitter_api_users_lookup(fake_server):
+    """Verify users are looked up with their latest tweet"""
+    api = get_api(fake_server)
+    latest_status_id = api.GetUserTimeline(screen_name="user1", count=1)[0].id
+    users = api.UsersLookup(screen_name=["user1", "nobody"], return_json=True)
+    assert [user["screen_name"] for user in users] == ["user1"]
+    assert users[0]["status"]["id"] == latest_status_id
+    with pytest.raises(TwitterError) as error:
+        api.UsersLookup(screen_name=["nobody"])
+    assert error.value.message[0]["code"] == 17
+
+
+def test_fake_twitter_api_rate_limit_and_block_errors(fake_server):
+    """Verify injected rate limit (88) and block (136) errors"""
+    api = get_api(fake_server)
+    fake_server.fake.rate_limit_error_rate = 1
+    with pytest.raises(TwitterError) as error:
+        api.GetUserTimeline(screen_name="user1")
+    assert error.value.message[0]["code"] == 88
+    fake_server.fake.rate_limit_error_rate = 0
+    fake_server.fake.block_rate = 1
+    with pytest.raises(TwitterError) as error:
+        api.GetUserTimeline(screen_name="user1")
+    assert error.value.message[0]["code"] == 136
+
+
+def test_fake_twitter_api_window_used_up(fake_server):
+    """Verify error 88 once the rate limit window of a token is used up"""
+    fake_server.fake.windows[("/statuses/show", "token")] = (2 ** 32, 0)
+    with pytest.raises(TwitterError) as error:
+        get_api(fake_server).GetStatus(ID_FACTOR)
+    assert error.value.message[0]["code"] == 88
+    assert get_api(fake_server, token="other").GetStatus(ID_FACTOR).id == ID_FACTOR
+
+
+def test_fake_twitter_api_post_update_with_media(fake_server, tmp_path):
+    """Verify replies with a screenshot can be posted"""
+    screenshot = tmp_path.joinpath("screenshot.png")
+    screenshot.write_bytes(b"\x89PNG" + b"\x00" * 100)
+    reply = get_api(fake_server).PostUpdate(
+        status="@user1", media=str(screenshot), in_reply_to_status_id=42
+    )
+    assert reply.in_reply_to_status_id == 42
+    assert fake_server.fake.stats["/media/upload"] == 1
+    assert fake_server.fake.stats["/statuses/update"] == 1
@@ -0,0 +1,48 @@
+"""test_freshness.py
+
+Tests for the FreshnessTracker class from the freshness module
+"""
+from freshness import FreshnessTracker, percentile
+
+
+def add_reply(state_store, status_id, user, created_at, detected_at, posted_at):
+    state_store.add_tweet_detected(
+        status_id=status_id, user=user, created_at=created_at, detected_at=detected_at
+    )
+    state_store.set_tweet_posted_at(status_id=status_id, posted_at=posted_at)
+
+
+def test_percentile():
+    """Verify the nearest-rank percentile"""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([7], 99) == 7
+    assert percentile([], 50) is None
+
+
+def test_freshness_stats(state_store):
+    """Verify the percentiles cover only the replies in the window"""
+    add_reply(state_store, 1, "_b_axe", created_at=0, detected_at=60, posted_at=120)
+    add_reply(state_store, 2, "_b_axe", created_at=0, detected_at=30, posted_at=300)
+    add_reply(state_store, 3, "_b_axe", created_at=0, detected_at=10, posted_at=1000)
+    tracker = FreshnessTracker(
+        state_store=state_store, slo_seconds=600, window_seconds=800
+    )
+    stats = tracker.stats(now=1000)
+    assert stats["replies"] == 2
+    assert stats["end_to_end"] == {50: 300, 95: 1000, 99: 1000}
+    assert stats["detection"][50] == 10
+
+
+def test_freshness_violations(state_store):
+    """Verify slow replies are flagged with their user and slowest stage"""
+    add_reply(state_store, 1, "_b_axe", created_at=0, detected_at=60, posted_at=120)
+    add_reply(state_store, 2, "FTBandFTR", created_at=0, detected_at=900, posted_at=960)
+    add_reply(state_store, 3, "_b_axe", created_at=0, detected_at=60, posted_at=700)
+    tracker = FreshnessTracker(state_store=state_store, slo_seconds=600)
+    violations = tracker.violations(posted_since=0)
+    assert [
+        (violation["user"], violation["slowest_stage"]) for violation in violations
+    ] == [("_b_axe", "posting"), ("FTBandFTR", "detection")]
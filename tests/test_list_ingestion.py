@@ -0,0 +1,90 @@
+"""test_list_ingestion.py
+
+Tests for the FollowList class from the list_ingestion module, against
+the fake Twitter API server
+"""
+from unittest.mock import patch
+
+import pytest
+
+from api_pool import ReadApiPool, ReadClient
+from list_ingestion import FollowList
+from metrics import InstrumentedApi, Metrics
+from tests.fake_twitter_api import ID_FACTOR, FakeTwitter
+
+
+@pytest.fixture(name="fake_twitter")
+def get_fake_twitter():
+    return FakeTwitter(users=10, tweet_interval=60)
+
+
+@pytest.fixture(name="follow_list")
+def get_follow_list(fake_server, state_store):
+    api = InstrumentedApi(
+        client_name="default",
+        metrics=Metrics(),
+        consumer_key="key",
+        consumer_secret="secret",
+        access_token_key="token",
+        access_token_secret="secret",
+        base_url=f"http://127.0.0.1:{fake_server.server_port}/1.1",
+    )
+    return FollowList(
+        state_store=state_store,
+        api_pool=ReadApiPool(clients=[ReadClient(name="default", api=api)]),
+        name="chronicler",
+        client_name="default",
+    )
+
+
+def test_follow_list_sync(fake_server, follow_list):
+    """Verify the members follow the users, calling the api only on changes"""
+    assert follow_list.sync(users=["user1", "User2", "nobody"]) == {"user1", "user2"}
+    fake_list = fake_server.fake.lists[follow_list.list_id]
+    assert fake_list["mode"] == "private"
+    assert fake_list["members"] == {1, 2}
+    calls = fake_server.fake.stats.copy()
+    assert follow_list.sync(users=["user1", "User2", "nobody"]) == {"user1", "user2"}
+    assert fake_server.fake.stats == calls
+    assert follow_list.sync(users=["user2", "user3"]) == {"user2", "user3"}
+    assert fake_list["members"] == {2, 3}
+
+
+def test_follow_list_get_new_tweets(fake_server, follow_list):
+    """Verify the list timeline is read down to since_id and split per user"""
+    follow_list.sync(users=["user1", "user2"])
+    tweets_by_user, newest_id = follow_list.get_new_tweets()
+    assert set(tweets_by_user) == {"user1", "user2"}
+    assert newest_id == max(tweets[0].id for tweets in tweets_by_user.values())
+
+    # 50 tweets of each user, 4 pages of 30 tweets
+    since_id = newest_id - 50 * 60 * ID_FACTOR
+    follow_list.set_since_id(since_id=since_id)
+    with patch("list_ingestion.LIST_PAGE_SIZE", 30):
+        tweets_by_user, _ = follow_list.get_new_tweets()
+    for user in ("user1", "user2"):
+        status_ids = [tweet.id for tweet in tweets_by_user[user]]
+        assert len(status_ids) == 50
+        assert status_ids == sorted(status_ids, reverse=True)
+        assert min(status_ids) > since_id
+    assert fake_server.fake.stats["/lists/statuses"] == 5
+
+
+def test_follow_list_get_new_tweets_records_gaps_of_skipped_tweets(
+    follow_list, state_store
+):
+    """Verify the tweets past MAX_BACKFILL are left as backfill gaps"""
+    follow_list.sync(users=["user1", "user2"])
+    _, newest_id = follow_list.get_new_tweets()
+    since_id = newest_id - 50 * 60 * ID_FACTOR
+    follow_list.set_since_id(since_id=since_id)
+    state_store.set_last_status_id(user="user2", status_id=newest_id)
+    with patch("list_ingestion.LIST_PAGE_SIZE", 30), patch(
+        "list_ingestion.MAX_BACKFILL", 60
+    ):
+        tweets_by_user, _ = follow_list.get_new_tweets(members=["user1", "user2"])
+    oldest_id = min(tweet.id for tweets in tweets_by_user.values() for tweet in tweets)
+    assert oldest_id > since_id
+    assert state_store.get_backfill_gaps(user="user1") == [(since_id, oldest_id - 1, 0)]
+    # the tweets of user2 were already read up to its newest tweet
+    assert state_store.get_backfill_gaps(user="user2") == []
@@ -0,0 +1,74 @@
+"""test_metrics.py
+
+Tests for the Metrics and InstrumentedApi classes from the metrics module
+"""
+from unittest.mock import patch
+
+import pytest
+from twitter import TwitterError
+
+from metrics import InstrumentedApi, Metrics
+
+
+@pytest.fixture(name="metrics")
+def get_metrics():
+    return Metrics()
+
+
+@patch("twitter.api.Api.GetUserTimeline")
+def test_instrumented_api_records_calls(mock_get, metrics, test_status):
+    """Verify calls and errors are counted while Api is still patchable"""
+    api = InstrumentedApi(client_name="default", metrics=metrics)
+    mock_get.return_value = [test_status("quoted_tweet")]
+    assert api.GetUserTimeline(screen_name="_b_axe") == mock_get.return_value
+    mock_get.assert_called_with(screen_name="_b_axe")
+
+    mock_get.side_effect = TwitterError([{"code": 136, "message": "blocked"}])
+    with pytest.raises(TwitterError):
+        api.GetUserTimeline(screen_name="_b_axe")
+
+    assert metrics.calls[("GetUserTimeline", "default")] == 2
+    assert metrics.errors[("GetUserTimeline", "default", "136")] == 1
+    assert metrics.latency_buckets[("GetUserTimeline", "default")][-1] == 2
+
+
+def test_metrics_summary_since_snapshot(metrics):
+    """Verify the summary only counts the calls made after the snapshot"""
+    metrics.record_call(method="GetUserTimeline", client="default", latency=1)
+    snapshot = metrics.snapshot()
+    assert metrics.summary(since=snapshot) == "API calls: none"
+    metrics.record_call(method="PostUpdate", client="write", latency=2)
+    metrics.record_call(method="PostUpdate", client="write", latency=4, error_code=185)
+    assert metrics.summary(since=snapshot) == (
+        "API calls: PostUpdate=2 (1 errors, 3.00s avg)"
+    )
+
+
+def test_metrics_prometheus_file(metrics, tmp_path):
+    """Verify the metrics file is written in the Prometheus text format"""
+    api = InstrumentedApi(client_name="default", metrics=metrics)
+    api.rate_limit.set_limit(
+        url=f"{api.base_url}/statuses/user_timeline.json",
+        limit=900,
+        remaining=899,
+        reset=2000,
+    )
+    metrics.record_call(method="GetUserTimeline", client="default", latency=0.2)
+    metrics_file = tmp_path.joinpath("metrics.prom")
+    metrics.write_prometheus_file(file=metrics_file)
+    lines = metrics_file.read_text().splitlines()
+    assert 'twitter_api_calls_total{method="GetUserTimeline",client="default"} 1' in (
+        lines
+    )
+    assert (
+        'twitter_api_call_seconds_bucket{method="GetUserTimeline",'
+        'client="default",le="0.1"} 0'
+    ) in lines
+    assert (
+        'twitter_api_call_seconds_bucket{method="GetUserTimeline",'
+        'client="default",le="0.25"} 1'
+    ) in lines
+    assert (
+        'twitter_rate_limit_remaining{client="default",'
+        'endpoint="/statuses/user_timeline"} 899'
+    ) in lines
@@ -0,0 +1,62 @@
+"""test_poll_scheduler.py
+
+Tests for the PollScheduler class from the poll_scheduler module
+"""
+import pytest
+
+from poll_scheduler import PollScheduler
+
+
+@pytest.fixture(name="poll_scheduler")
+def get_poll_scheduler(state_store):
+    return PollScheduler(state_store=state_store, min_interval=60, max_interval=600)
+
+
+def test_poll_scheduler_new_user_is_due(poll_scheduler):
+    """Verify users that have never been polled are due"""
+    assert poll_scheduler.users_due(users=["_b_axe", "FTBandFTR"], now=0) == [
+        "_b_axe",
+        "FTBandFTR",
+    ]
+
+
+def test_poll_scheduler_backs_off_quiet_user(poll_scheduler):
+    """Verify the interval of a quiet user doubles up to the maximum"""
+    intervals = [
+        poll_scheduler.record_poll(
+            user="_b_axe", found_new_tweets=False, found_quoted_tweets=False
+        )
+        for _ in range(5)
+    ]
+    assert intervals == [120, 240, 480, 600, 600]
+
+
+def test_poll_scheduler_speeds_up_active_user(poll_scheduler):
+    """Verify the interval shrinks once a quiet user becomes active"""
+    for _ in range(4):
+        poll_scheduler.record_poll(
+            user="_b_axe", found_new_tweets=False, found_quoted_tweets=False
+        )
+    assert (
+        poll_scheduler.record_poll(
+            user="_b_axe", found_new_tweets=True, found_quoted_tweets=False
+        )
+        == 300
+    )
+    assert (
+        poll_scheduler.record_poll(
+            user="_b_axe", found_new_tweets=True, found_quoted_tweets=True
+        )
+        == 60
+    )
+
+
+def test_poll_scheduler_users_due(poll_scheduler):
+    """Verify a user is not due before its next poll time"""
+    poll_scheduler.record_poll(
+        user="_b_axe", found_new_tweets=False, found_quoted_tweets=False, polled_at=0
+    )
+    assert poll_scheduler.users_due(users=["_b_axe"], now=119) == []
+    assert poll_scheduler.users_due(users=["_b_axe"], now=120) == ["_b_axe"]
+    poll_scheduler.defer(user="_b_axe", until=1000)
+    assert poll_scheduler.users_due(users=["_b_axe"], now=120) == []
@@ -0,0 +1,127 @@
+"""test_post_queue.py
+
+Tests for the TokenBucket and PostQueue classes from the post_queue module
+"""
+import json
+from unittest.mock import MagicMock
+
+from twitter import TwitterError
+
+from post_queue import PostQueue, TokenBucket
+from wrapped_tweet import Tweet
+
+
+def test_token_bucket_refills_at_rate():
+    """Verify a burst empties the bucket and tokens come back over time"""
+    bucket = TokenBucket(capacity=2, rate=0.1, updated_at=0)
+    assert bucket.take(now=0)
+    assert bucket.take(now=0)
+    assert not bucket.take(now=5)
+    assert bucket.take(now=10)
+
+
+def get_tweet(status_id: int, created_at: str, replied_to: int = None) -> Tweet:
+    return Tweet.from_json(
+        {
+            "id": status_id,
+            "id_str": str(status_id),
+            "text": "quote",
+            "created_at": f"Wed Mar 11 {created_at} +0000 2020",
+            "user": {"screen_name": "_b_axe"},
+            "in_reply_to_status_id": replied_to,
+            "quoted_status_id": status_id * 10,
+            "quoted_status": {"text": "quoted", "user": {"screen_name": "quoted"}},
+        }
+    )
+
+
+def test_post_queue_posts_freshest_first(state_store, test_status):
+    """Verify queued tweets are posted freshest first within the budget"""
+    post_queue = PostQueue(state_store=state_store, capacity=1, rate=0)
+    older_tweet = Tweet(test_status("quoted_tweet"))
+    newer_tweet = Tweet(test_status("replied_to_quoted_tweet"))
+    assert older_tweet.raw_tweet.created_at_in_seconds < (
+        newer_tweet.raw_tweet.created_at_in_seconds
+    )
+    post_queue.put([older_tweet, newer_tweet])
+    assert len(post_queue) == 2
+
+    post = MagicMock()
+    assert post_queue.post_queued(post=post) == 1
+    assert post.call_args[0][0][0].id == newer_tweet.id
+    assert len(post_queue) == 1
+
+
+def test_post_queue_posts_replies_of_a_thread_in_order(state_store):
+    """Verify a reply waits for the queued status of its thread it replies to"""
+    post_queue = PostQueue(state_store=state_store, capacity=5, rate=0)
+    post_queue.put(
+        [
+            get_tweet(3, "10:02:00", replied_to=2),
+            get_tweet(2, "10:01:00", replied_to=1),
+            get_tweet(1, "10:00:00"),
+            get_tweet(4, "09:00:00"),
+        ]
+    )
+    post = MagicMock()
+    assert post_queue.post_queued(post=post) == 2
+    assert post_queue.post_queued(post=post) == 1
+    assert post_queue.post_queued(post=post) == 1
+    assert [call[0][0][0].id for call in post.call_args_list] == [1, 4, 2, 3]
+
+
+def test_post_queue_survives_restart(state_store, test_status):
+    """Verify the queue and the spent tokens are kept by the state store"""
+    post_queue = PostQueue(state_store=state_store, capacity=1, rate=0)
+    post_queue.put([Tweet(test_status("quoted_tweet"))])
+    post_queue.post_queued(post=MagicMock())
+    post_queue.put([Tweet(test_status("replied_to_quoted_tweet"))])
+
+    restarted_post_queue = PostQueue(state_store=state_store, capacity=1, rate=0)
+    assert len(restarted_post_queue) == 1
+    assert restarted_post_queue.post_queued(post=MagicMock()) == 0
+
+
+def test_post_queue_keeps_tweet_on_posting_limit(state_store, test_status):
+    """Verify a posting limit error keeps the tweet and empties the bucket"""
+    post_queue = PostQueue(state_store=state_store, capacity=5, rate=0)
+    post_queue.put([Tweet(test_status("quoted_tweet"))])
+    post = MagicMock(
+        side_effect=TwitterError(
+            [{"code": 185, "message": "User is over daily status update limit."}]
+        )
+    )
+    assert post_queue.post_queued(post=post) == 0
+    assert len(post_queue) == 1
+    assert post_queue.bucket.tokens == 0
+
+
+def test_post_queue_drops_tweet_on_other_error(state_store, test_status):
+    """Verify a tweet that can not be posted does not block the queue"""
+    post_queue = PostQueue(state_store=state_store, capacity=5, rate=0)
+    older_tweet = Tweet(test_status("quoted_tweet"))
+    newer_tweet = Tweet(test_status("replied_to_quoted_tweet"))
+    post_queue.put([older_tweet, newer_tweet])
+    post = MagicMock(side_effect=[FileNotFoundError("screenshot.png"), True])
+    assert post_queue.post_queued(post=post) == 1
+    assert [call[0][0][0].id for call in post.call_args_list] == [
+        newer_tweet.id,
+        older_tweet.id,
+    ]
+    assert len(post_queue) == 0
+
+
+def test_post_queue_posts_tweets_queued_as_status(state_store, test_status):
+    """Verify posts queued with their whole Status can still be posted"""
+    status = test_status("quoted_tweet")
+    state_store.queue_post(
+        status_id=status.id,
+        created_at=status.created_at_in_seconds,
+        status_json=json.dumps(status.AsDict()),
+        file_path="screenshot.png",
+    )
+    post = MagicMock()
+    assert PostQueue(state_store=state_store, capacity=1, rate=0).post_queued(post=post)
+    posted_tweet = post.call_args[0][0][0]
+    assert posted_tweet.for_the_record_message == Tweet(status).for_the_record_message
+    assert posted_tweet.screen_capture_file_path_quoted_tweet == "screenshot.png"
@@ -0,0 +1,52 @@
+"""test_profiler.py
+
+Tests for the RunProfiler class from the profiler module
+"""
+import json
+import pstats
+
+from profiler import RunProfiler
+
+
+def test_run_profiler_report(tmp_path):
+    """Verify stage timings are summed per stage and per user"""
+    profiler = RunProfiler(reports_dir=tmp_path, profile_runs=False)
+    for user in ("_b_axe", "FTBandFTR"):
+        with profiler.stage("fetch", user=user):
+            pass
+    with profiler.stage("post"):
+        pass
+    report_file = profiler.finish_run(elapsed=1.5)
+    report = json.loads(report_file.read_text())
+    assert report["elapsed"] == 1.5
+    assert report["stages"]["fetch"]["calls"] == 2
+    assert report["stages"]["post"]["calls"] == 1
+    assert set(report["users"]) == {"_b_axe", "FTBandFTR"}
+    assert "profile" not in report
+
+
+def test_run_profiler_dumps_profile_of_slow_run(tmp_path):
+    """Verify the profile is dumped only for a run slower than the threshold"""
+    profiler = RunProfiler(reports_dir=tmp_path, profile_runs=True, slow_run_seconds=1)
+    with profiler.stage("filter", user="_b_axe"):
+        sorted(range(1000))
+    assert "profile" not in json.loads(profiler.finish_run(elapsed=0.5).read_text())
+
+    profiler.start_run()
+    with profiler.stage("filter", user="_b_axe"):
+        sorted(range(1000))
+    report = json.loads(profiler.finish_run(elapsed=2).read_text())
+    stats = pstats.Stats(str(tmp_path.joinpath(report["profile"])))
+    assert stats.total_calls > 0
+
+
+def test_run_profiler_keeps_last_reports(tmp_path):
+    """Verify only the reports of the last runs are kept"""
+    profiler = RunProfiler(reports_dir=tmp_path, reports_kept=2)
+    for name in ("run-1", "run-2", "run-3"):
+        tmp_path.joinpath(f"{name}.json").write_text("{}")
+    profiler.remove_old_reports()
+    assert sorted(report.name for report in tmp_path.glob("*.json")) == [
+        "run-2.json",
+        "run-3.json",
+    ]
@@ -0,0 +1,96 @@
+"""test_rate_limits.py
+
+Tests for the RateLimitBudget class from the rate_limits module
+"""
+import time
+from unittest.mock import patch
+
+import pytest
+from twitter import Api, TwitterError
+
+from api_pool import READ_API_POOL, ReadClient
+from rate_limits import RateLimitBudget
+from twitter_helpers import (
+    USER_TIMELINE_ENDPOINT,
+    TwitterRateLimitException,
+    get_recent_tweets_for_user,
+)
+
+RESET_AT = 2000
+
+
+@pytest.fixture(name="rate_limit_budget")
+def get_rate_limit_budget():
+    api = Api()
+    api.rate_limit.set_limit(
+        url=f"{api.base_url}{USER_TIMELINE_ENDPOINT}.json",
+        limit=900,
+        remaining=3,
+        reset=RESET_AT,
+    )
+    return RateLimitBudget(api=api, reserve=1)
+
+
+def test_rate_limit_budget_counts_reserved_calls(rate_limit_budget):
+    """Verify calls are refused once the reported budget is spent"""
+    assert rate_limit_budget.remaining(USER_TIMELINE_ENDPOINT, now=1000) == 2
+    assert rate_limit_budget.acquire(USER_TIMELINE_ENDPOINT, now=1000)
+    assert rate_limit_budget.acquire(USER_TIMELINE_ENDPOINT, now=1000)
+    assert not rate_limit_budget.acquire(USER_TIMELINE_ENDPOINT, now=1000)
+    assert rate_limit_budget.reset_at(USER_TIMELINE_ENDPOINT) == RESET_AT
+
+
+def test_rate_limit_budget_after_reset(rate_limit_budget):
+    """Verify the budget is not enforced once the window has reset"""
+    for _ in range(3):
+        rate_limit_budget.acquire(USER_TIMELINE_ENDPOINT, now=1000)
+    assert rate_limit_budget.acquire(USER_TIMELINE_ENDPOINT, now=RESET_AT)
+
+
+def test_rate_limit_budget_follows_api_headers(rate_limit_budget):
+    """Verify a new response replaces the reported budget, and the calls
+    still in flight are counted until they are released"""
+    for _ in range(2):
+        rate_limit_budget.acquire(USER_TIMELINE_ENDPOINT, now=1000)
+    rate_limit_budget.api.rate_limit.set_limit(
+        url=rate_limit_budget.endpoint_url(USER_TIMELINE_ENDPOINT),
+        limit=900,
+        remaining=10,
+        reset=RESET_AT,
+    )
+    assert rate_limit_budget.remaining(USER_TIMELINE_ENDPOINT, now=1000) == 7
+    rate_limit_budget.release(USER_TIMELINE_ENDPOINT)
+    assert rate_limit_budget.remaining(USER_TIMELINE_ENDPOINT, now=1000) == 8
+    rate_limit_budget.release(USER_TIMELINE_ENDPOINT)
+    assert rate_limit_budget.remaining(USER_TIMELINE_ENDPOINT, now=1000) == 9
+
+
+@patch("twitter.api.Api.GetUserTimeline")
+def test_get_recent_tweets_for_user_rate_limited(mock_get_user_timeline):
+    """Verify error 88 raises TwitterRateLimitException instead of sleeping"""
+    mock_get_user_timeline.side_effect = TwitterError(
+        [{"code": 88, "message": "Rate limit exceeded"}]
+    )
+    reset_at = int(time.time()) + 900
+    client = ReadClient(name="default", api=Api())
+    client.api.rate_limit.set_limit(
+        url=client.rate_limits.endpoint_url(USER_TIMELINE_ENDPOINT),
+        limit=900,
+        remaining=2,
+        reset=reset_at,
+    )
+    with patch.object(READ_API_POOL, "clients", [client]), pytest.raises(
+        TwitterRateLimitException
+    ) as error:
+        get_recent_tweets_for_user(twitter_user="_b_axe")
+    assert error.value.reset_at == reset_at
+    assert mock_get_user_timeline.call_count == 1
+
+
+def test_rate_limit_budget_exhausted_by_rate_limit_error():
+    """Verify a rate limit error spends the window, even if never reported"""
+    budget = RateLimitBudget(api=Api(), reserve=1)
+    assert budget.remaining(USER_TIMELINE_ENDPOINT, now=1000) == float("inf")
+    budget.exhaust(USER_TIMELINE_ENDPOINT, now=1000)
+    assert not budget.acquire(USER_TIMELINE_ENDPOINT, now=1000)
+    assert budget.reset_at(USER_TIMELINE_ENDPOINT) == 1000 + 15 * 60
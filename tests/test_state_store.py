@@ -0,0 +1,127 @@
+"""test_state_store.py
+
+Tests for the StateStore class from the state_store module
+"""
+import sqlite3
+
+from state_store import StateStore
+
+
+def test_state_store_replied_to(state_store):
+    """Verify replied to status ids can be added and looked up as str or int"""
+    assert "1236873389073141760" not in state_store
+    state_store.add_replied_to(status_id=1236873389073141760)
+    state_store.add_replied_to(status_id="1236873389073141760")
+    assert "1236873389073141760" in state_store
+    assert 1236873389073141760 in state_store
+    assert state_store.count_replied_to() == 1
+    assert None not in state_store
+
+
+def test_state_store_import_replied_to_file(state_store, tmp_path):
+    """Verify status ids of the legacy text file are imported"""
+    replied_to_file = tmp_path.joinpath("list_of_status_ids_replied_to.txt")
+    replied_to_file.write_text("1218223881045139457\n\n1217726499781873664\n")
+    assert state_store.import_replied_to_file(file=replied_to_file) == 2
+    assert "1218223881045139457" in state_store
+    assert "1217726499781873664" in state_store
+
+
+def test_state_store_persists_between_instances(tmp_path):
+    """Verify replied to status ids are still there after reopening the store"""
+    db_file = tmp_path.joinpath("chronicler.db")
+    state_store = StateStore(db_file=db_file)
+    state_store.add_replied_to(status_id=1243010309067071489)
+    state_store.close()
+    assert "1243010309067071489" in StateStore(db_file=db_file)
+
+
+def test_state_store_last_status_id(state_store):
+    """Verify the last status id checked is saved per user"""
+    assert state_store.get_last_status_id(user="_b_axe") is None
+    state_store.set_last_status_id(user="_b_axe", status_id="1236873389073141760")
+    state_store.set_last_status_id(user="_b_axe", status_id="1243010309067071489")
+    assert state_store.get_last_status_id(user="_b_axe") == 1243010309067071489
+    assert state_store.get_last_status_id(user="FTBandFTR") is None
+
+
+def test_state_store_backfill_gaps(state_store):
+    """Verify a backfill gap is kept by its since_id as its max_id moves down"""
+    state_store.set_backfill_gap(user="_b_axe", since_id=100, max_id=190, fetched=10)
+    state_store.set_backfill_gap(user="_b_axe", since_id=200, max_id=290, fetched=10)
+    state_store.set_backfill_gap(user="_b_axe", since_id=100, max_id=150, fetched=50)
+    assert state_store.get_backfill_gaps(user="_b_axe") == [
+        (200, 290, 10),
+        (100, 150, 50),
+    ]
+    state_store.remove_backfill_gap(user="_b_axe", since_id=200)
+    assert state_store.get_backfill_gaps(user="_b_axe") == [(100, 150, 50)]
+    assert state_store.get_backfill_gaps(user="FTBandFTR") == []
+
+
+def test_state_store_batch(state_store):
+    """Verify writes in a batch are committed when the batch exits"""
+    with state_store.batch():
+        state_store.add_replied_to(status_id=1236873389073141760)
+        with state_store.batch():
+            state_store.set_last_status_id(user="_b_axe", status_id=1)
+        assert 1236873389073141760 not in state_store
+        assert state_store.get_last_status_id(user="_b_axe") is None
+    assert 1236873389073141760 in state_store
+    assert state_store.get_last_status_id(user="_b_axe") == 1
+
+
+def test_state_store_lock_user(state_store):
+    """Verify a user locked by one owner can not be locked by another"""
+    assert state_store.lock_user(user="_b_axe", ttl=60, owner="run-1")
+    assert state_store.lock_user(user="_b_axe", ttl=60, owner="run-1")
+    assert not state_store.lock_user(user="_b_axe", ttl=60, owner="run-2")
+    state_store.unlock_user(user="_b_axe", owner="run-1")
+    assert state_store.lock_user(user="_b_axe", ttl=0, owner="run-2")
+    # An expired lock can be taken over
+    assert state_store.lock_user(user="_b_axe", ttl=60, owner="run-1")
+
+
+def test_state_store_renew_user_lock(state_store):
+    """Verify a lock is renewed only by the owner that holds it"""
+    assert state_store.lock_user(user="_b_axe", ttl=-1, owner="run-1")
+    assert state_store.renew_user_lock(user="_b_axe", ttl=60, owner="run-1")
+    assert not state_store.lock_user(user="_b_axe", ttl=60, owner="run-2")
+    assert not state_store.renew_user_lock(user="_b_axe", ttl=60, owner="run-2")
+    state_store.unlock_user(user="_b_axe", owner="run-1")
+    assert not state_store.renew_user_lock(user="_b_axe", ttl=60, owner="run-1")
+
+
+def test_state_store_import_checked_statuses_dir(state_store, tmp_path):
+    """Verify the last status id of each user file is imported"""
+    checked_statuses_dir = tmp_path.joinpath("statuses_checked")
+    checked_statuses_dir.mkdir()
+    checked_statuses_dir.joinpath("_b_axe.txt").write_text("1\n2\n")
+    checked_statuses_dir.joinpath("FTBandFTR.txt").write_text("3\n")
+    state_store.set_last_status_id(user="FTBandFTR", status_id=4)
+    assert state_store.import_checked_statuses_dir(dir_path=checked_statuses_dir) == 1
+    assert state_store.get_last_status_id(user="_b_axe") == 2
+    assert state_store.get_last_status_id(user="FTBandFTR") == 4
+
+
+def test_state_store_adds_missing_columns(tmp_path):
+    """Verify a post queue of an older database gets the new columns"""
+    db_file = tmp_path.joinpath("chronicler.db")
+    connection = sqlite3.connect(str(db_file))
+    connection.execute(
+        "CREATE TABLE post_queue (status_id INTEGER PRIMARY KEY, "
+        "created_at REAL NOT NULL, status_json TEXT NOT NULL, file_path TEXT, "
+        "queued_at REAL NOT NULL)"
+    )
+    connection.execute("INSERT INTO post_queue VALUES (1, 100, '{}', NULL, 0)")
+    connection.execute("INSERT INTO post_queue VALUES (2, 200, '[]', NULL, 0)")
+    connection.commit()
+    connection.close()
+
+    state_store = StateStore(db_file=db_file)
+    state_store.queue_post(status_id=3, created_at=150, status_json="3", file_path="")
+    assert state_store.get_queued_posts(limit=5) == [
+        ("[]", None),
+        ("3", ""),
+        ("{}", None),
+    ]
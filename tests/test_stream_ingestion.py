@@ -0,0 +1,169 @@
+"""test_stream_ingestion.py
+
+Tests for the StreamConsumer class from the stream_ingestion module,
+against the stream of the fake Twitter API server
+"""
+import re
+import time
+from threading import Event, Thread
+from unittest.mock import MagicMock, patch
+
+import pytest
+import twitter
+
+from api_pool import ReadApiPool, ReadClient
+from metrics import InstrumentedApi, Metrics
+from config import PROJECT_DIR_PATH
+from stream_ingestion import StreamConsumer, open_filter_stream
+from tests.fake_twitter_api import FakeTwitter
+
+
+@pytest.fixture(name="fake_twitter")
+def get_fake_twitter():
+    return FakeTwitter(users=10, tweet_interval=1, stream_duration=1.5)
+
+
+def get_api(port: int) -> InstrumentedApi:
+    return InstrumentedApi(
+        client_name="default",
+        metrics=Metrics(),
+        consumer_key="key",
+        consumer_secret="secret",
+        access_token_key="token",
+        access_token_secret="secret",
+        base_url=f"http://127.0.0.1:{port}/1.1",
+        stream_url=f"http://127.0.0.1:{port}/1.1",
+        timeout=60,
+    )
+
+
+class RecordingEvent(Event):
+    """Event recording the timeout of every wait"""
+
+    def __init__(self):
+        super().__init__()
+        self.waits = []
+
+    def wait(self, timeout=None):
+        self.waits.append(timeout)
+        return super().wait(timeout)
+
+
+def test_open_filter_stream(fake_server):
+    """Verify the stream is opened with the python-twitter version pinned in
+    requirements.txt, the one whose private Api._RequestStream is used"""
+    requirements = PROJECT_DIR_PATH.joinpath("requirements.txt").read_text()
+    pinned_version = re.search(r"^python-twitter==(\S+)$", requirements, re.M)[1]
+    assert twitter.__version__ == pinned_version
+
+    api = get_api(fake_server.server_port)
+    response = open_filter_stream(api=api, follow=[1, 2])
+    try:
+        assert response.status_code == 200
+        assert b'"user"' in next(line for line in response.iter_lines() if line)
+    finally:
+        response.close()
+    assert fake_server.fake.stats["/statuses/filter"] == 1
+
+    api = get_api(fake_server.server_port)
+    api.stream_url = api.stream_url.replace("/1.1", "/2")
+    with pytest.raises(twitter.TwitterError):
+        open_filter_stream(api=api, follow=[1])
+
+
+def test_stream_consumer(fake_server):
+    """Verify the tweets of the followed users are chronicled in order after
+    a gap fill, and the stream is reconnected, after a growing wait, once it
+    ends"""
+    api = get_api(fake_server.server_port)
+    events = []
+    consumer = StreamConsumer(
+        api=api,
+        fill_gap=lambda stop_event: events.append("fill gap"),
+        chronicle=lambda user, tweet: events.append((user, tweet.id)),
+        backoff_min=0.1,
+        backoff_max=10,
+    )
+    stop_event = RecordingEvent()
+    with patch(
+        "twitter_helpers.READ_API_POOL",
+        ReadApiPool(clients=[ReadClient(name="default", api=api)]),
+    ), patch(
+        "stream_ingestion.read_list_of_users_to_follow",
+        return_value=["user1", "user2", "nobody"],
+    ):
+        thread = Thread(target=consumer.run, kwargs={"stop_event": stop_event})
+        thread.start()
+        deadline = time.monotonic() + 10
+        while events.count("fill gap") < 3 and time.monotonic() < deadline:
+            time.sleep(0.1)
+        stop_event.set()
+        thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert fake_server.fake.stats["/statuses/filter"] >= 3
+    assert stop_event.waits[:2] == [0.1, 0.2]
+    assert events[0] == "fill gap"
+    tweets = [event for event in events if event != "fill gap"]
+    assert {user for user, _ in tweets} == {"user1", "user2"}
+    for user in ("user1", "user2"):
+        status_ids = [
+            status_id for tweet_user, status_id in tweets if tweet_user == user
+        ]
+        assert status_ids == sorted(status_ids)
+
+
+def test_stream_consumer_backoff(fake_server):
+    """Verify failed connections are retried after a growing wait"""
+    consumer = StreamConsumer(
+        api=get_api(fake_server.server_port), backoff_min=1, backoff_max=4
+    )
+    waits = []
+
+    class StopAfterWaits(Event):
+        def wait(self, timeout=None):
+            waits.append(timeout)
+            if len(waits) == 4:
+                self.set()
+
+    with patch("stream_ingestion.read_list_of_users_to_follow", return_value=[]):
+        consumer.run(stop_event=StopAfterWaits())
+    assert waits == [1, 2, 4, 4]
+    assert fake_server.fake.stats["/statuses/filter"] == 0
+
+
+def test_stream_consumer_drains_post_queue(fake_server):
+    """Verify the post queue is drained on a timer while nothing is streamed"""
+    post_queued = MagicMock(return_value=0)
+    consumer = StreamConsumer(
+        api=get_api(fake_server.server_port),
+        backoff_min=60,
+        post_queued=post_queued,
+        post_interval=0.1,
+    )
+    stop_event = Event()
+    with patch("stream_ingestion.read_list_of_users_to_follow", return_value=[]):
+        thread = Thread(target=consumer.run, kwargs={"stop_event": stop_event})
+        thread.start()
+        time.sleep(0.55)
+        stop_event.set()
+        thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert post_queued.call_count >= 3
+
+
+def test_stream_consumer_bounds_queue():
+    """Verify reading the stream waits once queue_size tweets are waiting"""
+    consumer = StreamConsumer(api=MagicMock(), queue_size=2)
+    release = Event()
+    consumer.submit(release.wait)
+    consumer.submit(release.wait)
+    reader = Thread(target=consumer.submit, args=(release.wait,))
+    reader.start()
+    reader.join(timeout=0.5)
+    assert reader.is_alive()
+
+    release.set()
+    reader.join(timeout=5)
+    assert not reader.is_alive()
+    consumer.executor.shutdown(wait=True)
@@ -0,0 +1,64 @@
+"""test_tweet_decoder.py
+
+Tests for Tweet.from_json and the tweet_decoder module
+"""
+import json
+from typing import Dict, List
+
+import pytest
+from twitter import Status, TwitterError
+
+from config import TEST_JSON_FILE
+from metrics import InstrumentedApi, Metrics
+from tweet_decoder import decode_timeline
+from util import fetch_test_data_file
+from wrapped_tweet import Tweet
+
+
+def get_fixture_statuses() -> List[Dict]:
+    statuses = []
+    for fixture in fetch_test_data_file(file=TEST_JSON_FILE).values():
+        for status in fixture if isinstance(fixture, list) else [fixture]:
+            statuses.append(status)
+    return statuses
+
+
+@pytest.mark.parametrize("status", get_fixture_statuses())
+def test_tweet_from_json_matches_tweet_of_status(status):
+    """Verify a decoded Tweet has the fields of the Tweet of the Status"""
+    assert (
+        Tweet.from_json(status).as_dict()
+        == Tweet(Status.NewFromJsonDict(status)).as_dict()
+    )
+
+
+def test_decode_timeline_raises_twitter_errors():
+    """Verify error responses raise a TwitterError like python-twitter does"""
+    api = InstrumentedApi(client_name="test", metrics=Metrics())
+    errors = {"errors": [{"code": 88, "message": "Rate limit exceeded"}]}
+    with pytest.raises(TwitterError):
+        decode_timeline(api=api, content=json.dumps(errors).encode())
+    with pytest.raises(TwitterError):
+        decode_timeline(
+            api=api, content=b"<html><title>Twitter / Over capacity</title></html>"
+        )
+
+
+def test_get_user_timeline_tweets(fake_server):
+    """Verify the decoded timeline matches the timeline of Statuses"""
+    base_url = f"http://127.0.0.1:{fake_server.server_port}/1.1"
+    api = InstrumentedApi(
+        client_name="test",
+        metrics=Metrics(),
+        consumer_key="key",
+        consumer_secret="secret",
+        access_token_key="token",
+        access_token_secret="secret",
+        base_url=base_url,
+    )
+    statuses = api.GetUserTimeline(screen_name="user1", count=5)
+    tweets = api.GetUserTimelineTweets(screen_name="user1", count=5)
+    assert [tweet.as_dict() for tweet in tweets] == [
+        Tweet(status).as_dict() for status in statuses
+    ]
+    assert api.metrics.snapshot()["calls"][("GetUserTimelineTweets", "test")] == 1
@@ -2,33 +2,39 @@
 
 Tests for all the helper functions from twitter_helpers.py
 """
-from pathlib import Path
+from typing import List
 from unittest.mock import patch
 
 from twitter import Status
 
 from twitter_helpers import (
     find_quoted_tweets,
+    get_active_users,
+    get_new_tweets_for_user,
     get_recent_tweets_for_user,
+    get_replied_to_status_ids_to_check,
+    iter_timeline_pages,
+    lookup_statuses,
     post_collected_tweets,
     post_reply_to_user_tweet,
     process_tweet,
 )
-from util import file_reader
 from wrapped_tweet import Tweet
 
 
 @patch("twitter.api.Api.GetUserTimeline")
-def test_find_quoted_tweets_for_quoted_tweet(mock_get, test_status):
+def test_find_quoted_tweets_for_quoted_tweet(mock_get, test_status, state_store):
     """Verify find_quoted_tweets method returns Tweet
 
     Notes:
        * Mock GetUserTimeline without making real call to Twitter API
+       * Read and save the state to a temporary state store
     """
     test_tweets = [test_status("quoted_tweet")]
     mock_get.return_value = test_tweets
     user_name = "_b_axe"
-    tweets = find_quoted_tweets(user=user_name)
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        tweets = find_quoted_tweets(user=user_name)
     tweet = tweets[0]
     assert len(tweets) == 1
     assert type(tweets) == list
@@ -41,7 +47,7 @@ def test_find_quoted_tweets_for_quoted_tweet(mock_get, test_status):
 
 
 @patch("twitter.api.Api.GetUserTimeline")
-def test_find_quoted_tweets_for_user_excluded(mock_get, test_status):
+def test_find_quoted_tweets_for_user_excluded(mock_get, test_status, state_store):
     """Verify find_quoted_tweets method returns None
 
     The find_quoted_tweets method returns None for a tweet that
@@ -49,16 +55,19 @@ def test_find_quoted_tweets_for_user_excluded(mock_get, test_status):
 
     Notes:
        * Mock GetUserTimeline without making real call to Twitter API
+       * Read and save the state to a temporary state store
     """
     mock_get.return_value = [test_status("replied_to_quoted_tweet")]
+    state_store.add_replied_to(status_id=1237906602516234240)
     user_name = "_b_axe"
-    tweets = find_quoted_tweets(user=user_name)
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        tweets = find_quoted_tweets(user=user_name)
     assert len(tweets) == 0
     assert type(tweets) == list
 
 
 @patch("twitter.api.Api.GetUserTimeline")
-def test_find_quoted_tweets_for_bot_tweet(mock_get, test_status):
+def test_find_quoted_tweets_for_bot_tweet(mock_get, test_status, state_store):
     """Verify find_quoted_tweets method returns None
 
     The find_quoted_tweets method returns None for a tweet that
@@ -66,32 +75,36 @@ def test_find_quoted_tweets_for_bot_tweet(mock_get, test_status):
 
     Notes:
        * Mock GetUserTimeline without making real call to Twitter API
+       * Read and save the state to a temporary state store
     """
     basic_tweet = test_status("quote_bot_status")
     mock_get.return_value = [basic_tweet]
-    quoted_retweets = find_quoted_tweets(user="_b_axe")
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        quoted_retweets = find_quoted_tweets(user="_b_axe")
     assert not quoted_retweets
     assert len(quoted_retweets) == 0
     assert type(quoted_retweets) == list
 
 
 @patch("twitter.api.Api.GetUserTimeline")
-def test_find_quoted_tweets_for_non_retweet(mock_get, test_status):
+def test_find_quoted_tweets_for_non_retweet(mock_get, test_status, state_store):
     """Verify find_quoted_tweets method returns None
 
     The find_quoted_tweets method returns None for a tweet that is not a retweet.
 
     Notes:
        * Mock GetUserTimeline without making real call to Twitter API
+       * Read and save the state to a temporary state store
     """
     basic_tweet = test_status("basic_tweet")
     mock_get.return_value = [basic_tweet]
-    quoted_retweets = find_quoted_tweets(user="_b_axe")
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        quoted_retweets = find_quoted_tweets(user="_b_axe")
     assert not quoted_retweets
 
 
 @patch("twitter.api.Api.GetUserTimeline")
-def test_find_quoted_tweets_for_users_own_tweet(mock_get, test_status):
+def test_find_quoted_tweets_for_users_own_tweet(mock_get, test_status, state_store):
     """Verify find_quoted_tweets method returns None
 
     The find_quoted_tweets method returns None for a tweet that
@@ -99,10 +112,12 @@ def test_find_quoted_tweets_for_users_own_tweet(mock_get, test_status):
 
     Notes:
        * Mock GetUserTimeline without making real call to Twitter API
+       * Read and save the state to a temporary state store
     """
     basic_tweet = test_status("quote_users_own_status")
     mock_get.return_value = [basic_tweet]
-    quoted_retweets = find_quoted_tweets(user="_b_axe")
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        quoted_retweets = find_quoted_tweets(user="_b_axe")
     assert not quoted_retweets
     assert len(quoted_retweets) == 0
     assert type(quoted_retweets) == list
@@ -184,34 +199,22 @@ def test_post_reply_to_user_tweet(mock_get, test_status):
 
 
 @patch("twitter.api.Api.PostUpdate")
-def test_post_collected_tweets(mock_get, test_status):
-    """Verify post_collected_tweets method returns None
+def test_post_collected_tweets(mock_get, test_status, state_store):
+    """Verify post_collected_tweets method returns True
 
     Notes:
        * Mock PostUpdate without making real call to Twitter API
+       * Replied to status ids are saved to a temporary state store
     """
-    expected_num_of_ids = 4
-    status_id_file = Path(__file__).parent.joinpath(
-        "../conf/list_of_status_ids_replied_to.txt"
-    )
-
-    list_of_status_ids_replied_to = list(file_reader(status_id_file))
-    assert len(list_of_status_ids_replied_to) == expected_num_of_ids, (
-        f"Expected number ({expected_num_of_ids}) of status ids replied to "
-        f"did not match actual ({len(list_of_status_ids_replied_to)})"
-    )
     quoted_tweet = test_status("post_reply_response")
     mock_get.return_value = quoted_tweet
-    response = post_collected_tweets(quoted_tweets=[Tweet(quoted_tweet)])
-    new_list_of_status_ids_replied_to = list(file_reader(status_id_file))
-    assert (
-        str(quoted_tweet.in_reply_to_status_id) == new_list_of_status_ids_replied_to[-1]
-    ), "Expected status id to be last item in list"
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        response = post_collected_tweets(quoted_tweets=[Tweet(quoted_tweet)])
     assert response
-    # clean up by overwriting file with original list
-    with status_id_file.open(mode="w") as f:
-        for line in list_of_status_ids_replied_to:
-            f.write(line + "\n")
+    assert state_store.count_replied_to() == 1
+    assert (
+        str(quoted_tweet.in_reply_to_status_id) in state_store
+    ), "Expected status id to be saved to the state store"
 
 
 def test_process_tweet_for_quoted_tweet(test_status):
@@ -304,3 +307,174 @@ def test_process_tweet_for_user_for_users_own_tweet(test_status):
         status=test_tweet, excluded_ids=["1218223881045139457", "1217726499781873664"],
     )
     assert not quoted_retweets
+
+
+def test_process_tweet_with_looked_up_replied_to_status(test_status):
+    """Verify process_tweet uses replied_to_statuses instead of the api
+
+    The first tweet of the thread is the status the second tweet replies to
+    and each tweet quotes a different tweet.
+    """
+    first_tweet, second_tweet = test_status("quoted_different_tweets_in_same_thread")
+    tweet = process_tweet(
+        status=second_tweet,
+        excluded_ids=[first_tweet.id_str],
+        replied_to_statuses={first_tweet.id: first_tweet},
+    )
+    assert type(tweet) == Tweet
+    assert tweet.id == second_tweet.id
+
+
+def test_process_tweet_with_looked_up_replied_to_status_same_quote(test_status):
+    """Verify process_tweet skips a tweet quoting the same tweet as its thread"""
+    test_tweet = test_status("quoted_tweets_for_tweeted_already_quoted_by_user")
+    replied_to_status = test_status("quoted_tweets_for_tweeted_already_quoted_by_user")
+    replied_to_status.id = test_tweet.in_reply_to_status_id
+    tweet = process_tweet(
+        status=test_tweet,
+        excluded_ids=[str(test_tweet.in_reply_to_status_id)],
+        replied_to_statuses={test_tweet.in_reply_to_status_id: replied_to_status},
+    )
+    assert not tweet
+
+
+def test_get_replied_to_status_ids_to_check(test_status):
+    """Verify only replied to statuses that were processed are looked up"""
+    test_tweets = test_status("quoted_different_tweets_in_same_thread")
+    status_ids = get_replied_to_status_ids_to_check(
+        statuses=test_tweets, excluded_ids=[test_tweets[0].id_str]
+    )
+    assert status_ids == {test_tweets[0].id}
+
+
+@patch("twitter.api.Api.GetStatuses")
+def test_lookup_statuses_in_batches(mock_get, test_status):
+    """Verify lookup_statuses asks for at most 100 statuses per call"""
+    basic_tweet = test_status("basic_tweet")
+    mock_get.side_effect = lambda status_ids, map: {
+        status_id: basic_tweet for status_id in status_ids
+    }
+    statuses = lookup_statuses(status_ids=range(250))
+    assert mock_get.call_count == 3
+    assert [len(c[1]["status_ids"]) for c in mock_get.call_args_list] == [100, 100, 50]
+    assert len(statuses) == 250
+
+
+@patch("twitter.api.Api.GetStatus")
+def test_process_tweet_with_thread_index(mock_get, test_status, state_store):
+    """Verify the thread index answers the same thread check without the api"""
+    first_tweet, second_tweet = test_status("quoted_different_tweets_in_same_thread")
+    state_store.add_replied_to(status_id=first_tweet.id)
+    state_store.add_reply_thread(
+        status_id=first_tweet.id,
+        quoted_tweet_id=first_tweet.quoted_status.id,
+        conversation_root_id=first_tweet.in_reply_to_status_id,
+    )
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        tweet = process_tweet(status=second_tweet, excluded_ids=state_store)
+        assert type(tweet) == Tweet
+        # A later tweet of the thread quoting the first quoted tweet is skipped
+        second_tweet.quoted_status = first_tweet.quoted_status
+        second_tweet.quoted_status_id = first_tweet.quoted_status_id
+        assert not process_tweet(status=second_tweet, excluded_ids=state_store)
+    assert not mock_get.called
+
+
+@patch("twitter.api.Api.PostUpdate")
+def test_post_collected_tweets_adds_reply_thread(mock_get, test_status, state_store):
+    """Verify the quoted tweet and thread of a replied to status are saved"""
+    first_tweet, second_tweet = test_status("quoted_different_tweets_in_same_thread")
+    mock_get.side_effect = lambda in_reply_to_status_id, **kwargs: Status(
+        in_reply_to_status_id=in_reply_to_status_id
+    )
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        post_collected_tweets(quoted_tweets=[Tweet(first_tweet), Tweet(second_tweet)])
+    assert state_store.get_reply_thread(status_id=first_tweet.id) == (
+        first_tweet.quoted_status_id,
+        first_tweet.in_reply_to_status_id,
+    )
+    # The second tweet replies to the first one and joins its thread
+    assert state_store.get_reply_thread(status_id=second_tweet.id) == (
+        second_tweet.quoted_status_id,
+        first_tweet.in_reply_to_status_id,
+    )
+
+
+@patch("twitter.api.Api.PostUpdate")
+def test_post_collected_tweets_in_batch_joins_thread(
+    mock_get, test_status, state_store
+):
+    """Verify a reply posted in a batch inherits the root of its parent's thread"""
+    first_tweet, second_tweet = test_status("quoted_different_tweets_in_same_thread")
+    mock_get.side_effect = lambda in_reply_to_status_id, **kwargs: Status(
+        in_reply_to_status_id=in_reply_to_status_id
+    )
+    with patch("twitter_helpers.STATE_STORE", state_store), state_store.batch():
+        post_collected_tweets(quoted_tweets=[Tweet(first_tweet), Tweet(second_tweet)])
+    assert state_store.get_reply_thread(status_id=second_tweet.id) == (
+        second_tweet.quoted_status_id,
+        first_tweet.in_reply_to_status_id,
+    )
+
+
+def user_timeline(status_ids: List[int]):
+    """Return a GetUserTimeline side effect serving statuses with status_ids"""
+
+    def get_user_timeline(screen_name, since_id=None, max_id=None, count=None):
+        return [
+            Status(id=status_id)
+            for status_id in sorted(status_ids, reverse=True)
+            if (not since_id or status_id > since_id)
+            and (not max_id or status_id <= max_id)
+        ][:count]
+
+    return get_user_timeline
+
+
+@patch("twitter.api.Api.GetUserTimeline")
+def test_get_new_tweets_for_user_records_backfill_gap(mock_get, state_store):
+    """Verify a full page of new tweets leaves a gap down to the last status id"""
+    state_store.set_last_status_id(user="_b_axe", status_id=100)
+    mock_get.side_effect = user_timeline(status_ids=range(90, 150))
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        user_tweets = get_new_tweets_for_user(user="_b_axe")
+    assert [tweet.id for tweet in user_tweets] == list(range(149, 139, -1))
+    assert state_store.get_backfill_gaps(user="_b_axe") == [(100, 139, 10)]
+
+
+@patch("twitter.api.Api.GetUserTimeline")
+def test_iter_timeline_pages(mock_get):
+    """Verify pages follow max_id down to since_id, or stop at limit"""
+    mock_get.side_effect = user_timeline(status_ids=range(90, 150))
+    pages = iter_timeline_pages(
+        twitter_user="_b_axe", since_id=100, max_id=139, count=15
+    )
+    assert [[tweet.id for tweet in page] for page in pages] == [
+        list(range(139, 124, -1)),
+        list(range(124, 109, -1)),
+        list(range(109, 100, -1)),
+    ]
+    pages = iter_timeline_pages(
+        twitter_user="_b_axe", since_id=100, max_id=139, count=15, limit=20
+    )
+    assert [len(page) for page in pages] == [15, 5]
+
+
+@patch("twitter.api.Api.UsersLookup")
+def test_get_active_users(mock_lookup, state_store):
+    """Verify only the users with a tweet newer than the last checked are active"""
+    for user in ("active", "idle", "protected", "suspended", "backfilling"):
+        state_store.set_last_status_id(user=user, status_id=100)
+    state_store.set_backfill_gap(user="backfilling", since_id=50, max_id=80, fetched=10)
+    mock_lookup.return_value = [
+        {"screen_name": "Active", "status": {"id": 200}},
+        {"screen_name": "idle", "status": {"id": 100}},
+        {"screen_name": "protected"},
+        {"screen_name": "new", "status": {"id": 100}},
+        {"screen_name": "backfilling", "status": {"id": 100}},
+    ]
+    users = ["active", "idle", "protected", "suspended", "new", "backfilling"]
+    with patch("twitter_helpers.STATE_STORE", state_store):
+        active_users = get_active_users(users=users)
+    assert active_users == ["active", "protected", "new", "backfilling"]
+    assert mock_lookup.call_args[1]["screen_name"] == users
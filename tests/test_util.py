@@ -0,0 +1,25 @@
+"""test_util.py
+
+Tests for the file helpers from util.py
+"""
+import pytest
+
+from util import read_last_line
+
+
+@pytest.mark.parametrize(
+    "content,expected_line",
+    [
+        ("1236873389073141760\n1243010309067071489\n", "1243010309067071489"),
+        ("1236873389073141760\n1243010309067071489", "1243010309067071489"),
+        ("1236873389073141760\n\n\n", "1236873389073141760"),
+        ("", None),
+    ],
+)
+@pytest.mark.parametrize("block_size", [1, 4, 1024])
+def test_read_last_line(tmp_path, content, expected_line, block_size):
+    """Verify read_last_line returns the last non empty line"""
+    status_file = tmp_path.joinpath("_b_axe.txt")
+    status_file.write_text(content)
+    last_line = read_last_line(file_path=str(status_file), block_size=block_size)
+    assert last_line == expected_line
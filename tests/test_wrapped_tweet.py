@@ -168,3 +168,29 @@ def test_tweet_quoted_multiple_user_reply_with_mentions_and_no_text(test_status)
 def test_tweet_quoted_multiple_user_reply_with_mentions_and_text(test_status):
     """Verify Tweet()"""
     test_tweet = test_status("quoted_multiple_user_reply_with_mentions_and_text")
+
+
+def test_tweet_without_raw_tweet(test_status):
+    """Verify the extracted fields outlive the dropped Status"""
+    test_tweet = test_status("quoted_tweet")
+    tweet = Tweet(test_tweet)
+    kept_fields = tweet.as_dict()
+    tweet.drop_raw_tweet()
+    assert not hasattr(tweet, "__dict__")
+    assert tweet.raw_tweet is None
+    assert tweet.quoted_status is None
+    assert tweet.as_dict() == kept_fields
+    assert tweet.quoted_tweet_id == test_tweet.quoted_status.id
+    assert tweet.created_at_in_seconds == test_tweet.created_at_in_seconds
+    assert Tweet(test_tweet, keep_raw_tweet=False).as_dict() == kept_fields
+
+
+def test_tweet_from_dict(test_status):
+    """Verify a Tweet rebuilt from as_dict has the same message and urls"""
+    tweet = Tweet(test_status("quoted_a_reply_to"))
+    rebuilt_tweet = Tweet.from_dict(tweet.as_dict())
+    assert rebuilt_tweet.raw_tweet is None
+    assert rebuilt_tweet.for_the_record_message == tweet.for_the_record_message
+    assert rebuilt_tweet.quoted_tweet_url == tweet.quoted_tweet_url
+    assert rebuilt_tweet.tweet_url == tweet.tweet_url
+    assert rebuilt_tweet.screen_capture_file_path_quoted_tweet is None
@@ -1,72 +1,69 @@
-from time import sleep
-from typing import List, Union, Optional
+import time
+from functools import partial
+from typing import (
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Union,
+)
 
-from retry import retry
 from twitter import Api, Status, TwitterError
 
+from api_pool import READ_API_POOL
 from config import (
-    CHECKED_STATUSES_DIR_PATH,
-    LIST_OF_STATUS_IDS_REPLIED_TO_FILE,
-    LIST_OF_STATUS_IDS_REPLIED_TO,
+    API_URLS,
+    BACKFILL_PAGE_SIZE,
+    FAST_DECODE,
+    KEEP_RAW_TWEETS,
+    MAX_BACKFILL,
+    TIMELINE_PAGE_SIZE,
     TWITTER_API_USER,
-    READ_APP_KEY,
-    READ_APP_SECRET,
-    READ_OAUTH_TOKEN,
-    READ_OAUTH_TOKEN_SECRET,
     WRITE_APP_KEY,
     WRITE_APP_SECRET,
     WRITE_OAUTH_TOKEN,
     WRITE_OAUTH_TOKEN_SECRET,
 )
 from _logger import get_module_logger
+from metrics import InstrumentedApi
+from rate_limits import TwitterRateLimitException
+from state_store import STATE_STORE
 from wrapped_tweet import Tweet
-from util import add_line_to_file
 
 
 LOGGER = get_module_logger(__name__)
-
-tweet_scanner_api = Api(
-    consumer_key=READ_APP_KEY,
-    consumer_secret=READ_APP_SECRET,
-    access_token_key=READ_OAUTH_TOKEN,
-    access_token_secret=READ_OAUTH_TOKEN_SECRET,
-    sleep_on_rate_limit=True,
-)
-
-tweeter_api = Api(
+# Maximum number of ids the statuses/lookup endpoint accepts per call
+STATUS_LOOKUP_BATCH_SIZE = 100
+# Maximum number of screen names the users/lookup endpoint accepts per call
+USER_LOOKUP_BATCH_SIZE = 100
+USER_TIMELINE_ENDPOINT = "/statuses/user_timeline"
+STATUS_LOOKUP_ENDPOINT = "/statuses/lookup"
+STATUS_SHOW_ENDPOINT = "/statuses/show"
+USER_LOOKUP_ENDPOINT = "/users/lookup"
+
+tweeter_api = InstrumentedApi(
+    client_name="write",
     consumer_key=WRITE_APP_KEY,
     consumer_secret=WRITE_APP_SECRET,
     access_token_key=WRITE_OAUTH_TOKEN,
     access_token_secret=WRITE_OAUTH_TOKEN_SECRET,
-    sleep_on_rate_limit=True,
+    **API_URLS,
 )
 
 
-class TwitterRateLimitException(TwitterError):
-    pass
-
-
 def add_screenshot_to_tweet(tweet: Tweet, screen_shot_file_path: str):
     """Add the path of the screenshot to the tweet instance"""
     LOGGER.debug(f"Adding {screen_shot_file_path} to the tweet instance {tweet.id_str}")
     tweet.screen_capture_file_path_quoted_tweet = screen_shot_file_path
-
-
-def check_for_last_status_id(file_name: str) -> int:
-    """Look for user file and get last status id checked"""
-    try:
-        with open(file_name, "r") as f:
-            lines = f.readlines()
-            latest_status_ids: List = list(
-                filter(None, map(lambda line: line.strip("\n"), lines))
-            )
-            latest_status_id = (
-                int(latest_status_ids[-1]) if len(latest_status_ids) > 0 else None
-            )
-            LOGGER.debug(f"Last status id checked {latest_status_id}")
-            return latest_status_id
-    except FileNotFoundError:
-        LOGGER.info(f"No status id file has been created {file_name}")
+    STATE_STORE.add_capture(
+        status_id=tweet.id,
+        quoted_tweet_id=tweet.quoted_tweet_id,
+        file_path=screen_shot_file_path,
+    )
 
 
 def get_status(api_user, status_id: Union[int, str]) -> Status:
@@ -76,19 +73,47 @@ def get_status(api_user, status_id: Union[int, str]) -> Status:
     return response
 
 
-@retry(exceptions=TwitterRateLimitException, tries=4, delay=2)
 def get_recent_tweets_for_user(
-    twitter_user: str, since_id: int = None, count: int = 10
-) -> List[Status]:
-    """Using Twitter API get recent tweets using user screen name"""
+    twitter_user: str,
+    since_id: int = None,
+    count: int = 10,
+    max_id: int = None,
+    raise_errors: bool = False,
+) -> List[Union[Status, Tweet]]:
+    """Using Twitter API get recent tweets using user screen name
+
+    Only tweets newer than since_id, and not newer than max_id, are returned.
+
+    With FAST_DECODE the tweets are Tweet records instead of Statuses.
+
+    Raises:
+        TwitterRateLimitException: the user_timeline budget of every read
+            credential is used up
+        TwitterError: with raise_errors, the timeline could not be read
+            (otherwise the error is logged and None returned)
+    """
     try:
         LOGGER.debug(f"Getting last {count} tweets for user: {twitter_user}")
-        response = tweet_scanner_api.GetUserTimeline(
-            screen_name=twitter_user, since_id=since_id, count=count
-        )
+        with READ_API_POOL.api(endpoint=USER_TIMELINE_ENDPOINT) as api:
+            if FAST_DECODE:
+                response = api.GetUserTimelineTweets(
+                    screen_name=twitter_user,
+                    since_id=since_id,
+                    max_id=max_id,
+                    count=count,
+                )
+            else:
+                response = api.GetUserTimeline(
+                    screen_name=twitter_user,
+                    since_id=since_id,
+                    max_id=max_id,
+                    count=count,
+                )
         return response
+    except TwitterRateLimitException:
+        raise
     except TwitterError as errors:
-        if type(errors) == list:
+        if isinstance(errors.message, list):
             for error in errors.message:
                 error_code = error.get("code")
                 if error_code == 88:
@@ -96,10 +121,10 @@ def get_recent_tweets_for_user(
                         f"'Rate limit exceeded': "
                         f"unable to retrieve recent tweets for {twitter_user}. {error}"
                     )
-                    sleep_time = 120
-                    LOGGER.error(f"Sleeping for {sleep_time} seconds")
-                    sleep(sleep_time)
-                    raise TwitterRateLimitException
+                    raise TwitterRateLimitException(
+                        str(error),
+                        reset_at=READ_API_POOL.available_at(USER_TIMELINE_ENDPOINT),
+                    )
                 elif error_code == 136:
                     LOGGER.error(
                         f"You have been blocked from viewing "
@@ -120,42 +145,252 @@ def get_recent_tweets_for_user(
                 f"Something happened, unable to retrieve recent "
                 f"tweets for {twitter_user}. {errors}"
             )
+        if raise_errors:
+            raise
 
 
-def find_quoted_tweets(user: str) -> List[Tweet]:
-    """Get list of tweets that were quoted by users from given list
+def lookup_users(screen_names: List[str]) -> Dict[str, Optional[Dict]]:
+    """Get users from the api, USER_LOOKUP_BATCH_SIZE screen names per call
 
-    For each user in list of users get user's recent tweets that
-    were quoting other tweets. Exclude tweet ids that have already
-    been replied to from a previous run.
+    Returns:
+        The users/lookup json of each user by lower case screen name, None
+        for a user that is suspended, deactivated or does not exist. Users
+        are missing if the lookup call failed or the users/lookup budget is
+        used up.
+    """
+    users = {}
+    for offset in range(0, len(screen_names), USER_LOOKUP_BATCH_SIZE):
+        batch_of_screen_names = screen_names[offset : offset + USER_LOOKUP_BATCH_SIZE]
+        LOGGER.info(
+            f"api_user.UsersLookup(screen_name=[{len(batch_of_screen_names)} users])"
+        )
+        try:
+            with READ_API_POOL.api(endpoint=USER_LOOKUP_ENDPOINT) as api:
+                response = api.UsersLookup(
+                    screen_name=batch_of_screen_names, return_json=True
+                )
+        except TwitterRateLimitException as error:
+            LOGGER.error(
+                f"Unable to look up {len(screen_names) - offset} users. {error}"
+            )
+            break
+        except TwitterError as error:
+            if not (
+                isinstance(error.message, list)
+                and any(message.get("code") == 17 for message in error.message)
+            ):
+                LOGGER.error(
+                    f"Unable to look up users {batch_of_screen_names}. {error}"
+                )
+                continue
+            # 'No user matches for specified terms'
+            response = []
+        users.update(
+            {screen_name.lower(): None for screen_name in batch_of_screen_names}
+        )
+        users.update({user["screen_name"].lower(): user for user in response})
+    return users
 
-    Args:
-        user: twitter handle w/out @ symbol
 
-    Returns:
-        A list of Tweet objects
+def get_active_users(users: List[str]) -> List[str]:
+    """Return the users that may have tweets that have not been checked
+
+    The latest status of each user, as returned by users/lookup, is
+    compared with the last status id checked of the user. A user is also
+    active when it has never been checked, has backfill gaps left, or when
+    its latest status is unknown (a protected account, or the lookup
+    failed). Users that are suspended, deactivated or do not exist are not.
     """
-    user_status_file_path = str(CHECKED_STATUSES_DIR_PATH.joinpath(f"{user}.txt"))
-    last_status_id = check_for_last_status_id(file_name=user_status_file_path)
-    user_tweets: List[Status] = get_recent_tweets_for_user(
-        twitter_user=user, since_id=last_status_id
+    looked_up_users = lookup_users(screen_names=users)
+    active_users = []
+    for user in users:
+        if user.lower() in looked_up_users and not looked_up_users[user.lower()]:
+            LOGGER.info(f"Skipping @{user}, the account is suspended or deactivated")
+            continue
+        latest_status = (looked_up_users.get(user.lower()) or {}).get("status")
+        last_status_id = STATE_STORE.get_last_status_id(user=user)
+        if (
+            not latest_status
+            or not last_status_id
+            or latest_status["id"] > last_status_id
+            or STATE_STORE.get_backfill_gaps(user=user)
+        ):
+            active_users.append(user)
+    LOGGER.info(f"{len(active_users)} of {len(users)} users may have new tweets")
+    return active_users
+
+
+def get_new_tweets_for_user(user: str) -> List[Union[Status, Tweet]]:
+    """Get the newest TIMELINE_PAGE_SIZE tweets of user since the last status checked
+
+    When the page is full there may be more new tweets than fit in it, the
+    rest is recorded as a backfill gap of the user (see iter_timeline_pages).
+    """
+    last_status_id = STATE_STORE.get_last_status_id(user=user)
+    user_tweets: List[Union[Status, Tweet]] = get_recent_tweets_for_user(
+        twitter_user=user, since_id=last_status_id, count=TIMELINE_PAGE_SIZE
     )
-    if user_tweets:
-        LOGGER.debug(
-            f"Found {len(user_tweets)} "
-            f"{'tweets' if len(user_tweets) > 1 else 'tweet'} for {user}"
-        )
-        add_line_to_file(line=user_tweets[0].id_str, file_path=user_status_file_path)
-    else:
+    if not user_tweets:
         LOGGER.debug(f"No new tweets from {user} since {last_status_id}")
         return []
 
+    if last_status_id and len(user_tweets) >= TIMELINE_PAGE_SIZE:
+        LOGGER.info(
+            f"More than {len(user_tweets)} new tweets from {user} since "
+            f"{last_status_id}, backfilling from {user_tweets[-1].id}"
+        )
+        STATE_STORE.set_backfill_gap(
+            user=user,
+            since_id=last_status_id,
+            max_id=user_tweets[-1].id - 1,
+            fetched=len(user_tweets),
+        )
+
+    LOGGER.debug(
+        f"Found {len(user_tweets)} "
+        f"{'tweets' if len(user_tweets) > 1 else 'tweet'} for {user}"
+    )
+    return user_tweets
+
+
+def iter_pages(
+    get_page: Callable[..., List[Union[Status, Tweet]]],
+    since_id: Optional[int],
+    max_id: Optional[int],
+    count: int,
+    limit: int,
+) -> Iterator[List[Union[Status, Tweet]]]:
+    """Yield the pages get_page returns from max_id down to since_id
+
+    get_page is called with since_id, max_id and count. Each page asks for
+    the tweets older than the last tweet of the page before, until a page
+    comes back short (the gap is closed) or limit tweets have been
+    yielded. The next page is only fetched once the caller is done with
+    the current one.
+    """
+    while limit > 0:
+        page_size = min(count, limit)
+        page = get_page(since_id=since_id, max_id=max_id, count=page_size)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        limit -= len(page)
+        max_id = page[-1].id - 1
+
+
+def iter_timeline_pages(
+    twitter_user: str,
+    since_id: int,
+    max_id: int,
+    count: int = BACKFILL_PAGE_SIZE,
+    limit: int = MAX_BACKFILL,
+) -> Iterator[List[Union[Status, Tweet]]]:
+    """Yield the tweets of twitter_user from max_id down to since_id, a page at a time
+
+    See iter_pages.
+
+    Raises:
+        TwitterRateLimitException: the user_timeline budget of every read
+            credential is used up
+        TwitterError: a page could not be read, the gap is not closed
+    """
+    for page in iter_pages(
+        get_page=partial(
+            get_recent_tweets_for_user, twitter_user=twitter_user, raise_errors=True
+        ),
+        since_id=since_id,
+        max_id=max_id,
+        count=count,
+        limit=limit,
+    ):
+        LOGGER.debug(f"Backfilling {len(page)} tweets of {twitter_user}")
+        yield page
+
+
+def get_screen_name(status: Union[Status, Tweet]) -> str:
+    """Return the screen name of the author of a Status or Tweet"""
+    return status.user if isinstance(status, Tweet) else status.user.screen_name
+
+
+def get_replied_to_status_ids_to_check(
+    statuses: Iterable[Union[Status, Tweet]], excluded_ids: Container[str]
+) -> Set[int]:
+    """Return the ids of the replied to statuses process_tweet will need
+
+    A tweet that quotes a tweet and replies to a status that has already
+    been processed is compared with the status it replies to, unless the
+    thread index already knows what that status quoted.
+    """
+    replied_to_status_ids = set()
+    for status in statuses:
+        if isinstance(status, Tweet):
+            quotes = status.quoted_to_status_bool
+            replied_to_status_id = status.replied_to_status_id
+        else:
+            quotes = status.quoted_status
+            replied_to_status_id = status.in_reply_to_status_id
+        if (
+            quotes
+            and replied_to_status_id
+            and str(replied_to_status_id) in excluded_ids
+            and not STATE_STORE.get_reply_thread(status_id=replied_to_status_id)
+        ):
+            replied_to_status_ids.add(replied_to_status_id)
+    return replied_to_status_ids
+
+
+def lookup_statuses(status_ids: Iterable[int]) -> Dict[int, Optional[Status]]:
+    """Get statuses from the api, STATUS_LOOKUP_BATCH_SIZE ids per call
+
+    Returns:
+        Status by status id, None for a status that is deleted or not
+        visible. Ids are missing if the lookup call failed or the
+        statuses/lookup budget is used up.
+    """
+    status_ids = sorted(status_ids)
+    statuses = {}
+    for offset in range(0, len(status_ids), STATUS_LOOKUP_BATCH_SIZE):
+        batch_of_status_ids = status_ids[offset : offset + STATUS_LOOKUP_BATCH_SIZE]
+        LOGGER.info(
+            f"api_user.GetStatuses(status_ids=[{len(batch_of_status_ids)} ids])"
+        )
+        try:
+            with READ_API_POOL.api(endpoint=STATUS_LOOKUP_ENDPOINT) as api:
+                statuses.update(
+                    api.GetStatuses(status_ids=batch_of_status_ids, map=True)
+                )
+        except TwitterRateLimitException as error:
+            LOGGER.error(
+                f"Unable to look up {len(status_ids) - offset} statuses. {error}"
+            )
+            break
+        except TwitterError as error:
+            LOGGER.error(f"Unable to look up statuses {batch_of_status_ids}. {error}")
+    return statuses
+
+
+def filter_quoted_tweets(
+    user: str,
+    user_tweets: List[Union[Status, Tweet]],
+    replied_to_statuses: Dict[int, Optional[Status]] = None,
+) -> List[Tweet]:
+    """Return the tweets of user that should be collected
+
+    Args:
+        user: twitter handle w/out @ symbol
+        user_tweets: new tweets of the user
+        replied_to_statuses: statuses already looked up for process_tweet
+    """
     user_tweets_quoting_tweets = list(
         filter(
             None,
             map(
                 lambda tweet: process_tweet(
-                    status=tweet, excluded_ids=LIST_OF_STATUS_IDS_REPLIED_TO
+                    status=tweet,
+                    excluded_ids=STATE_STORE,
+                    replied_to_statuses=replied_to_statuses,
                 ),
                 user_tweets,
             ),
@@ -174,18 +409,50 @@ def find_quoted_tweets(user: str) -> List[Tweet]:
     return user_tweets_quoting_tweets
 
 
+def find_quoted_tweets(user: str) -> List[Tweet]:
+    """Get list of tweets that were quoted by users from given list
+
+    For each user in list of users get user's recent tweets that
+    were quoting other tweets. Exclude tweet ids that have already
+    been replied to from a previous run.
+
+    Args:
+        user: twitter handle w/out @ symbol
+
+    Returns:
+        A list of Tweet objects
+    """
+    user_tweets = get_new_tweets_for_user(user=user)
+    if not user_tweets:
+        return []
+
+    STATE_STORE.set_last_status_id(user=user, status_id=user_tweets[0].id_str)
+    replied_to_statuses = lookup_statuses(
+        status_ids=get_replied_to_status_ids_to_check(
+            statuses=user_tweets, excluded_ids=STATE_STORE
+        )
+    )
+    return filter_quoted_tweets(
+        user=user, user_tweets=user_tweets, replied_to_statuses=replied_to_statuses
+    )
+
+
 def post_collected_tweets(quoted_tweets: List[Tweet]) -> bool:
     """For each quoted tweet post for the record and for the blocked"""
     for user_tweet in quoted_tweets:
         response = post_reply_to_user_tweet(tweet=user_tweet)
+        STATE_STORE.set_tweet_posted_at(status_id=user_tweet.id, posted_at=time.time())
         tweet_reply_id = response.in_reply_to_status_id
         if not tweet_reply_id:
             LOGGER.info(f"The tweet_reply_id was None.")
         else:
-            add_line_to_file(
-                line=str(tweet_reply_id),
-                file_path=str(LIST_OF_STATUS_IDS_REPLIED_TO_FILE),
-            )
+            STATE_STORE.add_replied_to(status_id=tweet_reply_id)
+            if user_tweet.quoted_tweet_id:
+                STATE_STORE.add_reply_thread(
+                    status_id=tweet_reply_id,
+                    quoted_tweet_id=user_tweet.quoted_tweet_id,
+                    conversation_root_id=get_conversation_root_id(tweet=user_tweet),
+                )
     return True
 
 
@@ -206,9 +473,66 @@ def post_reply_to_user_tweet(tweet: Tweet) -> Status:
     return response
 
 
-def process_tweet(status: Status, excluded_ids: List[str] = None) -> Optional[Tweet]:
+def get_conversation_root_id(tweet: Tweet) -> int:
+    """Return the id of the first known status of the tweet's thread
+
+    The root is inherited from the replied to status when the bot has
+    replied to it, otherwise the replied to status is taken as the root.
+    """
+    if not tweet.replied_to_status_bool:
+        return tweet.id
+    reply_thread = STATE_STORE.get_reply_thread(status_id=tweet.replied_to_status_id)
+    return reply_thread[1] if reply_thread else tweet.replied_to_status_id
+
+
+def is_quoted_in_same_thread(
+    tweet: Tweet, replied_to_statuses: Dict[int, Optional[Status]] = None
+) -> bool:
+    """Return True if tweet quotes a tweet already quoted in its thread
+
+    When the bot replied to the status that tweet replies to, the thread
+    index of the state store answers without calling the api. Otherwise
+    the replied to status is taken from replied_to_statuses when it has
+    been looked up already, or fetched from the api.
+    """
+    reply_thread = STATE_STORE.get_reply_thread(status_id=tweet.replied_to_status_id)
+    if reply_thread:
+        _, conversation_root_id = reply_thread
+        return STATE_STORE.is_quoted_in_thread(
+            conversation_root_id=conversation_root_id,
+            quoted_tweet_id=tweet.quoted_tweet_id,
+        )
+
+    LOGGER.info(
+        f"@{tweet.user}'s Tweet({tweet.id}) quotes "
+        f"Tweet({tweet.quoted_tweet_id}) but replied to a "
+        f"Tweet({tweet.replied_to_status_id}) that has already "
+        f"been processed. Get response for the replied_to_status "
+        f"to verify if the two tweets are quoting same tweet."
+    )
+    if replied_to_statuses and tweet.replied_to_status_id in replied_to_statuses:
+        replied_to_status = replied_to_statuses[tweet.replied_to_status_id]
+    else:
+        with READ_API_POOL.api(endpoint=STATUS_SHOW_ENDPOINT) as api:
+            replied_to_status = get_status(api, tweet.replied_to_status_id)
+    if not replied_to_status:
+        LOGGER.info(
+            f"The Tweet({tweet.replied_to_status_id}) that was replied to "
+            f"is no longer available."
+        )
+        return False
+    return Tweet(replied_to_status).quoted_tweet_id == tweet.quoted_tweet_id
+
+
+def process_tweet(
+    status: Union[Status, Tweet],
+    excluded_ids: Container[str] = None,
+    replied_to_statuses: Dict[int, Optional[Status]] = None,
+) -> Optional[Tweet]:
     """Determine if the Status should be documented
 
+    See is_quoted_in_same_thread for how the same thread check is answered.
+
     Notes:
         * Skip if tweet does not quote tweet
         * Skip if the quoted_tweet_user is the twitter api account
@@ -217,7 +541,11 @@ def process_tweet(status: Status, excluded_ids: List[str] = None) -> Optional[Tw
         * Skip if the tweet has already been quoted in same thread
     """
     excluded_ids = excluded_ids if excluded_ids else []
-    tweet = Tweet(status)
+    tweet = (
+        status
+        if isinstance(status, Tweet)
+        else Tweet(status, keep_raw_tweet=KEEP_RAW_TWEETS)
+    )
     if tweet.quoted_to_status_bool:
         quoted_tweet_user = tweet.quoted_tweet_user
         if quoted_tweet_user == TWITTER_API_USER.get("screen_name"):
@@ -237,17 +565,9 @@ def process_tweet(status: Status, excluded_ids: List[str] = None) -> Optional[Tw
             tweet.replied_to_status_bool
             and str(tweet.replied_to_status_id) in excluded_ids
         ):
-            LOGGER.info(
-                f"@{tweet.user}'s Tweet({tweet.id}) quotes "
-                f"Tweet({tweet.quoted_tweet_id}) but replied to a "
-                f"Tweet({tweet.replied_to_status_id}) that has already "
-                f"been processed. Get response for the replied_to_status "
-                f"to verify if the two tweets are quoting same tweet."
-            )
-            replied_to_tweet = Tweet(
-                get_status(tweet_scanner_api, tweet.replied_to_status_id)
-            )
-            if replied_to_tweet.quoted_tweet_id == tweet.quoted_tweet_id:
+            if is_quoted_in_same_thread(
+                tweet=tweet, replied_to_statuses=replied_to_statuses
+            ):
                 LOGGER.info(
                     f"Skipping: Tweet({tweet.id}) from @{tweet.user} quoted "
                     f"Tweet({tweet.quoted_tweet_id}) was already quoted by "
@@ -268,9 +588,7 @@ def process_tweet(status: Status, excluded_ids: List[str] = None) -> Optional[Tw
             )
             return tweet
     else:
-        LOGGER.debug(
-            f"Skipping: Tweet({status.id}) from @{status.user.screen_name} non-retweet"
-        )
+        LOGGER.debug(f"Skipping: Tweet({tweet.id}) from @{tweet.user} non-retweet")
 
 
 if __name__ == "__main__":
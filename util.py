@@ -1,6 +1,7 @@
 import json
+import os
 from pathlib import Path, PosixPath
-from typing import Iterator
+from typing import Iterator, Optional
 
 from _logger import get_module_logger
 
@@ -20,8 +21,22 @@ def file_reader(file: PosixPath) -> Iterator[str]:
         yield clean_row
 
 
-def add_line_to_file(line: str, file_path: str):
-    """Append line to file and add new line"""
-    LOGGER.debug(msg=f"Adding {line} to {file_path}")
-    with Path(file_path).open(mode="a+") as f:
-        f.write(line + "\n")
+def read_last_line(file_path: str, block_size: int = 1024) -> Optional[str]:
+    """Return the last non empty line of a file
+
+    The file is read backwards from its end one block at a time, so the
+    cost does not depend on the size of the file.
+    """
+    with Path(file_path).open(mode="rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        data = b""
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+            stripped_data = data.rstrip(b"\r\n")
+            newline_index = stripped_data.rfind(b"\n")
+            if newline_index != -1:
+                return stripped_data[newline_index + 1 :].decode().rstrip("\r")
+        return data.rstrip(b"\r\n").decode() or None
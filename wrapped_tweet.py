@@ -1,4 +1,6 @@
-from typing import List, Optional
+from calendar import timegm
+from email.utils import parsedate
+from typing import Dict, Optional, Tuple
 
 from twitter import Status
 
@@ -8,68 +10,197 @@ LOGGER = get_module_logger(__name__)
 TWITTER_URL = "https://twitter.com"
 
 
-class Tweet:
-    """Wrapper class representing a Status (tweet)"""
+def get_status_url(screen_name: str, status_id: int) -> str:
+    return f"{TWITTER_URL}/{screen_name}/status/{status_id}"
+
+
+def clean_quoted_tweet_text(text: str, in_reply_to_screen_name: Optional[str]) -> str:
+    """Return text without its html escaping and leading reply mention"""
+    return text.replace("&amp;", "&").replace(f"@{in_reply_to_screen_name} ", "")
 
-    def __init__(self, tweet: Status):
-        self.raw_tweet: Status = tweet
-        self.id: int = self.raw_tweet.id
-        self.id_str: str = self.raw_tweet.id_str
-        self.text: str = self.raw_tweet.text
-        self.user: str = self.raw_tweet.user.screen_name
-        self._screen_capture_file_path_quoted_tweet = None
+
+class Tweet:
+    """Wrapper class representing a Status (tweet)
+
+    The fields every tweet is filtered on are extracted from the Status when
+    the Tweet is created, the derived fields (quoted tweet text and url,
+    hash tags and urls) the first time they are read. With
+    keep_raw_tweet=False, or after drop_raw_tweet, every field is extracted
+    and the Status is let go of.
+    """
+
+    __slots__ = (
+        "raw_tweet",
+        "id",
+        "id_str",
+        "text",
+        "user",
+        "created_at",
+        "quoted_tweet_id",
+        "quoted_tweet_user",
+        "replied_to_status_id",
+        "replied_to_user_name",
+        "screen_capture_file_path_quoted_tweet",
+        "_hash_tags",
+        "_urls",
+        "_quoted_tweet_text",
+        "_quoted_tweet_url",
+    )
+    # fields derived from raw_tweet the first time they are read
+    DERIVED_FIELDS = ("hash_tags", "urls", "quoted_tweet_text", "quoted_tweet_url")
+
+    def __init__(self, tweet: Status, keep_raw_tweet: bool = True):
+        self.raw_tweet: Optional[Status] = tweet
+        self.id: int = tweet.id
+        self.id_str: str = tweet.id_str
+        self.text: str = tweet.text
+        self.user: str = tweet.user.screen_name
+        self.created_at: Optional[str] = tweet.created_at
+        quoted_status = tweet.quoted_status
+        self.quoted_tweet_id: Optional[int] = (
+            tweet.quoted_status_id if quoted_status else None
+        )
+        self.quoted_tweet_user: Optional[str] = (
+            quoted_status.user.screen_name if quoted_status else None
+        )
+        self.replied_to_status_id: Optional[int] = tweet.in_reply_to_status_id
+        self.replied_to_user_name: Optional[str] = tweet.in_reply_to_screen_name
+        self.screen_capture_file_path_quoted_tweet: Optional[str] = None
+        if not keep_raw_tweet:
+            self.drop_raw_tweet()
 
     def __repr__(self) -> str:
         return self.tweet_str
 
-    @property
-    def hash_tags(self) -> List[str]:
-        return (
-            [ht.get("text") for ht in self.raw_tweet.hashtags]
-            if self.raw_tweet.hashtags
-            else []
+    def drop_raw_tweet(self):
+        """Extract the derived fields and let go of the Status"""
+        for name in self.DERIVED_FIELDS:
+            getattr(self, name)
+        self.raw_tweet = None
+
+    def as_dict(self) -> Dict:
+        """Return the fields of the tweet, see from_dict"""
+        fields = {
+            name: getattr(self, name)
+            for name in self.__slots__
+            if not name.startswith("_")
+            and name not in ("raw_tweet", "screen_capture_file_path_quoted_tweet")
+        }
+        fields.update({name: getattr(self, name) for name in self.DERIVED_FIELDS})
+        return fields
+
+    @classmethod
+    def from_dict(cls, fields: Dict) -> "Tweet":
+        """Return the Tweet of the fields returned by as_dict, without a Status"""
+        tweet = cls.__new__(cls)
+        tweet.raw_tweet = None
+        tweet.screen_capture_file_path_quoted_tweet = None
+        for name, value in fields.items():
+            if name in cls.DERIVED_FIELDS:
+                name = f"_{name}"
+                value = tuple(value) if isinstance(value, list) else value
+            setattr(tweet, name, value)
+        return tweet
+
+    @classmethod
+    def from_json(cls, data: Dict) -> "Tweet":
+        """Return the Tweet of a status of an api response, without a Status
+
+        Only the fields of the Tweet are read, none of the objects a Status
+        is made of are built.
+        """
+        tweet = cls.__new__(cls)
+        tweet.raw_tweet = None
+        tweet.id = data["id"]
+        tweet.id_str = data["id_str"]
+        tweet.text = data.get("text")
+        tweet.user = data["user"]["screen_name"]
+        tweet.created_at = data.get("created_at")
+        tweet.replied_to_status_id = data.get("in_reply_to_status_id")
+        tweet.replied_to_user_name = data.get("in_reply_to_screen_name")
+        tweet.screen_capture_file_path_quoted_tweet = None
+        entities = data.get("entities") or {}
+        tweet._hash_tags = tuple(
+            hash_tag["text"] for hash_tag in entities.get("hashtags") or ()
         )
+        tweet._urls = tuple(url["url"] for url in entities.get("urls") or ())
+        quoted_status = data.get("quoted_status")
+        if quoted_status:
+            tweet.quoted_tweet_id = data.get("quoted_status_id")
+            tweet.quoted_tweet_user = quoted_status["user"]["screen_name"]
+            tweet._quoted_tweet_text = clean_quoted_tweet_text(
+                quoted_status["text"], quoted_status.get("in_reply_to_screen_name")
+            )
+            tweet._quoted_tweet_url = get_status_url(
+                tweet.quoted_tweet_user, tweet.quoted_tweet_id
+            )
+        else:
+            tweet.quoted_tweet_id = None
+            tweet.quoted_tweet_user = None
+            tweet._quoted_tweet_text = None
+            tweet._quoted_tweet_url = None
+        return tweet
+
+    @property
+    def created_at_in_seconds(self) -> Optional[int]:
+        return timegm(parsedate(self.created_at)) if self.created_at else None
+
+    @property
+    def hash_tags(self) -> Tuple[str, ...]:
+        try:
+            return self._hash_tags
+        except AttributeError:
+            self._hash_tags = tuple(
+                hash_tag.get("text") if isinstance(hash_tag, dict) else hash_tag.text
+                for hash_tag in self.raw_tweet.hashtags or ()
+            )
+            return self._hash_tags
+
+    @property
+    def urls(self) -> Tuple[str, ...]:
+        try:
+            return self._urls
+        except AttributeError:
+            self._urls = tuple(url_obj.url for url_obj in self.raw_tweet.urls or ())
+            return self._urls
 
     @property
     def quoted_to_status_bool(self) -> bool:
         """Return True if tweet quotes another"""
-        return False if not self.raw_tweet.quoted_status else True
+        return self.quoted_tweet_user is not None
 
     @property
     def quoted_status(self) -> Optional[Status]:
-        """Return Quoted Status"""
-        return self.raw_tweet.quoted_status
-
-    @property
-    def quoted_tweet_id(self) -> Optional[str]:
-        """Return id of the quoted tweet"""
-        return self.raw_tweet.quoted_status_id
+        """Return Quoted Status (None once the Status has been dropped)"""
+        return self.raw_tweet.quoted_status if self.raw_tweet else None
 
     @property
     def quoted_tweet_text(self) -> Optional[str]:
         """Return text of the quoted tweet"""
-        if self.quoted_to_status_bool:
-            raw_text = self.quoted_status.text
-            clean_text = raw_text.replace("&amp;", "&")
-            return clean_text.replace(
-                f"@{self.quoted_status.in_reply_to_screen_name} ", ""
+        try:
+            return self._quoted_tweet_text
+        except AttributeError:
+            quoted_status = self.raw_tweet.quoted_status
+            self._quoted_tweet_text = (
+                clean_quoted_tweet_text(
+                    quoted_status.text, quoted_status.in_reply_to_screen_name
+                )
+                if quoted_status
+                else None
             )
-        return None
+            return self._quoted_tweet_text
 
     @property
     def quoted_tweet_url(self) -> Optional[str]:
-        if self.quoted_status:
-            tweet_url = (
-                f"{TWITTER_URL}/{self.quoted_tweet_user}/status/{self.quoted_tweet_id}"
+        try:
+            return self._quoted_tweet_url
+        except AttributeError:
+            self._quoted_tweet_url = (
+                get_status_url(self.quoted_tweet_user, self.quoted_tweet_id)
+                if self.quoted_to_status_bool
+                else None
             )
-            LOGGER.debug(msg=f"Quoted Tweet URL: {tweet_url}")
-            return tweet_url
-        return None
-
-    @property
-    def quoted_tweet_user(self) -> Optional[str]:
-        """Returns the user name of the quoted tweet"""
-        return self.quoted_status.user.screen_name if self.quoted_status else None
+            return self._quoted_tweet_url
 
     @property
     def for_the_record_message(self) -> Optional[str]:
@@ -85,48 +216,19 @@ class Tweet:
     @property
     def replied_to_status_bool(self) -> bool:
         """Return True if tweet replies to another"""
-        return False if not self.raw_tweet.in_reply_to_status_id else True
-
-    @property
-    def replied_to_status_id(self) -> int:
-        """Return True if tweet quotes another"""
-        return self.raw_tweet.in_reply_to_status_id
+        return False if not self.replied_to_status_id else True
 
     @property
     def replied_to_tweet_url(self) -> Optional[str]:
-        """Return True if tweet quotes another"""
+        """Return the url of the tweet replied to"""
         if self.replied_to_status_bool:
-            tweet_url = (
-                f"{TWITTER_URL}/{self.replied_to_user_name}/"
-                f"status/{self.replied_to_status_id}"
-            )
-            LOGGER.debug(msg=f"Replied to Tweet URL: {tweet_url}")
-            return tweet_url
+            return get_status_url(self.replied_to_user_name, self.replied_to_status_id)
         return None
 
-    @property
-    def replied_to_user_name(self) -> str:
-        """Returns screen name of the user that is being replied to"""
-        return self.raw_tweet.in_reply_to_screen_name
-
-    @property
-    def screen_capture_file_path_quoted_tweet(self) -> Optional[str]:
-        return self._screen_capture_file_path_quoted_tweet
-
-    @screen_capture_file_path_quoted_tweet.setter
-    def screen_capture_file_path_quoted_tweet(self, value):
-        self._screen_capture_file_path_quoted_tweet = value
-
     @property
     def tweet_str(self) -> str:
         return f"@{self.user}: {self.text}"
 
     @property
     def tweet_url(self) -> str:
-        tweet_url = f"{TWITTER_URL}/{self.user}/status/{self.id}"
-        LOGGER.debug(msg=f"Tweet URL: {tweet_url}")
-        return tweet_url
-
-    @property
-    def urls(self) -> Optional[List[str]]:
-        return [url_obj.url for url_obj in self.raw_tweet.urls]
+        return get_status_url(self.user, self.id)